@@ -1,39 +1,25 @@
 import os
 import re
 import sys
+import logging
 from pathlib import Path
 from collections import defaultdict, Counter
-from shmooapp.analysis.common_utils import VDD_PATTERNS,generate_aggfile_name
+from shmooapp.analysis.common_utils import VDD_PATTERNS,generate_aggfile_name,extract_x_axis_info,vdd_to_mv,format_mv
+from shmooapp.analysis.update_shmoo_range import calculate_ns_ranges, format_ns_range
+from shmooapp.analysis.shmoo_header import load_test_header
+from shmooapp.analysis.row_table import shared_row_table
+from shmooapp.analysis.plot_reader import note_plot_write
+from shmooapp.analysis import metrics
 
-def _extract_y_axis_info(lines):
-    """
-    Extracts Max VDD, Min VDD, and Step from the Y-Axis meta information.
-
-    Args:
-        lines (list): List of lines from the log file.
+logger = logging.getLogger(__name__)
 
-    Returns:
-        tuple: (max_vdd, min_vdd, step)
-    """
-    y_axis_pattern = re.compile(
-        r"Y-Axis\s*:\s*VDD\s*\[\s*([\d.]+)\s*\.\.\s*([\d.]+)\s*V\s*\]\s*step\s*([-+]?\d*\.\d+|\d+)\s*V",
-        re.IGNORECASE
-    )
-    for line in lines:
-        match = y_axis_pattern.search(line)
-        if match:
-            max_vdd = float(match.group(1))
-            min_vdd = float(match.group(2))
-            step = float(match.group(3))
-            return max_vdd, min_vdd, step
-    raise ValueError("Y-Axis information not found or malformed.")
-
-def extract_data_block(lines):
+def extract_data_block(lines, data_start=None):
     """
     Extracts the data block from the log file.
 
     Args:
         lines (list): List of lines from the log file.
+        data_start (int): First data row if known from the ShmooHeader; searched if None.
 
     Returns:
         tuple: (header_lines, data_block, footer_lines)
@@ -41,15 +27,18 @@ def extract_data_block(lines):
     header_lines = []
     footer_lines = []
     data_block = []
-    data_start = None
     data_end = None
 
-    for i, line in enumerate(lines):
-        #if line.strip() == "VDD":
-        if line.strip() in VDD_PATTERNS:
-            data_start = i + 2  # Two lines below "VDD" line
-            header_lines = lines[:i+2]
-            break
+    if data_start is not None and data_start - 2 < len(lines) and lines[data_start - 2].strip() in VDD_PATTERNS:
+        header_lines = lines[:data_start]
+    else:
+        data_start = None
+        for i, line in enumerate(lines):
+            #if line.strip() == "VDD":
+            if line.strip() in VDD_PATTERNS:
+                data_start = i + 2  # Two lines below "VDD" line
+                header_lines = lines[:i+2]
+                break
 
     if data_start is None:
         raise ValueError("VDD line not found.")
@@ -83,8 +72,8 @@ def parse_data_block(data_block):
 
     Returns:
         tuple: (vdd_data, vdd_has_star)
-            - vdd_data: dict mapping VDD to data string without '*'
-            - vdd_has_star: dict mapping VDD to boolean indicating presence of '*' before data
+            - vdd_data: dict mapping VDD (integer mV) to data string without '*'
+            - vdd_has_star: dict mapping VDD (integer mV) to boolean indicating presence of '*' before data
     """
     vdd_data = {}
     vdd_has_star = {}
@@ -95,7 +84,7 @@ def parse_data_block(data_block):
     for line in data_block:
         match = data_pattern.match(line)
         if match:
-            vdd = float(match.group(1))
+            vdd = vdd_to_mv(match.group(1))
             data_str = match.group(2)
             has_star = data_str.startswith('*')
             # Remove '*' from data_str if present
@@ -106,15 +95,17 @@ def parse_data_block(data_block):
         else:
             # Handle lines that do not match the pattern
             # You may choose to log or handle these lines differently
-            print(f"Warning: Could not parse line: {line.strip()}")
+            logger.debug("Could not parse line: %s", line.strip())
+            metrics.inc(metrics.ROWS_REJECTED, stage="aggregation")
     return vdd_data, vdd_has_star
 
-def read_log_file(file_path):
+def read_log_file(file_path, header=None):
     """
     Reads a single log file and extracts its components.
 
     Args:
         file_path (str): Path to the log file.
+        header (ShmooHeader): Header of the file from load_test_header, or None.
 
     Returns:
         tuple: (header_lines, data_block, footer_lines, vdd_data, vdd_has_star)
@@ -122,7 +113,7 @@ def read_log_file(file_path):
     with open(file_path, 'r') as file:
         lines = file.readlines()
 
-    header_lines, data_block, footer_lines = extract_data_block(lines)
+    header_lines, data_block, footer_lines = extract_data_block(lines, header.data_start if header else None)
     vdd_data, vdd_has_star = parse_data_block(data_block)
 
     return header_lines, data_block, footer_lines, vdd_data, vdd_has_star
@@ -247,7 +238,7 @@ def aggregate_and(vdd_data_list):
         data_length = len(data_strings[0])
         # Ensure all data strings have the same length
         if any(len(s) != data_length for s in data_strings):
-            print(f"Warning: Inconsistent data string lengths for VDD={vdd}. Skipping.")
+            logger.warning("Inconsistent data string lengths for VDD=%s. Skipping.", format_mv(vdd))
             continue
 
         aggregated_str = ''
@@ -285,6 +276,36 @@ def aggregate(vdd_data_list, mode='OR'):
     else:
         raise ValueError("Unsupported aggregation mode. Choose 'OR' or 'Majority'.")
 
+def aggregate_encoded(vdd_ids_list, mode, table):
+    """
+    Aggregates plots encoded as VDD to row id (see row_table). Each distinct combination
+    of site rows is aggregated once with the function of the mode and memoized, so rows
+    that repeat over VDD steps, tests or modes are not aggregated again.
+
+    Args:
+        vdd_ids_list (list): List of dictionaries mapping VDD to row ids of table.
+        mode (str): Aggregation mode ('OR', 'AND' or 'Majority').
+        table (RowTable): Table the row ids refer to.
+
+    Returns:
+        dict: Aggregated VDD to row id mapping.
+    """
+    aggregated = {}
+    if not vdd_ids_list:
+        return aggregated
+    for vdd in vdd_ids_list[0]:
+        # the modes do not depend on the order of the sites, only on how often a row occurs
+        row_ids = tuple(sorted(vdd_ids[vdd] for vdd_ids in vdd_ids_list if vdd in vdd_ids))
+        aggregated_id = table.memoize(('aggregate', mode, row_ids), lambda: _aggregate_rows(row_ids, mode, table))
+        if aggregated_id is not None:
+            aggregated[vdd] = aggregated_id
+    return aggregated
+
+def _aggregate_rows(row_ids, mode, table):
+    # one VDD step: the rows of all sites under a single key
+    result = aggregate([{0: table.rows[row_id]} for row_id in row_ids], mode=mode)
+    return table.intern(result[0]) if 0 in result else None
+
 def aggregate_star_presence(vdd_has_star_list):
     """
     Aggregates the presence of '*' for each VDD across all sites.
@@ -304,7 +325,7 @@ def aggregate_star_presence(vdd_has_star_list):
                 aggregated_star[vdd] = has_star
     return aggregated_star
 
-def create_aggregated_log(header_lines, footer_lines, aggregated_data, aggregated_star, mode, output_file):
+def create_aggregated_log(header_lines, footer_lines, aggregated_data, aggregated_star, mode, output_file, header=None):
     """
     Creates a new log file with aggregated data.
 
@@ -315,6 +336,7 @@ def create_aggregated_log(header_lines, footer_lines, aggregated_data, aggregate
         aggregated_star (dict): Aggregated '*' presence mapping.
         mode (str): Aggregation mode ('OR' or 'Majority').
         output_file (str): Path to the output log file.
+        header (ShmooHeader): Parsed header_lines, or None to parse them here.
     """
     with open(output_file, 'w') as file:
         # Write header
@@ -328,22 +350,28 @@ def create_aggregated_log(header_lines, footer_lines, aggregated_data, aggregate
 
         # Write aggregated data
         sorted_vdd = sorted(aggregated_data.keys(), reverse=True)
-        for vdd in sorted_vdd:
+        # Pass range of every row from the X-Axis header
+        x_start, _, x_step = header.x_axis_info() if header else extract_x_axis_info(header_lines)
+        ns_ranges = calculate_ns_ranges([aggregated_data[vdd] for vdd in sorted_vdd], x_start, x_step)
+        for vdd, ns_range in zip(sorted_vdd, ns_ranges):
             data_str = aggregated_data[vdd]
             has_star = aggregated_star.get(vdd, False)
+            range_str = format_ns_range(ns_range)
             # Format VDD value to three decimal places
-            vdd_formatted = f"{vdd:7.3f}"
+            vdd_formatted = f"{format_mv(vdd):>7}"
             if has_star:
                 # Insert '*' before the data string and adjust spacing
                 # Remove one space between VDD and data if '*' is present
-                file.write(f"{vdd_formatted}  *{data_str} (15.000..      )\n")
+                file.write(f"{vdd_formatted}  *{data_str} {range_str}\n")
             else:
                 # Standard spacing with three spaces
-                file.write(f"{vdd_formatted}   {data_str} (15.000..      )\n")
+                file.write(f"{vdd_formatted}   {data_str} {range_str}\n")
 
         # Write footer
         file.writelines(footer_lines)
-    print(f"Aggregated '{mode}' Shmoo plot saved to: {output_file}")
+    note_plot_write(output_file)
+    logger.debug("Aggregated '%s' Shmoo plot saved to: %s", mode, output_file)
+    metrics.inc(metrics.FILES_WRITTEN, kind="aggregate")
 
 
 def process_aggregation(input_directory,mode) -> str:
@@ -356,36 +384,42 @@ def process_aggregation(input_directory,mode) -> str:
 
     log_files = [f for f in os.listdir(input_directory) if f.endswith('.log')]
     if not log_files:
-        print(f"No .log files found in '{input_directory}'.")
+        logger.error("No .log files found in '%s'.", input_directory)
         sys.exit(1)
 
-    vdd_data_list = []
+    vdd_ids_list = []
     vdd_has_star_list = []
     header_lines_common = None
     footer_lines_common = None
+    header_common = None
+    test_header = load_test_header(input_directory)
+    table = shared_row_table()
 
     for log_file in log_files:
         file_path = os.path.join(input_directory, log_file)
         try:
-            header_lines, data_block, footer_lines, vdd_data, vdd_has_star = read_log_file(file_path)
-            vdd_data_list.append(vdd_data)
+            header = test_header.for_site(log_file)
+            header_lines, data_block, footer_lines, vdd_data, vdd_has_star = read_log_file(file_path, header)
+            vdd_ids_list.append(table.encode(vdd_data))
             vdd_has_star_list.append(vdd_has_star)
             if header_lines_common is None:
                 header_lines_common = header_lines
+                header_common = header
             if footer_lines_common is None:
                 footer_lines_common = footer_lines
         except ValueError as e:
-            print(f"Error processing '{log_file}': {e}")
+            logger.error("Error processing '%s': %s", log_file, e)
+            metrics.inc(metrics.ERRORS, stage="aggregation")
 
-    if not vdd_data_list:
-        print("No valid data extracted from log files.")
+    if not vdd_ids_list:
+        logger.error("No valid data extracted from log files.")
         sys.exit(1)
 
-    # Aggregate data based on the selected mode
-    aggregated_data = aggregate(vdd_data_list, mode=mode)
+    # Aggregate data based on the selected mode, once per distinct combination of rows
+    aggregated_data = table.decode(aggregate_encoded(vdd_ids_list, mode, table))
     aggregated_star = aggregate_star_presence(vdd_has_star_list)
 
     # Create the aggregated log
-    create_aggregated_log(header_lines_common, footer_lines_common, aggregated_data, aggregated_star, mode, output_file)
+    create_aggregated_log(header_lines_common, footer_lines_common, aggregated_data, aggregated_star, mode, output_file, header_common)
 
     return output_file
@@ -1,5 +1,9 @@
 
 import os
+import logging
+from shmooapp.analysis.shmoo_header import ShmooHeader, load_test_header
+
+logger = logging.getLogger(__name__)
 
 
 # Plot starts at pos12
@@ -9,8 +13,10 @@ import os
 RowPositionAjust = 12
 
 class ShmooMarginCalculator:
-    def __init__(self, log_file_path):
+    def __init__(self, log_file_path, header=None):
+        # header: the site's ShmooHeader from load_test_header, parsed from the file if None
         self.log_file_path = log_file_path
+        self.header = header
         self.x_operation_center = None
         self.y_operation_center = None
         self.x_operation_outofrange = False
@@ -30,56 +36,43 @@ class ShmooMarginCalculator:
         #  Y-Axis:   VDD       [   1.300 ..   0.600 V   ] step  -0.020 V   (   0.971 V   )
         # not expect the follwong:
         #       ----- X-Axis: Period -----
-        for line in lines:
-            if "  X-Axis:" in line:
-                # Extract X min and max
-                range_part = line.split('[')[1].split(']')[0]
-                self.x_min, self.x_max = map(float, range_part.replace('ns', '').split('..'))
-                
-                # Extract X step
-                step_part = line.split("step")[1].split('ns')[0].strip()
-                self.x_step = float(step_part)
-                
-                # Extract X operation center
-                #op_center_part = line.split('(')[1].split('ns')[0].strip()
-                op_center_part = line.split('(')[1].split('ns')[0].split(')')[0].strip()
-                self.x_operation_center = float(op_center_part)
-            
-                # set flag for out of range
-                # case 1) x_operation_center = 0.000
-                #   X-Axis:   Period    [  10.000 .. 100.000 ns  ] step   5.000 ns  (   0.000     )
-                # else?
-                if self.x_min > self.x_operation_center:
-                    self.x_operation_outofrange = True
-
-                ## Clamp x_operation_center within [x_min, x_max] based on step direction
-                #if self.x_step > 0:
-                #    self.x_operation_center = max(self.x_min, min(self.x_max, self.x_operation_center))
-                #else:
-                #    self.x_operation_center = min(self.x_min, max(self.x_max, self.x_operation_center))
-
-            elif "  Y-Axis:" in line:
-                # Extract Y min and max
-                range_part = line.split('[')[1].split(']')[0]
-                self.y_min, self.y_max = map(float, range_part.replace('V', '').split('..'))
-                
-                # Extract Y step
-                step_part = line.split("step")[1].split('V')[0].strip()
-                self.y_step = float(step_part)
-                
-                # Extract raw Y operation center
-                raw_y_center = float(line.split('(')[1].split('V')[0].strip())
-                
-                # Round Y operation center to the nearest step
-                self.y_operation_center = self.round_to_step(raw_y_center, self.y_min, self.y_step)
-
-                # Clamp y_operation_center within [y_min, y_max] based on step direction
-                if self.y_step > 0:
-                    self.y_operation_center = max(self.y_min, min(self.y_max, self.y_operation_center))
-                else:
-                    self.y_operation_center = min(self.y_min, max(self.y_max, self.y_operation_center))
+        self.apply_header(ShmooHeader.parse(lines))
+
+    def apply_header(self, header):
+        if header.x_start is None or header.y_first is None:
+            raise ValueError("X-Axis or Y-Axis information not found.")
+        if header.x_center is None or header.y_center is None:
+            raise ValueError("Operation center not found in the X-Axis or Y-Axis header.")
+        self.x_min, self.x_max = header.x_start, header.x_end
+        self.x_step = header.x_step
+        self.x_operation_center = header.x_center
+
+        # set flag for out of range
+        # case 1) x_operation_center = 0.000
+        #   X-Axis:   Period    [  10.000 .. 100.000 ns  ] step   5.000 ns  (   0.000     )
+        # else?
+        if self.x_min > self.x_operation_center:
+            self.x_operation_outofrange = True
+
+        ## Clamp x_operation_center within [x_min, x_max] based on step direction
+        #if self.x_step > 0:
+        #    self.x_operation_center = max(self.x_min, min(self.x_max, self.x_operation_center))
+        #else:
+        #    self.x_operation_center = min(self.x_min, max(self.x_max, self.x_operation_center))
+
+        self.y_min, self.y_max = header.y_first, header.y_last
+        self.y_step = header.y_step
+
+        # Round Y operation center to the nearest step
+        self.y_operation_center = self.round_to_step(header.y_center, self.y_min, self.y_step)
+
+        # Clamp y_operation_center within [y_min, y_max] based on step direction
+        if self.y_step > 0:
+            self.y_operation_center = max(self.y_min, min(self.y_max, self.y_operation_center))
+        else:
+            self.y_operation_center = min(self.y_min, max(self.y_max, self.y_operation_center))
 
-        print(f" OpCenter X:{self.x_operation_center}, Y:{self.y_operation_center}")
+        logger.debug("OpCenter X:%s, Y:%s", self.x_operation_center, self.y_operation_center)
 
     def round_to_step(self, value, min_val, step):
         """
@@ -165,13 +158,16 @@ class ShmooMarginCalculator:
                 else:
                     break
         self.y_margin = y_margin_count * abs(self.y_step)
-        print(f" Margin Y:{self.x_margin}    {x_center_index}")
+        logger.debug("Margin Y:%s    %s", self.y_margin, x_center_index)
 
     def calculate_margins(self):
         with open(self.log_file_path, 'r') as file:
             lines = file.readlines()
 
-        self.parse_header(lines)
+        if self.header is not None:
+            self.apply_header(self.header)
+        else:
+            self.parse_header(lines)
         self.parse_plot(lines)
         self.calculate_x_margin()
         self.calculate_y_margin()
@@ -185,10 +181,11 @@ class ShmooMarginCalculator:
 def calculate_files_for_margin(input_directory):
     # Process all .log files in the input directory
     margin_list : list[list[float,float,float,float]] = []
+    test_header = load_test_header(input_directory)
     for filename in sorted(os.listdir(input_directory)):
         if filename.endswith('.log'):
             file_path = os.path.join(input_directory, filename)
-            calculator = ShmooMarginCalculator(file_path)
+            calculator = ShmooMarginCalculator(file_path, test_header.for_site(filename))
             margin_x, margin_y = calculator.calculate_margins()
             margin_data = [
                 calculator.x_operation_center,
@@ -0,0 +1,243 @@
+import os
+import logging
+from pathlib import Path
+from shmooapp.analysis.common_utils import filter_original_dir_only, collect_archived_logs, generate_aggfile_name, site_number
+from shmooapp.analysis.heatmap import read_grid
+from shmooapp.analysis.result_cache import cached_margins
+from shmooapp.analysis import metrics
+
+logger = logging.getLogger(__name__)
+
+# Columnar export of parsed shmoo results for DuckDB/pandas.
+# Two long-format tables, partitioned by test in hive style so that the test name is
+# taken from the directory (read with hive_partitioning=true / partitioning="hive"):
+#   <output>/cells/test=<test>/<log>.parquet    one row per site, VDD step and X step
+#   <output>/margins/test=<test>/<log>.parquet  one row per site
+# "site" is the site number (<test>_site<N>.log, null if the name has none) and
+# "site_file" the site log file name.
+# Each log writes its own file per partition, so months of logs can be exported into
+# the same directory. Files are written one site (record batch) at a time.
+# pyarrow is optional and imported only when exporting.
+FORMAT_PARQUET = "parquet"
+FORMAT_ARROW = "arrow"
+EXPORT_FORMATS = (FORMAT_PARQUET, FORMAT_ARROW)
+DEFAULT_COMPRESSION = "zstd"
+CELLS_TABLE = "cells"
+MARGINS_TABLE = "margins"
+
+# aggregation mode -> column suffix, in the order of the columns
+EXPORT_MODES = {"OR": "or", "AND": "and", "Majority": "majority"}
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        import pyarrow.ipc
+    except ImportError as e:
+        raise ImportError("The columnar export needs pyarrow: pip install pyarrow") from e
+    return pyarrow
+
+def cells_schema(pa):
+    fields = [
+        pa.field("log", pa.dictionary(pa.int32(), pa.string())),
+        pa.field("site", pa.int16()),
+        pa.field("site_file", pa.dictionary(pa.int32(), pa.string())),
+        pa.field("row", pa.int16()),
+        pa.field("col", pa.int16()),
+        pa.field("vdd", pa.float64()),
+        pa.field("x", pa.float64()),
+        pa.field("state", pa.dictionary(pa.int8(), pa.string())),
+    ]
+    fields += [pa.field(f"agg_{suffix}", pa.dictionary(pa.int8(), pa.string())) for suffix in EXPORT_MODES.values()]
+    fields += [pa.field(f"xor_{suffix}", pa.bool_()) for suffix in EXPORT_MODES.values()]
+    return pa.schema(fields)
+
+def margins_schema(pa):
+    return pa.schema([
+        pa.field("log", pa.string()),
+        pa.field("site", pa.int16()),
+        pa.field("site_file", pa.string()),
+        pa.field("x_center", pa.float64()),
+        pa.field("y_center", pa.float64()),
+        pa.field("x_margin", pa.float64()),
+        pa.field("y_margin", pa.float64()),
+    ])
+
+
+def site_cell_columns(log, site_file, site_grid, vdd, x, aggregates):
+    """
+    Long-format columns of the cells of one site plot.
+
+    Args:
+        log (str): Log name.
+        site_file (str): Site log file name.
+        site_grid (ShmooGrid): Grid of the site.
+        vdd (list): VDD in V per row.
+        x (list): X value per column.
+        aggregates (dict): Mode to ShmooGrid of the aggregate (missing modes are null).
+
+    Returns:
+        dict: Column name to list of values.
+    """
+    height, width = site_grid.height, site_grid.width
+    count = height * width
+    columns = {
+        "log": [log] * count,
+        "site": [site_number(site_file)] * count,
+        "site_file": [site_file] * count,
+        "row": [r for r in range(height) for _ in range(width)],
+        "col": list(range(width)) * height,
+        "vdd": [v for v in vdd for _ in range(width)],
+        "x": x * height,
+        "state": list(''.join(site_grid.rows)),
+    }
+    for mode, suffix in EXPORT_MODES.items():
+        agg_grid = aggregates.get(mode)
+        if agg_grid is None or (agg_grid.height, agg_grid.width) != (height, width):
+            columns[f"agg_{suffix}"] = [None] * count
+            columns[f"xor_{suffix}"] = [None] * count
+            continue
+        agg_cells = ''.join(agg_grid.rows)
+        columns[f"agg_{suffix}"] = list(agg_cells)
+        # same definition as the XOR logs: the site cell differs from the aggregate cell
+        columns[f"xor_{suffix}"] = [a != s for a, s in zip(agg_cells, columns["state"])]
+    return columns
+
+def iter_test_cells(log, test_dir):
+    """
+    Yields the cell columns of a test, one site at a time.
+    """
+    aggregates = {}
+    for mode in EXPORT_MODES:
+        aggfile = generate_aggfile_name(test_dir, mode)
+        if os.path.exists(aggfile):
+            try:
+                aggregates[mode] = read_grid(aggfile)[0]
+            except ValueError as e:
+                logger.error("Error reading %s: %s", aggfile, e)
+                metrics.inc(metrics.ERRORS, stage="export")
+    for filename in sorted(os.listdir(test_dir)):
+        if not filename.endswith('.log'):
+            continue
+        file_path = os.path.join(test_dir, filename)
+        try:
+            grid, vdd, x = read_grid(file_path)
+        except ValueError as e:
+            logger.error("Error reading %s: %s", file_path, e)
+            metrics.inc(metrics.ERRORS, stage="export")
+            continue
+        yield site_cell_columns(log, filename, grid, vdd, x, aggregates)
+
+def test_margin_columns(log, test_dir):
+    """
+    Margins table columns of a test (see calculate_files_for_margin).
+    """
+    sites = sorted(f for f in os.listdir(test_dir) if f.endswith('.log'))
+    try:
+        margins = cached_margins(test_dir)
+    except ValueError as e:
+        logger.error("Error calculating margins of %s: %s", test_dir, e)
+        metrics.inc(metrics.ERRORS, stage="export")
+        margins = []
+    return {
+        "log": [log] * len(margins),
+        "site": [site_number(f) for f in sites[:len(margins)]],
+        "site_file": sites[:len(margins)],
+        "x_center": [m[0] for m in margins],
+        "y_center": [m[1] for m in margins],
+        "x_margin": [m[2] for m in margins],
+        "y_margin": [m[3] for m in margins],
+    }
+
+
+class PartitionWriter:
+    """
+    Writes record batches of one partition file, to a temporary name that is
+    renamed into place on close so that readers never see a partial file.
+    """
+    def __init__(self, pa, path, schema, format=FORMAT_PARQUET, compression=DEFAULT_COMPRESSION):
+        self.pa = pa
+        self.path = path
+        self.schema = schema
+        self.tmp_path = f"{path}.tmp-{os.getpid()}"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if format == FORMAT_PARQUET:
+            self._writer = pa.parquet.ParquetWriter(self.tmp_path, schema, compression=compression)
+        else:
+            options = pa.ipc.IpcWriteOptions(compression=compression)
+            self._writer = pa.ipc.new_file(self.tmp_path, schema, options=options)
+        self.rows = 0
+
+    def write(self, columns):
+        batch = self.pa.RecordBatch.from_pydict(columns, schema=self.schema)
+        if batch.num_rows:
+            self._writer.write_batch(batch)
+            self.rows += batch.num_rows
+
+    def close(self):
+        self._writer.close()
+        os.replace(self.tmp_path, self.path)
+        metrics.inc(metrics.FILES_WRITTEN, kind="export")
+
+    def abort(self):
+        self._writer.close()
+        os.remove(self.tmp_path)
+
+
+def _partition_path(output_dir, table, test, log, format):
+    extension = "parquet" if format == FORMAT_PARQUET else "arrow"
+    return os.path.join(output_dir, table, f"test={test}", f"{log}.{extension}")
+
+def _write_partition(pa, path, schema, batches, format, compression):
+    writer = PartitionWriter(pa, path, schema, format, compression)
+    try:
+        for columns in batches:
+            writer.write(columns)
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
+    return writer.rows
+
+def export_log(log_dir, output_dir, format=FORMAT_PARQUET, compression=DEFAULT_COMPRESSION):
+    """
+    Exports the cells and margins of all tests of a log (e.g. out.plot/<log> or an archived run).
+
+    Args:
+        log_dir (str): Directory holding one subdirectory per test.
+        output_dir (str): Root of the dataset.
+        format (str): "parquet" or "arrow" (Arrow IPC file).
+        compression (str): Codec, e.g. "zstd", "lz4" or None.
+
+    Returns:
+        dict: Number of exported 'cells' and 'margins' rows.
+    """
+    if format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {format}")
+    pa = _import_pyarrow()
+    log = Path(log_dir).name
+    counts = {CELLS_TABLE: 0, MARGINS_TABLE: 0}
+    for p in sorted(Path(log_dir).iterdir()):
+        if not (p.is_dir() and filter_original_dir_only(p)):
+            continue
+        test_dir = str(p)
+        counts[CELLS_TABLE] += _write_partition(
+            pa, _partition_path(output_dir, CELLS_TABLE, p.name, log, format),
+            cells_schema(pa), iter_test_cells(log, test_dir), format, compression)
+        counts[MARGINS_TABLE] += _write_partition(
+            pa, _partition_path(output_dir, MARGINS_TABLE, p.name, log, format),
+            margins_schema(pa), [test_margin_columns(log, test_dir)], format, compression)
+    logger.info("Exported %d cells and %d margins of %s to %s",
+                counts[CELLS_TABLE], counts[MARGINS_TABLE], log, output_dir)
+    return counts
+
+def export_archive(arcroot, output_dir, format=FORMAT_PARQUET, compression=DEFAULT_COMPRESSION):
+    """
+    Exports all archived logs below arcroot into one dataset.
+
+    Returns:
+        dict: Archived log directory to export_log counts.
+    """
+    return {log_dir: export_log(log_dir, output_dir, format, compression)
+            for log_dir in collect_archived_logs(arcroot)}
@@ -1,8 +1,11 @@
 import os
 import re
+import logging
 from datetime import date
 from pathlib import Path
 
+logger = logging.getLogger(__name__)
+
 # logfile handling
 def create_yyyymmdd_today():
     today = date.today()
@@ -23,18 +26,41 @@ def generate_arcdir(arcroot,basedir):
     archive_basedir = os.path.join(arcroot, arcdir)
     return archive_basedir
 
+def merge_directory(src, dst):
+    """
+    Moves the files of src into dst, keeping the files of dst that src does not have.
+    Each file is swapped in with os.replace, so readers of dst never see a partial file.
+    """
+    for dirpath, _, filenames in os.walk(src):
+        target = os.path.join(dst, os.path.relpath(dirpath, src))
+        os.makedirs(target, exist_ok=True)
+        for filename in filenames:
+            os.replace(os.path.join(dirpath, filename), os.path.join(target, filename))
+
 def filter_original_dir_only(p:Path):
-    excluded_suffixes = ('.AND_XOR', '.OR_XOR', '.MajorityVote_XOR')
+    excluded_suffixes = ('.AND_XOR', '.OR_XOR', '.MajorityVote_XOR', '.images')
     return not p.name.endswith(excluded_suffixes)
 
 def collect_archived_logs(arcroot: str):
     arcroot_path = Path(arcroot)
-    print(f"{arcroot}")
+    logger.debug("Collecting archived logs in %s", arcroot)
     if not arcroot_path.is_dir():
         raise FileNotFoundError(f"The specified arcroot directory does not exist or is not a directory: {arcroot}")
     subdirs = [str(p) for p in arcroot_path.iterdir() if p.is_dir() and not p.is_symlink() and filter_original_dir_only(p)]
     return sorted(subdirs)
 
+def directory_signature(directory):
+    """
+    Cheap signature of the files of a test directory: (name, mtime_ns, size) of each file.
+    """
+    signature = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_file():
+                stat = entry.stat()
+                signature.append((entry.name, stat.st_mtime_ns, stat.st_size))
+    return tuple(sorted(signature))
+
 def generate_aggfile_name(input_directory,mode):
     out_dirname = Path(input_directory).parent
     out_basename = Path(input_directory).name
@@ -42,6 +68,15 @@ def generate_aggfile_name(input_directory,mode):
     output_file = os.path.join(out_dirname,out_filename)
     return output_file
 
+SITE_FILE_PATTERN = re.compile(r'_site(\d+)\.log$')
+
+def site_number(filename):
+    """
+    Site number of a site log file name (<test>_site<N>.log), None if it has none.
+    """
+    match = SITE_FILE_PATTERN.search(filename)
+    return int(match.group(1)) if match else None
+
 
 # plot handling
 VDD_PATTERNS = ["VDD", "Vvdd12", "Vvdd12_otp"]  # Add more patterns as needed
@@ -88,3 +123,96 @@ def extract_y_axis_info(lines):
             return max_vdd, min_vdd, step
     raise ValueError("Y-Axis information not found or malformed.")
 
+def vdd_to_mv(value):
+    """
+    Converts a VDD value in volts (float or label such as "0.980") to integer millivolts.
+    Integer millivolts are used as dict keys so that labels never drift in floating point.
+    """
+    return int(round(float(value) * 1000))
+
+def format_mv(mv):
+    """
+    Formats integer millivolts as a VDD label with three decimals, e.g. 980 -> "0.980".
+    """
+    sign = "-" if mv < 0 else ""
+    mv = abs(mv)
+    return f"{sign}{mv // 1000}.{mv % 1000:03d}"
+
+def generate_vdd_axis_mv(max_vdd, min_vdd, step):
+    """
+    Generates the whole VDD axis of a plot as integer millivolts, one entry per row.
+
+    Args:
+        max_vdd (float): VDD of the first (top) row.
+        min_vdd (float): VDD of the last (bottom) row.
+        step (float): Step value for VDD (negative when VDD decreases downwards).
+
+    Returns:
+        list: VDD in millivolts for each row index, first row first.
+    """
+    start_mv = vdd_to_mv(max_vdd)
+    end_mv = vdd_to_mv(min_vdd)
+    step_mv = vdd_to_mv(step)
+    if step_mv == 0 or (end_mv - start_mv) * step_mv < 0:
+        raise ValueError("Y-Axis step does not lead from the first to the last VDD.")
+    stop_mv = end_mv + (1 if step_mv > 0 else -1)
+    return list(range(start_mv, stop_mv, step_mv))
+
+def extract_x_axis_info(lines):
+    """
+    Extracts Start, End, and Step from the X-Axis meta information.
+    #  X-Axis:   Period    [  10.000 ..  50.000 ns  ] step   1.000 ns  (  20.800 ns  )
+
+    Args:
+        lines (list): List of lines from the log file.
+
+    Returns:
+        tuple: (x_start, x_end, step) where x_start is the value of the first plot column
+    """
+    x_axis_pattern = re.compile(
+        r"X-Axis\s*:\s*\w+\s*\[\s*([-+]?[\d.]+)\s*\.\.\s*([-+]?[\d.]+)\s*ns\s*\]\s*step\s*([-+]?\d*\.\d+|\d+)\s*ns",
+        re.IGNORECASE
+    )
+    for line in lines:
+        match = x_axis_pattern.search(line)
+        if match:
+            x_start = float(match.group(1))
+            x_end = float(match.group(2))
+            step = float(match.group(3))
+            return x_start, x_end, step
+    raise ValueError("X-Axis information not found or malformed.")
+
+# Shmoo row with an optional VDD label and an optional '*' (op-center) marker
+#    0.980  *!.PPPPPPPPPPPPPPPPPPPPPPPPPPPP (15.000..      )
+#            !.PPPPPPPPPPPPPPPPPPPPPPPPPPPP (15.000..      )
+PLOT_ROW_PATTERN = re.compile(r'^\s*(?:\d+\.\d+)?\s*\*?([!.P]+)')
+PLOT_END_PATTERN = re.compile(r'^\s*V\s+[+*]')
+
+def extract_plot_rows(lines):
+    """
+    Extracts the shmoo data strings of a plot, one per Y-axis step, top row first.
+    Works on plots with or without VDD labels (before or after fill_missing_vdd).
+
+    Args:
+        lines (list): List of lines from the log file.
+
+    Returns:
+        list: Data strings without VDD label and '*' marker.
+    """
+    data_start = None
+    for i, line in enumerate(lines):
+        if line.strip() in VDD_PATTERNS:
+            data_start = i + 2  # Two lines below "VDD" line
+            break
+    if data_start is None:
+        raise ValueError("Shmoo plot data block not found.")
+
+    rows = []
+    for line in lines[data_start:]:
+        if PLOT_END_PATTERN.match(line) or not line[:1].isspace():
+            break
+        match = PLOT_ROW_PATTERN.match(line)
+        if match:
+            rows.append(match.group(1))
+    return rows
+
@@ -1,5 +1,10 @@
 import os
 import re
+import logging
+from shmooapp.analysis.plot_reader import note_plot_write
+from shmooapp.analysis import metrics
+
+logger = logging.getLogger(__name__)
 
 def sanitize_filename(filename):
     """
@@ -13,124 +18,262 @@ def sanitize_filename(filename):
     """
     return re.sub(r'[\\/:"*?<>|]+', "_", filename)
 
-def extract_test_results(log_file_path, output_dir) -> list:
+# Section layout of the datalog
+#  ---------- TestMethod Shmoo --------------------------------
+#    TITLE  : I2C_READ_FUNC      DATE : Wed Sep 18 13:41:01 2024
+#  ...
+#  --- site 1 / 6 ( execution mode : parallel ) ---
+TEST_SEPARATOR_PATTERN = re.compile(r'[-]{10,}\s*TestMethod\s+Shmoo\s*[-]{10,}')
+TITLE_PATTERN = re.compile(r'TITLE\s+:\s+([^\s]+)')
+SITE_PATTERN = re.compile(r'---\s+site\s+(\d+)\s+/\s+(\d+)\s+\(', re.IGNORECASE)
+
+# Define the unwanted separators
+UNWANTED_SEPARATOR_V = re.compile(r'^\s*V\s+\+.*$')
+UNWANTED_SEPARATOR_SITE = re.compile(r'^Site\s+\d+:.*$')
+LINES_TO_REMOVE_AFTER_V = 3  # Existing rule for 'V' lines
+UNWANTED_WARNING = re.compile(r'^WARNING')
+UNWANTED_COMMENT = re.compile(r'^#')
+
+
+class SectionAssembler:
     """
-    Extracts test results from the log file and saves each result to a separate file
-    named using the input file name, TITLE information, and site number.
-    It also removes unwanted rows after a specific separator.
+    Splits datalog lines, fed one at a time, into the raw texts following each
+    TestMethod Shmoo separator. The text before the first separator (log header) is dropped.
+    """
+    def __init__(self):
+        self._section = None
+
+    def feed(self, line):
+        """
+        Returns:
+            list: Raw sections completed by the line (a separator ends the previous one).
+        """
+        completed = []
+        match = TEST_SEPARATOR_PATTERN.search(line)
+        while match:
+            if self._section is not None:
+                self._section.append(line[:match.start()])
+                completed.append(''.join(self._section))
+            self._section = []
+            line = line[match.end():]
+            match = TEST_SEPARATOR_PATTERN.search(line)
+        if self._section is not None:
+            self._section.append(line)
+        return completed
+
+    def close(self):
+        """
+        Returns:
+            list: The last raw section, at the end of the log.
+        """
+        section, self._section = self._section, None
+        return [] if section is None else [''.join(section)]
+
+
+def iter_raw_sections(lines):
+    """
+    Splits a datalog into raw sections, reading it line by line.
 
     Args:
-        log_file_path (str): Path to the input log file.
-        output_dir (str): Directory where the extracted files will be saved.
+        lines (iterable): Lines of the datalog, e.g. an open file.
+
+    Yields:
+        str: Raw section text.
+    """
+    assembler = SectionAssembler()
+    for line in lines:
+        yield from assembler.feed(line)
+    yield from assembler.close()
+
+def clean_section(section):
+    """
+    Removes unwanted rows of a section: warnings, comments and everything after the
+    'Site N:' separator.
+
+    Returns:
+        str: Cleaned section, or None if nothing is left.
     """
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+    lines = section.splitlines()
+    cleaned_lines = []
+    skip_lines = 0
+    skip_mode = False  # Flag to control skipping after 'Site' separator
 
-    # Get the base name of the log file without extension
-    base_filename = os.path.splitext(os.path.basename(log_file_path))[0]
+    for line in lines:
+        if skip_lines > 0:
+            skip_lines -= 1
+            #continue
 
-    basedir = f"{base_filename}"
-    output_basedir = os.path.join(output_dir, basedir)
-    if not os.path.exists(output_basedir):
-        os.makedirs(output_basedir)
+        if UNWANTED_SEPARATOR_V.match(line):
+            # Found the 'V' unwanted separator; skip this line and the next three lines
+            skip_lines = LINES_TO_REMOVE_AFTER_V
+            #continue
 
-    with open(log_file_path, 'r') as file:
-        content = file.read()
-
-    # Define the main separator for test sections
-    test_separator_regex = r'[-]{10,}\s*TestMethod\s+Shmoo\s*[-]{10,}'
-    
-    # Define the unwanted separators
-    unwanted_separator_v = r'^\s*V\s+\+.*$'
-    unwanted_separator_site = r'^Site\s+\d+:.*$'
-    lines_to_remove_after_v = 3  # Existing rule for 'V' lines
-    unwanted_warning = r'^WARNING'
-    unwanted_comment = r'^#'
-
-    # Split the content into individual test sections based on the main separator, do not contain the first, as it is header
-    test_sections = re.split(test_separator_regex, content)[1:]
-
-    # Initialize a list to hold cleaned test sections
-    cleaned_test_sections = []
-
-    # subdirs
-    subdirs = set()
-
-    for section in test_sections:
-        lines = section.splitlines()
-        cleaned_lines = []
-        skip_lines = 0
-        skip_mode = False  # Flag to control skipping after 'Site' separator
-
-        for line in lines:
-            if skip_lines > 0:
-                skip_lines -= 1
-                #continue
-
-            if re.match(unwanted_separator_v, line):
-                # Found the 'V' unwanted separator; skip this line and the next three lines
-                skip_lines = lines_to_remove_after_v
-                #continue
-
-            if re.match(unwanted_separator_site, line):
-                # Found the 'Site' unwanted separator; stop processing further lines in this section
-                skip_mode = True
-                break  # Exit the loop as the rest of the lines are unwanted
-
-            if re.match(unwanted_warning, line):
-                continue
-
-            if re.match(unwanted_comment, line):
-                continue
-
-            cleaned_lines.append(line)
-
-        # Reconstruct the section after removing unwanted lines
-        cleaned_section = "\n".join(cleaned_lines).rstrip()
-
-        # Proceed only if the section is not empty after removing unwanted content
-        if cleaned_section.strip():
-            cleaned_test_sections.append(cleaned_section)
-
-    for section in cleaned_test_sections:
-        # Search for the TITLE line
-        title_match = re.search(r'TITLE\s+:\s+([^\s]+)', section)
-        if title_match:
-            title = title_match.group(1).strip()
-            # Sanitize the title to create a valid filename part
-            sanitized_title = sanitize_filename(title)
-        else:
-            # If TITLE not found, use a default placeholder
-            print('Warning: TITLE not found in a section. Using "NoTitle".')
-            sanitized_title = "NoTitle"
-
-        # Search for the Site number
-        site_match = re.search(r'---\s+site\s+(\d+)\s+/\s+\d+\s+\(', section, re.IGNORECASE)
-        if site_match:
-            site_number = site_match.group(1)
-        else:
-            # If site number not found, skip this section
-            print('Warning: Site number not found in a section. Skipping...')
+        if UNWANTED_SEPARATOR_SITE.match(line):
+            # Found the 'Site' unwanted separator; stop processing further lines in this section
+            skip_mode = True
+            break  # Exit the loop as the rest of the lines are unwanted
+
+        if UNWANTED_WARNING.match(line):
             continue
 
-        subdir = f"{sanitized_title}"
-        output_subdir = os.path.join(output_basedir, subdir)
-        if not os.path.exists(output_subdir):
-            os.makedirs(output_subdir)
-        
-        subdirs.add(output_subdir) #
+        if UNWANTED_COMMENT.match(line):
+            continue
+
+        cleaned_lines.append(line)
+
+    # Reconstruct the section after removing unwanted lines
+    cleaned_section = "\n".join(cleaned_lines).rstrip()
+
+    # Proceed only if the section is not empty after removing unwanted content
+    if cleaned_section.strip():
+        return cleaned_section
+    return None
+
+def section_identity(section):
+    """
+    Finds test title and site of a cleaned section.
+
+    Returns:
+        tuple: (sanitized title, site number, number of sites) or None if the site is missing.
+    """
+    # Search for the TITLE line
+    title_match = TITLE_PATTERN.search(section)
+    if title_match:
+        title = title_match.group(1).strip()
+        # Sanitize the title to create a valid filename part
+        sanitized_title = sanitize_filename(title)
+    else:
+        # If TITLE not found, use a default placeholder
+        logger.warning('TITLE not found in a section. Using "NoTitle".')
+        sanitized_title = "NoTitle"
+
+    # Search for the Site number
+    site_match = SITE_PATTERN.search(section)
+    if not site_match:
+        # If site number not found, skip this section
+        logger.warning('Site number not found in a section. Skipping...')
+        metrics.inc(metrics.ERRORS, stage="extract")
+        return None
+    return sanitized_title, site_match.group(1), int(site_match.group(2))
+
+
+class TestSplitter:
+    """
+    Writes the sections of a datalog into per-test directories and tells which tests
+    are complete: a test is complete when all of its sites ("site k / N") have been
+    written, or when a section of another test follows.
+
+    Args:
+        log_file_path (str): Path to the datalog (names the output directory and files).
+        output_dir (str): Directory receiving <log>/<test> directories.
+        before_write (callable): Optional callback(test_dir) before a section is written
+            into a test that was already reported complete, e.g. to wait for its analysis.
+    """
+    def __init__(self, log_file_path, output_dir, before_write=None):
+        # Get the base name of the log file without extension
+        self.base_filename = os.path.splitext(os.path.basename(log_file_path))[0]
+        self.output_basedir = os.path.join(output_dir, self.base_filename)
+        os.makedirs(self.output_basedir, exist_ok=True)
+        self.before_write = before_write
+        self.subdirs = []
+        self.sections = 0
+        self._sites = {}        # test dir -> set of written sites
+        self._completed = set()
+        self.current = None     # test directory of the last written section
+
+    def feed(self, section):
+        """
+        Cleans and writes one raw section.
+
+        Returns:
+            list: Test directories that became complete.
+        """
+        cleaned_section = clean_section(section)
+        if cleaned_section is None:
+            return []
+        self.sections += 1
+        identity = section_identity(cleaned_section)
+        if identity is None:
+            return []
+        sanitized_title, site_number, site_count = identity
+
+        output_subdir = os.path.join(self.output_basedir, sanitized_title)
+        completed = []
+        if self.current is not None and self.current != output_subdir and self.current not in self._completed:
+            completed.append(self._complete(self.current))
+        self.current = output_subdir
+
+        if output_subdir in self._completed:
+            # the test is repeated later in the log: its files change again
+            if self.before_write is not None:
+                self.before_write(output_subdir)
+            self._completed.discard(output_subdir)
+            self._sites[output_subdir] = set()
+        if output_subdir not in self._sites:
+            os.makedirs(output_subdir, exist_ok=True)
+            self.subdirs.append(output_subdir)
+            self._sites[output_subdir] = set()
 
         # Create the filename using the base filename, sanitized title, and site number
-        filename = f"{base_filename}_{sanitized_title}_site{site_number}.log"
+        filename = f"{self.base_filename}_{sanitized_title}_site{site_number}.log"
         output_path = os.path.join(output_subdir, filename)
 
         # Write the section to the new file
         with open(output_path, 'w') as outfile:
-            #outfile.write(cleaned_section.strip())
-            outfile.write(section.strip())
-
-        print(f'Extracted: {filename}')
-    
-    for subdir in subdirs:
-        print(f"{subdir}")
-    return list(subdirs)
\ No newline at end of file
+            outfile.write(cleaned_section.strip())
+        note_plot_write(output_path)
+        logger.debug('Extracted: %s', filename)
+        metrics.inc(metrics.FILES_WRITTEN, kind="site")
+
+        self._sites[output_subdir].add(site_number)
+        if len(self._sites[output_subdir]) >= site_count:
+            completed.append(self._complete(output_subdir))
+        return completed
+
+    def finish(self):
+        """
+        Returns:
+            list: Test directories that were not reported complete yet.
+        """
+        remaining = [d for d in self.subdirs if d not in self._completed]
+        for subdir in remaining:
+            self._complete(subdir)
+        metrics.inc(metrics.SECTIONS_PARSED, self.sections)
+        return remaining
+
+    def _complete(self, subdir):
+        self._completed.add(subdir)
+        return subdir
+
+    def iter_tests(self, lines):
+        """
+        Splits the lines of a datalog and yields each test directory once it is complete.
+        """
+        for section in iter_raw_sections(lines):
+            yield from self.feed(section)
+        yield from self.finish()
+
+
+def extract_test_results(log_file_path, output_dir, cancel=None) -> list:
+    """
+    Extracts test results from the log file and saves each result to a separate file
+    named using the input file name, TITLE information, and site number.
+    It also removes unwanted rows after a specific separator.
+    The log is read line by line, so memory does not grow with its size.
+
+    Args:
+        log_file_path (str): Path to the input log file.
+        output_dir (str): Directory where the extracted files will be saved.
+        cancel (threading.Event): Optional; checked before every section, splitting
+            stops once it is set.
+    """
+    splitter = TestSplitter(log_file_path, output_dir)
+    with open(log_file_path, 'r') as file:
+        for section in iter_raw_sections(file):
+            if cancel is not None and cancel.is_set():
+                logger.info("Cancelled splitting %s after %d sections", log_file_path, splitter.sections)
+                break
+            splitter.feed(section)
+    splitter.finish()
+    logger.info("Extracted %d sections into %d tests from %s", splitter.sections, len(splitter.subdirs), log_file_path)
+    return list(splitter.subdirs)
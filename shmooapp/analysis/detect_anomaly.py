@@ -0,0 +1,248 @@
+import os
+import re
+import logging
+from pathlib import Path
+from shmooapp.analysis.common_utils import extract_plot_rows, generate_aggfile_name, filter_original_dir_only
+from shmooapp.analysis import metrics
+
+logger = logging.getLogger(__name__)
+
+# Runs of pass / fail cells in a shmoo row. Labeling works on runs instead of
+# single cells, so the cost is driven by the number of edges, not the plot size.
+_PASS_RUN = re.compile(r'P+')
+_FAIL_RUN = re.compile(r'[^P]+')
+
+# Severity = HOLE * holes + ISLAND * islands + EDGE * non-monotonic rows
+#          + AREA * (anomalous cells / all cells)
+SEVERITY_WEIGHT_HOLE = 1.0
+SEVERITY_WEIGHT_ISLAND = 1.0
+SEVERITY_WEIGHT_EDGE = 0.5
+SEVERITY_WEIGHT_AREA = 10.0
+
+AGGREGATION_MODES = ["OR", "AND", "Majority"]
+
+
+def _find_root(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+def label_components(rows, pattern):
+    """
+    Labels 4-connected components of the cells matched by pattern.
+
+    Args:
+        rows (list): Shmoo data strings, top row first.
+        pattern (re.Pattern): Regex matching a run of the cells to label.
+
+    Returns:
+        list: One dict per component with 'cells', 'top', 'bottom', 'left', 'right'
+              (inclusive bounds) and 'touches_border'.
+    """
+    runs = []        # (row, start, end) with end exclusive
+    parent = []
+    prev_runs = []   # run ids of the previous row
+    for r, row in enumerate(rows):
+        cur_runs = []
+        j = 0
+        for m in pattern.finditer(row):
+            start, end = m.span()
+            run_id = len(runs)
+            runs.append((r, start, end))
+            parent.append(run_id)
+            cur_runs.append(run_id)
+            # Merge with overlapping runs of the previous row (both lists are sorted)
+            while j < len(prev_runs) and runs[prev_runs[j]][2] <= start:
+                j += 1
+            k = j
+            while k < len(prev_runs) and runs[prev_runs[k]][1] < end:
+                a = _find_root(parent, run_id)
+                b = _find_root(parent, prev_runs[k])
+                if a != b:
+                    parent[max(a, b)] = min(a, b)
+                k += 1
+        prev_runs = cur_runs
+
+    components = {}
+    last_row = len(rows) - 1
+    for run_id, (r, start, end) in enumerate(runs):
+        root = _find_root(parent, run_id)
+        comp = components.get(root)
+        if comp is None:
+            comp = {'cells': 0, 'top': r, 'bottom': r, 'left': start, 'right': end - 1, 'touches_border': False}
+            components[root] = comp
+        comp['cells'] += end - start
+        comp['bottom'] = r
+        comp['left'] = min(comp['left'], start)
+        comp['right'] = max(comp['right'], end - 1)
+        if r == 0 or r == last_row or start == 0 or end >= len(rows[r]):
+            comp['touches_border'] = True
+    return list(components.values())
+
+def find_nonmonotonic_rows(rows, vdd_descending=True):
+    """
+    Finds rows where the pass edge moves the wrong way with decreasing VDD.
+    A lower VDD is expected to need an equal or longer period, so the first 'P'
+    must not move left, and passes must not reappear below a fully failing row.
+
+    Args:
+        rows (list): Shmoo data strings, top row first.
+        vdd_descending (bool): True when the top row is the highest VDD.
+
+    Returns:
+        list: Row indices (top row = 0) that break monotonicity.
+    """
+    indices = range(len(rows)) if vdd_descending else range(len(rows) - 1, -1, -1)
+    violations = []
+    prev_first = None
+    seen_pass = False
+    for r in indices:
+        first = rows[r].find('P')
+        if first == -1:
+            prev_first = len(rows[r]) if seen_pass else None
+            continue
+        if prev_first is not None and first < prev_first:
+            violations.append(r)
+        seen_pass = True
+        prev_first = first
+    return sorted(violations)
+
+def detect_plot_anomalies(rows, vdd_descending=True):
+    """
+    Detects holes, islands and non-monotonic edges in a single shmoo grid.
+
+    Args:
+        rows (list): Shmoo data strings, top row first.
+        vdd_descending (bool): True when the top row is the highest VDD.
+
+    Returns:
+        dict: 'holes' (enclosed fail components), 'islands' (pass components besides
+              the main one), 'edges' (non-monotonic row indices) and 'severity'.
+    """
+    pass_components = label_components(rows, _PASS_RUN)
+    fail_components = label_components(rows, _FAIL_RUN)
+
+    holes = [c for c in fail_components if not c['touches_border']]
+    islands = []
+    if pass_components:
+        main = max(pass_components, key=lambda c: c['cells'])
+        islands = [c for c in pass_components if c is not main]
+    edges = find_nonmonotonic_rows(rows, vdd_descending)
+
+    total_cells = sum(len(row) for row in rows) or 1
+    anomalous_cells = sum(c['cells'] for c in holes) + sum(c['cells'] for c in islands)
+    severity = (SEVERITY_WEIGHT_HOLE * len(holes)
+                + SEVERITY_WEIGHT_ISLAND * len(islands)
+                + SEVERITY_WEIGHT_EDGE * len(edges)
+                + SEVERITY_WEIGHT_AREA * anomalous_cells / total_cells)
+    return {
+        'holes': holes,
+        'islands': islands,
+        'edges': edges,
+        'severity': round(severity, 3),
+    }
+
+def detect_file_anomalies(file_path):
+    """
+    Detects anomalies in a single plot file (site log or aggregated log).
+
+    Args:
+        file_path (str): Path to the plot file.
+
+    Returns:
+        dict: Result of detect_plot_anomalies with an additional 'file' key.
+    """
+    with open(file_path, 'r') as file:
+        lines = file.readlines()
+    result = detect_plot_anomalies(extract_plot_rows(lines))
+    result['file'] = os.path.basename(file_path)
+    return result
+
+def format_anomaly_summary(result):
+    return (f"{result['file']}: holes={len(result['holes'])} islands={len(result['islands'])} "
+            f"edges={len(result['edges'])} severity={result['severity']:.3f}")
+
+def detect_files_for_anomaly(input_directory):
+    # Process all .log files in the input directory
+    results = []
+    for filename in sorted(os.listdir(input_directory)):
+        if filename.endswith('.log'):
+            file_path = os.path.join(input_directory, filename)
+            try:
+                results.append(detect_file_anomalies(file_path))
+            except ValueError as e:
+                logger.error("Error processing %s: %s", file_path, e)
+                metrics.inc(metrics.ERRORS, stage="anomaly")
+    return results
+
+def detect_aggregates_for_anomaly(input_directory):
+    # Process the aggregated logs of the test, if they have been created
+    results = []
+    for mode in AGGREGATION_MODES:
+        file_path = generate_aggfile_name(input_directory, mode)
+        if os.path.exists(file_path):
+            try:
+                results.append(detect_file_anomalies(file_path))
+            except ValueError as e:
+                logger.error("Error processing %s: %s", file_path, e)
+                metrics.inc(metrics.ERRORS, stage="anomaly")
+    return results
+
+def detect_test_anomalies(input_directory):
+    """
+    Detects anomalies on every site grid and aggregate of a single test.
+
+    Args:
+        input_directory (str): Test directory holding the site .log files.
+
+    Returns:
+        dict: 'sites' and 'aggregates' result lists and the test's max 'severity'.
+    """
+    sites = detect_files_for_anomaly(input_directory)
+    aggregates = detect_aggregates_for_anomaly(input_directory)
+    severity = max((r['severity'] for r in sites + aggregates), default=0.0)
+    return {'sites': sites, 'aggregates': aggregates, 'severity': severity}
+
+def detect_log_anomalies(log_directory):
+    """
+    Detects anomalies for all tests of a log (e.g. out.plot/<log> or an archived run).
+
+    Args:
+        log_directory (str): Directory holding one subdirectory per test.
+
+    Returns:
+        dict: Test directory to detect_test_anomalies result.
+    """
+    results = {}
+    for p in sorted(Path(log_directory).iterdir()):
+        if p.is_dir() and filter_original_dir_only(p):
+            results[str(p)] = detect_test_anomalies(str(p))
+    return results
+
+def detect_archive_anomalies(arcroot):
+    """
+    Detects anomalies for all archived logs below arcroot.
+
+    Returns:
+        dict: Archived log directory to detect_log_anomalies result.
+    """
+    results = {}
+    for p in sorted(Path(arcroot).iterdir()):
+        if p.is_dir():
+            results[str(p)] = detect_log_anomalies(str(p))
+    return results
+
+def collect_anomalous_tests(subdirs, threshold=1.0, detect=detect_test_anomalies):
+    """
+    Filters test directories down to those whose worst plot reaches the severity threshold.
+
+    Args:
+        subdirs (list): Test directories.
+        threshold (float): Minimum severity to keep a test.
+        detect (callable): detect_test_anomalies or a cached variant (result_cache.cached_anomalies).
+
+    Returns:
+        list: Test directories with anomalies, in the original order.
+    """
+    return [d for d in subdirs if detect(d)['severity'] >= threshold]
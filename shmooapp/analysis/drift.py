@@ -0,0 +1,259 @@
+import os
+import re
+import json
+import logging
+import threading
+from statistics import median
+from shmooapp.analysis.common_utils import collect_archived_logs, SITE_FILE_PATTERN
+from shmooapp.analysis.shmoo_header import load_test_header
+from shmooapp.analysis.result_cache import cached_margins
+from shmooapp.analysis import metrics
+
+logger = logging.getLogger(__name__)
+
+# Margin drift across archived runs (ARCHIVEDIR/<yyyymmdd>-<log>/<test>).
+# Every archived run adds one point to the time series of each (device, test, site):
+# X margin, Y margin and Vmin, the lowest VDD of the pass run below the Y operation
+# center at the X operation center (the column that the Y margin is counted on).
+# The series are kept in DRIFT_FILE inside the archive root together with the
+# runs they were built from, so update_drift only reads runs that are new or were
+# archived again since the last update.
+#
+# A point is flagged as a shift when the mean of the last DRIFT_RECENT_RUNS points
+# (ending at it) lies more than DRIFT_Z_THRESHOLD standard errors from the median of
+# the DRIFT_BASELINE_RUNS points before them. The spread of the baseline is its MAD
+# scaled to a standard deviation, but at least one axis step, since margins move in
+# steps and a stable series has no spread at all.
+DRIFT_FILE = "drift_series.json"
+DRIFT_FILE_VERSION = 1
+DRIFT_BASELINE_RUNS = 10
+DRIFT_MIN_BASELINE_RUNS = 5
+DRIFT_RECENT_RUNS = 3
+DRIFT_Z_THRESHOLD = 3.0
+MAD_TO_SIGMA = 1.4826
+
+DRIFT_METRICS = ("x_margin", "y_margin", "vmin")
+
+ARCHIVE_NAME_PATTERN = re.compile(r'^(\d{8})-(.+)$')
+
+
+def device_from_log(log):
+    # D5700_FF_CP1_SHMOO -> D5700
+    return log.split('_')[0]
+
+def series_key(device, test, site):
+    return f"{device}|{test}|{site}"
+
+def _directory_stamp(path):
+    # run_archive touches an archive it merged into, so archiving a log again gives a new stamp
+    stat = os.stat(path)
+    return [stat.st_ino, stat.st_mtime_ns]
+
+
+def test_points(run, date, log, test_dir):
+    """
+    Drift points of the sites of one archived test.
+
+    Returns:
+        list: (site, x_step, y_step, point) tuples.
+    """
+    sites = sorted(f for f in os.listdir(test_dir) if f.endswith('.log'))
+    margins = cached_margins(test_dir)
+    test_header = load_test_header(test_dir)
+    points = []
+    for filename, (x_center, y_center, x_margin, y_margin) in zip(sites, margins):
+        match = SITE_FILE_PATTERN.search(filename)
+        header = test_header.for_site(filename)
+        if not match or header is None:
+            continue
+        y_step = abs(header.y_step)
+        vmin = None
+        count = round(y_margin / y_step) if y_step else 0
+        if count > 0:
+            # the Y margin counts rows downwards from the center row, in the direction of y_step
+            vmin = round(min(y_center, y_center + (count - 1) * header.y_step), 6)
+        point = {'run': run, 'date': date, 'log': log,
+                 'x_margin': round(x_margin, 6), 'y_margin': round(y_margin, 6), 'vmin': vmin}
+        points.append((match.group(1), abs(header.x_step), y_step, point))
+    return points
+
+
+def shift_score(values, index, quantum):
+    """
+    Standardized shift of the window ending at index against the baseline before it.
+
+    Args:
+        values (list): Values of a series in time order (None for missing points).
+        index (int): Last point of the recent window.
+        quantum (float): Smallest meaningful change (one axis step).
+
+    Returns:
+        float: The score, or None if the baseline is too short.
+    """
+    recent = [v for v in values[max(0, index - DRIFT_RECENT_RUNS + 1):index + 1] if v is not None]
+    start = max(0, index - DRIFT_RECENT_RUNS + 1)
+    baseline = [v for v in values[max(0, start - DRIFT_BASELINE_RUNS):start] if v is not None]
+    if not recent or len(baseline) < DRIFT_MIN_BASELINE_RUNS:
+        return None
+    center = median(baseline)
+    spread = max(MAD_TO_SIGMA * median(abs(v - center) for v in baseline), quantum or 0.0)
+    if spread == 0:
+        return None
+    return (sum(recent) / len(recent) - center) / (spread / len(recent) ** 0.5)
+
+def score_series(series):
+    """
+    Sets 'z' (metric -> score) and 'shifts' (flagged metrics) of every point of a series.
+    """
+    points = series['points']
+    quanta = {'x_margin': series['x_step'], 'y_margin': series['y_step'], 'vmin': series['y_step']}
+    for metric in DRIFT_METRICS:
+        values = [p[metric] for p in points]
+        for i, point in enumerate(points):
+            point.setdefault('z', {})[metric] = shift_score(values, i, quanta[metric])
+    for point in points:
+        point['shifts'] = [m for m in DRIFT_METRICS
+                           if point['z'][m] is not None and abs(point['z'][m]) > DRIFT_Z_THRESHOLD]
+
+
+class DriftStore:
+    """
+    Drift series of an archive root, loaded from and saved to DRIFT_FILE.
+
+    Attributes:
+        runs (dict): Archive name to the stamp of the directory it was read from.
+        series (dict): series_key to {'device', 'test', 'site', 'x_step', 'y_step', 'points'}.
+    """
+    def __init__(self, path, runs=None, series=None):
+        self.path = path
+        self.runs = runs or {}
+        self.series = series or {}
+
+    @classmethod
+    def load(cls, arcroot):
+        path = os.path.join(arcroot, DRIFT_FILE)
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return cls(path)
+        except ValueError as e:
+            logger.warning("Rebuilding %s: %s", path, e)
+            return cls(path)
+        if data.get('version') != DRIFT_FILE_VERSION:
+            return cls(path)
+        return cls(path, data['runs'], data['series'])
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp-{os.getpid()}"
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': DRIFT_FILE_VERSION, 'runs': self.runs, 'series': self.series}, f)
+        os.replace(tmp_path, self.path)
+        metrics.inc(metrics.FILES_WRITTEN, kind="drift")
+
+    def remove_run(self, run):
+        touched = set()
+        for key, series in self.series.items():
+            kept = [p for p in series['points'] if p['run'] != run]
+            if len(kept) != len(series['points']):
+                series['points'] = kept
+                touched.add(key)
+        self.runs.pop(run, None)
+        return touched
+
+    def add_run(self, arcdir):
+        """
+        Adds the points of one archived run.
+
+        Returns:
+            set: Keys of the series that changed.
+        """
+        run = os.path.basename(arcdir)
+        date, log = ARCHIVE_NAME_PATTERN.match(run).groups()
+        device = device_from_log(log)
+        touched = set()
+        for test_dir in collect_archived_logs(arcdir):
+            test = os.path.basename(test_dir)
+            try:
+                points = test_points(run, date, log, test_dir)
+            except (ValueError, OSError) as e:
+                logger.error("Error reading margins of %s: %s", test_dir, e)
+                metrics.inc(metrics.ERRORS, stage="drift")
+                continue
+            for site, x_step, y_step, point in points:
+                key = series_key(device, test, site)
+                series = self.series.setdefault(key, {
+                    'device': device, 'test': test, 'site': site,
+                    'x_step': x_step, 'y_step': y_step, 'points': [],
+                })
+                series['points'].append(point)
+                touched.add(key)
+        self.runs[run] = _directory_stamp(arcdir)
+        return touched
+
+    def flags(self):
+        """
+        Returns:
+            list: Series whose latest point is a shift, as dicts with 'device', 'test',
+            'site', 'run', 'shifts', 'z', and per shifted metric the 'recent' mean and
+            the 'baseline' median.
+        """
+        flagged = []
+        for series in self.series.values():
+            points = series['points']
+            if not points or not points[-1]['shifts']:
+                continue
+            latest = points[-1]
+            start = max(0, len(points) - DRIFT_RECENT_RUNS)
+            recent = points[start:]
+            baseline = points[max(0, start - DRIFT_BASELINE_RUNS):start]
+
+            def values(window, metric):
+                return [p[metric] for p in window if p[metric] is not None]
+
+            flagged.append({
+                'device': series['device'], 'test': series['test'], 'site': series['site'],
+                'run': latest['run'], 'shifts': latest['shifts'],
+                'z': {m: latest['z'][m] for m in latest['shifts']},
+                'recent': {m: sum(values(recent, m)) / len(values(recent, m)) for m in latest['shifts']},
+                'baseline': {m: median(values(baseline, m)) for m in latest['shifts']},
+            })
+        return sorted(flagged, key=lambda f: -max(abs(z) for z in f['z'].values()))
+
+
+_drift_lock = threading.Lock()
+
+def update_drift(arcroot):
+    """
+    Adds the archived runs below arcroot that are new or were archived again since the
+    last update, and scores the series they changed.
+
+    Returns:
+        DriftStore
+    """
+    with _drift_lock:
+        store = DriftStore.load(arcroot)
+        archived = {os.path.basename(d): d for d in collect_archived_logs(arcroot)
+                    if ARCHIVE_NAME_PATTERN.match(os.path.basename(d))}
+        touched = set()
+        for run in list(store.runs):
+            if run not in archived or store.runs[run] != _directory_stamp(archived[run]):
+                touched |= store.remove_run(run)
+        new_runs = sorted(run for run in archived if run not in store.runs)
+        for run in new_runs:
+            logger.info("Adding %s to the drift series", run)
+            touched |= store.add_run(archived[run])
+        for key in touched:
+            series = store.series[key]
+            series['points'].sort(key=lambda p: (p['date'], p['run']))
+            score_series(series)
+        store.series = {key: s for key, s in store.series.items() if s['points']}
+        if touched or new_runs:
+            store.save()
+        logger.info("Drift: %d new runs, %d series updated, %d series", len(new_runs), len(touched), len(store.series))
+        return store
+
+def format_drift_flag(flag):
+    changes = ", ".join(f"{m} {flag['baseline'][m]:.3f}->{flag['recent'][m]:.3f} (z={flag['z'][m]:+.1f})"
+                        for m in flag['shifts'])
+    return f"{flag['device']} {flag['test']} site{flag['site']} @ {flag['run']}: {changes}"
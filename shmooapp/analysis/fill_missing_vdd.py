@@ -1,6 +1,12 @@
 import os
 import re
-from shmooapp.analysis.common_utils import VDD_PATTERNS, extract_y_axis_info
+import logging
+from shmooapp.analysis.common_utils import VDD_PATTERNS, PLOT_END_PATTERN, extract_y_axis_info, generate_vdd_axis_mv, format_mv
+from shmooapp.analysis.shmoo_header import load_test_header, keep_test_header
+from shmooapp.analysis.plot_reader import note_plot_write
+from shmooapp.analysis import metrics
+
+logger = logging.getLogger(__name__)
 
 
 def sanitize_filename(filename):
@@ -15,123 +21,120 @@ def sanitize_filename(filename):
     """
     return re.sub(r'[\\/:"*?<>|]+', "_", filename)
 
-def fill_missing_vdd(lines, max_vdd, min_vdd, step):
+def fill_missing_vdd(lines, max_vdd, min_vdd, step, data_start=None):
     """
     Fills in missing VDD values in the data rows based on the step.
+    The VDD axis is generated once from the Y-Axis header as integer millivolts,
+    and each missing label is taken from the axis by its row index.
 
     Args:
         lines (list): List of lines from the log file.
         max_vdd (float): Maximum VDD value.
         min_vdd (float): Minimum VDD value.
         step (float): Step value for VDD.
+        data_start (int): First data row if known from the ShmooHeader; searched if None.
 
     Returns:
         list: Modified list of lines with missing VDD values filled in.
     """
     # Identify the start of the Shmoo plot data block
     # The data block starts two lines below the line containing only "VDD"
-    data_start = None
-    for i, line in enumerate(lines):
-        if line.strip() in VDD_PATTERNS:
-            data_start = i + 2  # Two lines below "VDD" line
-            break
+    if data_start is None or data_start - 2 >= len(lines) or lines[data_start - 2].strip() not in VDD_PATTERNS:
+        data_start = None
+        for i, line in enumerate(lines):
+            if line.strip() in VDD_PATTERNS:
+                data_start = i + 2  # Two lines below "VDD" line
+                break
 
     if data_start is None:
         raise ValueError("Shmoo plot data block not found.")
 
     # Assuming data ends when lines no longer contain plot data
-    # This can be an empty line or a line that doesn't start with spaces or doesn't resemble data
-    data_end = data_start
+    # Check if the line is the terminating line
+    # (e.g., '  V   +---------+*--------+--------+')
+    # (e.g., '  V   *---------+---------+--------+')
+    # or a line that doesn't start with spaces
+    data_end = len(lines)
     for i in range(data_start, len(lines)):
-        '''if not lines[i].strip():
-            data_end = i
-            break'''
         current_line = lines[i]
-        # Check if the line is the terminating line
-        # (e.g., '  V   +---------+*--------+--------+')
-        # (e.g., '  V   *---------+---------+--------+')
-        terminating_match = re.match(r'^\s*V\s+[\+|\*]', current_line)
-        if terminating_match:
+        if PLOT_END_PATTERN.match(current_line) or not current_line[:1].isspace():
             data_end = i
             break
-        if not re.match(r'^\s', lines[i]):
-            data_end = i
-            break
-    else:
-        data_end = len(lines)
 
-    # Initialize current_vdd to max_vdd
-    current_vdd = max_vdd
+    # VDD of every row, by row index
+    vdd_axis_mv = generate_vdd_axis_mv(max_vdd, min_vdd, step)
+    if data_end - data_start > len(vdd_axis_mv):
+        raise ValueError(f"Plot has {data_end - data_start} rows but Y-Axis has {len(vdd_axis_mv)} steps.")
 
-    # To preserve leading_spaces
+    # To preserve leading_spaces, take them from the first labeled row
+    leading_spaces = None
     for i in range(data_start, data_end):
         line = lines[i]
-        leading_spaces = re.match(r'^(\s*)\d+\.\d*\s.*', line).group(1)
-        if leading_spaces:
+        stripped_line = line.lstrip()
+        if stripped_line[:1].isdigit():
+            leading_spaces = line[:len(line) - len(stripped_line)]
             break
     if leading_spaces is None:
         raise ValueError("leading_spaces can not be set.")
-    
+
     # start loop
-    for i in range(data_start, data_end):
+    for row_index, i in enumerate(range(data_start, data_end)):
         line = lines[i]
-        # Check if the line starts with a VDD value (allowing leading spaces)
-        vdd_match = re.match(r'^\s*(\d+\.\d+)\s+(.*)', line)
-        if vdd_match:
-            # Line has VDD value
-            current_vdd = float(vdd_match.group(1))
+        stripped_line = line.lstrip()
+        # Line already starts with a VDD value (allowing leading spaces)
+        if stripped_line[:1].isdigit():
             continue
-        else:
-            # Line is missing VDD value, calculate it by adding step
-            current_vdd += step  # Step is negative, so this decreases VDD
-            # Clamp current_vdd to not go below min_vdd
-            if current_vdd < min_vdd - 1e-6:  # Allowing a small epsilon for floating point
-                current_vdd = min_vdd  # Clamp to min_vdd to avoid going below
-            # Insert the calculated VDD at the beginning of the line with proper formatting
-            # Assuming VDD should be formatted to three decimal places
-            new_vdd_str = f"{current_vdd:.3f}   "
-            # Check if the line starts with '*!' after stripping leading spaces
-            stripped_line = line.lstrip()
-            if stripped_line.startswith("*!") or stripped_line.startswith("*P"):
-                # Remove one space to account for the '*' character
-                new_vdd_str = f"{current_vdd:.3f}  "
-            # Preserve the original indentation by extracting leading spaces
-            lines[i] = leading_spaces + new_vdd_str + line.lstrip()
+        # Insert the VDD of this row index with three decimal places
+        new_vdd_str = f"{format_mv(vdd_axis_mv[row_index])}   "
+        # Check if the line starts with '*!' after stripping leading spaces
+        if stripped_line.startswith("*!") or stripped_line.startswith("*P"):
+            # Remove one space to account for the '*' character
+            new_vdd_str = f"{format_mv(vdd_axis_mv[row_index])}  "
+        # Preserve the original indentation by extracting leading spaces
+        lines[i] = leading_spaces + new_vdd_str + stripped_line
 
     return lines
 
-def process_log_file(file_path):
+def process_log_file(file_path, header=None):
     """
     Processes a single log file to fill in missing VDD values.
 
     Args:
         file_path (str): Path to the log file.
+        header (ShmooHeader): Header of the file from load_test_header, or None.
     """
     with open(file_path, 'r') as file:
         lines = file.readlines()
 
     try:
-        max_vdd, min_vdd, step = extract_y_axis_info(lines)
+        max_vdd, min_vdd, step = header.y_axis_info() if header else extract_y_axis_info(lines)
     except ValueError as e:
-        print(f"Error processing {file_path}: {e}")
+        logger.error("Error processing %s: %s", file_path, e)
+        metrics.inc(metrics.ERRORS, stage="vdd")
         return
 
     try:
-        modified_lines = fill_missing_vdd(lines, max_vdd, min_vdd, step)
+        modified_lines = fill_missing_vdd(lines, max_vdd, min_vdd, step, header.data_start if header else None)
     except ValueError as e:
-        print(f"Error processing {file_path}: {e}")
+        logger.error("Error processing %s: %s", file_path, e)
+        metrics.inc(metrics.ERRORS, stage="vdd")
         return
 
     # Write the modified lines back to the file
     with open(file_path, 'w') as file:
         file.writelines(modified_lines)
+    note_plot_write(file_path)
 
-    print(f"Updated VDD: {os.path.basename(file_path)}")
+    logger.debug("Updated VDD: %s", os.path.basename(file_path))
+    metrics.inc(metrics.FILES_WRITTEN, kind="vdd")
 
 
 def update_files_for_vdd(input_directory):
     # Process all .log files in the input directory
+    test_header = load_test_header(input_directory)
     for filename in sorted(os.listdir(input_directory)):
         if filename.endswith('.log'):
             file_path = os.path.join(input_directory, filename)
-            process_log_file(file_path)
\ No newline at end of file
+            process_log_file(file_path, test_header.for_site(filename))
+    # only data rows were rewritten, the headers stay valid
+    keep_test_header(input_directory, test_header)
@@ -0,0 +1,407 @@
+import os
+import re
+import json
+import zlib
+import struct
+import logging
+from pathlib import Path
+from shmooapp.analysis.common_utils import (
+    VDD_PATTERNS, PLOT_END_PATTERN, extract_x_axis_info, extract_y_axis_info,
+    generate_vdd_axis_mv, format_mv, generate_aggfile_name,
+)
+from shmooapp.analysis.xor_shmoo import render_xor_site, xor_test_dir, XOR_SPARSE_SUFFIX
+from shmooapp.analysis import metrics
+
+logger = logging.getLogger(__name__)
+
+# Heatmaps of shmoo grids (site plots, aggregates and XOR masks).
+# PNG images are encoded with zlib only: each grid row is turned into a pixel row by
+# joining per-cell byte strings, and the pixel row is repeated for the cell height,
+# so no per-pixel loop runs in Python. SVG images carry the axis labels.
+IMAGES_SUFFIX = ".images"
+PNG_SCALE = 8
+THUMB_SCALE = 2
+TICK_EVERY = 5
+TICK_SIZE = 4
+
+PLOT_PALETTE = {
+    'P': (52, 168, 83),     # pass
+    '.': (234, 67, 53),     # fail
+    '!': (234, 67, 53),     # fail on a tick column
+    'X': (234, 67, 53),
+    '?': (160, 160, 160),
+}
+XOR_PALETTE = {
+    'P': (245, 245, 245),
+    '.': (245, 245, 245),   # same as the aggregate
+    '!': (245, 245, 245),
+    'X': (234, 67, 53),     # differs from the aggregate
+    '?': (160, 160, 160),   # XOR could not be computed
+}
+AXIS_COLOR = (60, 60, 60)
+MARKER_COLOR = (20, 20, 20)
+BACKGROUND_COLOR = (255, 255, 255)
+
+# Grid row of a site, aggregated or XOR plot, with optional VDD label and '*' marker
+GRID_ROW_PATTERN = re.compile(r'^\s*(?:\d+\.\d+)?\s*(\*?)([!.PX?]+)')
+X_CENTER_PATTERN = re.compile(r"X-Axis\s*:.*\]\s*step\s*\S+\s*ns\s*\(\s*([-+]?[\d.]+)\s*ns\s*\)", re.IGNORECASE)
+
+
+class ShmooGrid:
+    """
+    Cells of a shmoo plot with its axes, top row (highest VDD) first.
+    """
+    def __init__(self, rows, star_row, vdd_labels, x_values, x_center_col):
+        self.rows = rows
+        self.star_row = star_row
+        self.vdd_labels = vdd_labels
+        self.x_values = x_values
+        self.x_center_col = x_center_col
+
+    @property
+    def height(self):
+        return len(self.rows)
+
+    @property
+    def width(self):
+        return max((len(row) for row in self.rows), default=0)
+
+
+def parse_grid(lines):
+    """
+    Parses the grid and the axes of a plot (site log, aggregated log or rendered XOR log).
+
+    Args:
+        lines (list): Lines of the plot.
+
+    Returns:
+        ShmooGrid
+    """
+    data_start = None
+    for i, line in enumerate(lines):
+        if line.strip() in VDD_PATTERNS:
+            data_start = i + 2  # Two lines below "VDD" line
+            break
+    if data_start is None:
+        raise ValueError("Shmoo plot data block not found.")
+
+    rows = []
+    star_row = None
+    for line in lines[data_start:]:
+        if PLOT_END_PATTERN.match(line) or not line[:1].isspace():
+            break
+        match = GRID_ROW_PATTERN.match(line)
+        if match:
+            if match.group(1):
+                star_row = len(rows)
+            rows.append(match.group(2))
+
+    width = max((len(row) for row in rows), default=0)
+    # Pad short rows so that every row has the same number of cells
+    rows = [row.ljust(width, '?') for row in rows]
+
+    try:
+        vdd_labels = [format_mv(mv) for mv in generate_vdd_axis_mv(*extract_y_axis_info(lines))]
+    except ValueError:
+        vdd_labels = []
+    if len(vdd_labels) != len(rows):
+        vdd_labels = [str(i) for i in range(len(rows))]
+
+    x_center_col = None
+    try:
+        x_start, _, x_step = extract_x_axis_info(lines)
+        x_values = [x_start + i * x_step for i in range(width)]
+        for line in lines[:data_start]:
+            match = X_CENTER_PATTERN.search(line)
+            if match and x_step:
+                col = round((float(match.group(1)) - x_start) / x_step)
+                x_center_col = col if 0 <= col < width else None
+                break
+    except ValueError:
+        x_values = list(range(width))
+    return ShmooGrid(rows, star_row, vdd_labels, x_values, x_center_col)
+
+def read_grid(file_path):
+    """
+    Reads a plot file with its physical axes.
+
+    Returns:
+        tuple: (ShmooGrid, VDD in V per row, X value per column); an axis whose
+               header cannot be parsed has None for every entry.
+    """
+    with open(file_path, 'r') as f:
+        lines = f.readlines()
+    grid = parse_grid(lines)
+    try:
+        vdd = [mv / 1000 for mv in generate_vdd_axis_mv(*extract_y_axis_info(lines))]
+    except ValueError:
+        vdd = []
+    if len(vdd) != grid.height:
+        vdd = [None] * grid.height
+    try:
+        x_start, _, x_step = extract_x_axis_info(lines)
+        x = [x_start + i * x_step for i in range(grid.width)]
+    except ValueError:
+        x = [None] * grid.width
+    return grid, vdd, x
+
+
+# PNG
+def _png_chunk(tag, data):
+    return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+def encode_png(width, height, scanlines):
+    """
+    Encodes 8-bit RGB scanlines (bytes of width * 3) as a PNG image.
+    """
+    raw = b''.join(b'\x00' + line for line in scanlines)  # filter type 0 per scanline
+    return (b'\x89PNG\r\n\x1a\n'
+            + _png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+            + _png_chunk(b'IDAT', zlib.compress(raw, 6))
+            + _png_chunk(b'IEND', b''))
+
+def render_png(grid, palette=PLOT_PALETTE, scale=PNG_SCALE, axes=True):
+    """
+    Renders a grid as a PNG heatmap with axis ticks every TICK_EVERY cells and a frame
+    around the op-center cell.
+
+    Returns:
+        bytes: PNG image.
+    """
+    margin = TICK_SIZE + 1 if axes else 0
+    width = margin + grid.width * scale
+    height = grid.height * scale + margin
+    cells = {ch: bytes(rgb) * scale for ch, rgb in palette.items()}
+    background = bytes(BACKGROUND_COLOR)
+    axis = bytes(AXIS_COLOR)
+
+    plain_margin = background * margin
+    tick_margin = background * 1 + axis * TICK_SIZE if axes else b''
+    scanlines = []
+    for r, row in enumerate(grid.rows):
+        pixels = b''.join(map(cells.__getitem__, row))
+        for dy in range(scale):
+            tick = axes and r % TICK_EVERY == 0 and dy == 0
+            scanlines.append((tick_margin if tick else plain_margin) + pixels)
+    if axes:
+        ticks = bytearray(background * width)
+        for c in range(0, grid.width, TICK_EVERY):
+            x = margin + c * scale
+            ticks[x * 3:(x + 1) * 3] = axis
+        plain = background * width
+        scanlines.extend([plain] + [bytes(ticks)] * TICK_SIZE)
+
+    # Op-center marker: frame around the cell at (star row, X center)
+    if grid.star_row is not None and grid.x_center_col is not None and scale >= 3:
+        x0 = margin + grid.x_center_col * scale
+        marker = bytes(MARKER_COLOR)
+        for dy in range(scale):
+            y = grid.star_row * scale + dy
+            line = bytearray(scanlines[y])
+            if dy in (0, scale - 1):
+                line[x0 * 3:(x0 + scale) * 3] = marker * scale
+            else:
+                line[x0 * 3:(x0 + 1) * 3] = marker
+                line[(x0 + scale - 1) * 3:(x0 + scale) * 3] = marker
+            scanlines[y] = bytes(line)
+    return encode_png(width, height, scanlines)
+
+
+# SVG
+_RUN_PATTERN = re.compile(r'(.)\1*')
+
+def _rgb(color):
+    return "#%02x%02x%02x" % color
+
+def render_svg(grid, palette=PLOT_PALETTE, title="", cell=12):
+    """
+    Renders a grid as an SVG heatmap with VDD / period axis labels and the op-center marker.
+    Runs of equal cells in a row are drawn as one rectangle.
+
+    Returns:
+        str: SVG document.
+    """
+    left, top, bottom = 60, 24 if title else 8, 40
+    width = left + grid.width * cell + 8
+    height = top + grid.height * cell + bottom
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+             f'font-family="monospace" font-size="10">',
+             f'<rect width="{width}" height="{height}" fill="{_rgb(BACKGROUND_COLOR)}"/>']
+    if title:
+        parts.append(f'<text x="{left}" y="14" font-size="12">{_escape(title)}</text>')
+    fills = {ch: _rgb(rgb) for ch, rgb in palette.items()}
+    # Cells of the same color form one run, e.g. '!' and '.' of a plot
+    representative = {}
+    same_color = str.maketrans({ch: representative.setdefault(rgb, ch) for ch, rgb in palette.items()})
+    for r, row in enumerate(grid.rows):
+        y = top + r * cell
+        for m in _RUN_PATTERN.finditer(row.translate(same_color)):
+            start, end = m.span()
+            parts.append(f'<rect x="{left + start * cell}" y="{y}" width="{(end - start) * cell}" '
+                         f'height="{cell}" fill="{fills[m.group(1)]}"/>')
+
+    # Axes
+    axis = _rgb(AXIS_COLOR)
+    y_axis = top + grid.height * cell
+    parts.append(f'<path d="M{left},{top} V{y_axis} H{left + grid.width * cell}" stroke="{axis}" fill="none"/>')
+    for r in range(0, grid.height, TICK_EVERY):
+        y = top + r * cell + cell / 2
+        parts.append(f'<text x="{left - 4}" y="{y + 3}" text-anchor="end">{grid.vdd_labels[r]}</text>')
+    for c in range(0, grid.width, TICK_EVERY):
+        x = left + c * cell + cell / 2
+        parts.append(f'<text x="{x}" y="{y_axis + 14}" text-anchor="middle">{grid.x_values[c]:g}</text>')
+    parts.append(f'<text x="{left + grid.width * cell / 2}" y="{y_axis + 32}" text-anchor="middle">Period [ns]</text>')
+    parts.append(f'<text x="4" y="{top - 2}">VDD [V]</text>')
+
+    if grid.star_row is not None and grid.x_center_col is not None:
+        parts.append(f'<rect x="{left + grid.x_center_col * cell}" y="{top + grid.star_row * cell}" '
+                     f'width="{cell}" height="{cell}" fill="none" stroke="{_rgb(MARKER_COLOR)}" stroke-width="2"/>')
+    parts.append('</svg>')
+    return "\n".join(parts) + "\n"
+
+def _escape(text):
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+# Batch rendering
+def generate_images_dir(test_dir):
+    # e.g. out.plot/<log>/<test>.images next to the test directory
+    return str(test_dir).rstrip(os.sep) + IMAGES_SUFFIX
+
+def image_paths(out_base):
+    return {'png': out_base + ".png", 'svg': out_base + ".svg", 'thumb': out_base + ".thumb.png"}
+
+def collect_image_tasks(test_dir):
+    """
+    Lists the plots of a test to render: every site, the existing aggregates and the
+    existing sparse XOR files (XOR is not computed here).
+
+    Returns:
+        list: (kind, source, site, out_base) tuples.
+    """
+    images_dir = generate_images_dir(test_dir)
+    tasks = []
+    for filename in sorted(os.listdir(test_dir)):
+        if filename.endswith('.log'):
+            tasks.append(("site", os.path.join(test_dir, filename), None,
+                          os.path.join(images_dir, Path(filename).stem)))
+    for mode in ("OR", "AND", "Majority"):
+        aggfile = generate_aggfile_name(test_dir, mode)
+        if os.path.exists(aggfile):
+            tasks.append(("aggregate", aggfile, None, os.path.join(images_dir, f"aggregated_{mode}")))
+    for prefix in ("OR_XOR", "AND_XOR", "MajorityVote_XOR"):
+        sparse_path = str(test_dir).rstrip(os.sep) + "." + prefix + XOR_SPARSE_SUFFIX
+        if os.path.exists(sparse_path):
+            with open(sparse_path, 'r') as f:
+                sites = sorted(json.load(f)['sites'])
+            for site in sites:
+                tasks.append(("xor", sparse_path, site, os.path.join(images_dir, prefix, Path(site).stem)))
+    return tasks
+
+def render_image_task(task):
+    """
+    Renders PNG, SVG and thumbnail of one plot unless they are newer than the source.
+
+    Returns:
+        dict: Image paths and whether they were 'cached'.
+    """
+    kind, source, site, out_base = task
+    paths = image_paths(out_base)
+    source_mtime = os.stat(source).st_mtime_ns
+    if all(os.path.exists(p) and os.stat(p).st_mtime_ns >= source_mtime for p in paths.values()):
+        return dict(paths, cached=True)
+
+    if kind == "xor":
+        with open(source, 'r') as f:
+            text = render_xor_site(json.load(f), site, xor_test_dir(source))
+        palette = XOR_PALETTE
+        title = f"{site} ({Path(source).name[:-len(XOR_SPARSE_SUFFIX)].rsplit('.', 1)[-1]})"
+    else:
+        with open(source, 'r') as f:
+            text = f.read()
+        palette = PLOT_PALETTE
+        title = Path(source).name
+    grid = parse_grid(text.splitlines(keepends=True))
+
+    os.makedirs(os.path.dirname(out_base), exist_ok=True)
+    with open(paths['png'], 'wb') as f:
+        f.write(render_png(grid, palette))
+    with open(paths['thumb'], 'wb') as f:
+        f.write(render_png(grid, palette, scale=THUMB_SCALE, axes=False))
+    with open(paths['svg'], 'w') as f:
+        f.write(render_svg(grid, palette, title))
+    return dict(paths, cached=False)
+
+def render_images(tasks, max_workers=None):
+    """
+    Renders image tasks, in parallel worker processes when there are several.
+
+    Args:
+        tasks (list): Tasks from collect_image_tasks.
+        max_workers (int): Number of processes; 1 renders in the calling thread. None
+            uses every CPU, for standalone runs; jobs pass their share of the CPUs
+            (JobScheduler.processes_per_job).
+
+    Returns:
+        list: Results of render_image_task in the order of tasks (None for failed plots).
+    """
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = min(len(tasks), max_workers)
+    if max_workers <= 1 or len(tasks) <= 1:
+        results = [_render_safely(task) for task in tasks]
+    else:
+        # spawn, since the caller may be a multi-threaded server process; imported here,
+        # as the spawned workers import this module again and should start quickly
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            results = list(executor.map(_render_safely, tasks, chunksize=max(1, len(tasks) // (max_workers * 4))))
+    rendered = sum(1 for r in results if r is not None and not r['cached'])
+    metrics.inc(metrics.FILES_WRITTEN, 3 * rendered, kind="image")
+    return results
+
+def _render_safely(task):
+    try:
+        return render_image_task(task)
+    except (ValueError, OSError, KeyError) as e:
+        logger.error("Error rendering %s: %s", task[1], e)
+        metrics.inc(metrics.ERRORS, stage="image")
+        return None
+
+def list_test_images(test_dir):
+    """
+    Lists the rendered images of a test.
+
+    Returns:
+        list: Dicts with 'kind' (site, aggregate, xor), 'group' (XOR prefix or ""),
+              'name' and the 'png', 'svg' and 'thumb' paths, for images that exist.
+    """
+    images = []
+    for kind, source, site, out_base in collect_image_tasks(test_dir):
+        paths = image_paths(out_base)
+        if all(os.path.exists(p) for p in paths.values()):
+            group = os.path.basename(os.path.dirname(out_base)) if kind == "xor" else ""
+            images.append(dict(paths, kind=kind, group=group, name=os.path.basename(out_base)))
+    return images
+
+def render_test_images(test_dir, max_workers=1):
+    """
+    Renders the images of a single test (sites, aggregates, existing XOR masks).
+
+    Returns:
+        list: (task, result) pairs.
+    """
+    tasks = collect_image_tasks(test_dir)
+    return list(zip(tasks, render_images(tasks, max_workers)))
+
+def render_log_images(test_dirs, max_workers=None):
+    """
+    Renders the images of all tests of a log in one parallel batch.
+
+    Returns:
+        int: Number of rendered plots.
+    """
+    tasks = [task for test_dir in test_dirs for task in collect_image_tasks(test_dir)]
+    results = render_images(tasks, max_workers)
+    return sum(1 for r in results if r is not None)
@@ -0,0 +1,418 @@
+import os
+import re
+import json
+import time
+import logging
+import threading
+from shmooapp.analysis.create_shmooplot_files import SectionAssembler, TestSplitter
+from shmooapp.analysis.pipeline import run_test_pipeline
+from shmooapp.analysis.heatmap import render_test_images
+from shmooapp.analysis.profiling import stage
+from shmooapp.analysis import metrics
+
+logger = logging.getLogger(__name__)
+
+# Watch-folder ingestion: the tester writes its datalog into a drop directory over a
+# run of tens of minutes ("Started at" ... "Ended at"). IngestDaemon polls the drop
+# directory, tails every log file that appears there and writes each TestMethod Shmoo
+# section as soon as the next separator shows it is complete. A test is analyzed
+# (run_test_pipeline, heatmaps) once all of its sites are written, so its margins and
+# anomalies are visible while the run goes on and a bad shmoo can be stopped early.
+# A log is finished by the "end testflow report data" line, or after it has not grown
+# for INGEST_IDLE_TIMEOUT seconds (the tester was stopped).
+# Tests are analyzed as jobs of the scheduler, so ingestion counts against the
+# concurrency cap: a test is submitted as soon as the splitter reports it complete and
+# its result is collected on a later poll, so the daemon keeps tailing meanwhile. Before
+# a repeated test title overwrites a test, its pending analysis is waited for. Finished logs are recorded in INGEST_STATE_FILE of the output
+# directory with the inode and size they had, and only their summary is kept in
+# memory; a restart does not tail them again unless they were replaced or grew.
+INGEST_POLL_INTERVAL = 2.0
+INGEST_IDLE_TIMEOUT = 30 * 60
+INGEST_READ_SIZE = 1 << 20   # bytes read from one log per poll, so no log starves the others
+INGEST_SUFFIXES = ('.log',)
+INGEST_STATE_FILE = "ingested.json"
+INGEST_STATE_VERSION = 1
+
+LOG_STARTED_PATTERN = re.compile(r'Started at:\s*(\d{8}\s+\d{6})')
+LOG_END_PATTERN = re.compile(r'end testflow report data')
+
+LOG_TAILING = "tailing"
+LOG_DONE = "done"
+LOG_STALLED = "stalled"
+
+
+class LogTailer:
+    """
+    Follows one datalog while it is written and splits it into test directories.
+
+    Args:
+        log_path (str): Path to the datalog.
+        output_dir (str): Directory receiving <log>/<test> directories.
+        on_complete (callable): Optional callback(test_dir) as soon as a test is complete.
+        before_write (callable): Optional callback(test_dir) before a test that was
+            reported complete is written again, see TestSplitter.
+    """
+    def __init__(self, log_path, output_dir, on_complete=None, before_write=None):
+        self.log_path = log_path
+        self.output_dir = output_dir
+        self.on_complete = on_complete
+        self.before_write = before_write
+        self.state = LOG_TAILING
+        self.started_at = ""
+        self.last_growth = time.monotonic()
+        self._open_splitter()
+
+    def _open_splitter(self):
+        self.splitter = TestSplitter(self.log_path, self.output_dir, before_write=self.before_write)
+        self.log_dir = self.splitter.output_basedir
+        self._assembler = SectionAssembler()
+        self._offset = 0
+        self._partial = b""
+        self._inode = None
+
+    def poll(self, now=None):
+        """
+        Reads what was appended since the last poll.
+
+        Returns:
+            list: Test directories that became complete.
+        """
+        now = time.monotonic() if now is None else now
+        try:
+            stat = os.stat(self.log_path)
+        except FileNotFoundError:
+            logger.warning("%s disappeared while it was tailed", self.log_path)
+            return self._finish(LOG_STALLED)
+        if self._inode is not None and (stat.st_ino != self._inode or stat.st_size < self._offset):
+            # the tester started the log again: split it from the beginning
+            logger.warning("%s was truncated or replaced, splitting it again", self.log_path)
+            if self.before_write is not None:
+                for subdir in self.splitter.subdirs:
+                    self.before_write(subdir)
+            self._open_splitter()
+        self._inode = stat.st_ino
+        if stat.st_size == self._offset:
+            if now - self.last_growth > INGEST_IDLE_TIMEOUT:
+                logger.warning("%s has not grown for %d s, finishing it", self.log_path, INGEST_IDLE_TIMEOUT)
+                return self._finish(LOG_STALLED)
+            return []
+        self.last_growth = now
+
+        with open(self.log_path, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read(INGEST_READ_SIZE)
+        self._offset += len(data)
+        # only complete lines are split; the rest waits for the next poll
+        data = self._partial + data
+        end = data.rfind(b"\n") + 1
+        self._partial = data[end:]
+        completed = []
+        for line in data[:end].decode('utf-8', errors='replace').splitlines(keepends=True):
+            completed += self._feed_line(line)
+            if self.state != LOG_TAILING:
+                break
+        return completed
+
+    def _feed_line(self, line):
+        if not self.started_at:
+            match = LOG_STARTED_PATTERN.search(line)
+            if match:
+                self.started_at = match.group(1)
+        if LOG_END_PATTERN.search(line):
+            return self._finish(LOG_DONE)
+        completed = []
+        for section in self._assembler.feed(line):
+            completed += self._report(self.splitter.feed(section))
+        return completed
+
+    def _report(self, completed):
+        # each test is reported right away, before the next section can overwrite it
+        if self.on_complete is not None:
+            for test in completed:
+                self.on_complete(test)
+        return completed
+
+    def _finish(self, state):
+        completed = []
+        for section in self._assembler.close():
+            completed += self._report(self.splitter.feed(section))
+        completed += self._report(self.splitter.finish())
+        self.state = state
+        logger.info("Ingested %d sections into %d tests from %s (%s)",
+                    self.splitter.sections, len(self.splitter.subdirs), self.log_path, state)
+        return completed
+
+
+def analyze_ingested_test(test):
+    """
+    Job body for a test of a datalog being ingested: per-test stages and heatmaps.
+
+    Returns:
+        float: Anomaly severity of the test.
+    """
+    with stage("test", test=test):
+        result = run_test_pipeline(test)
+    with stage("render_test_images", test=test):
+        render_test_images(test)
+    return result['anomalies']['severity']
+
+
+class IngestDaemon:
+    """
+    Watches a drop directory and analyzes the tests of every datalog written into it.
+
+    Args:
+        drop_dir (str): Directory the testers write their datalogs into.
+        output_dir (str): Directory receiving <log>/<test> directories.
+        on_event (callable): Optional callback(kind, log_path, test) from the daemon
+            thread; kind is "log" (new log), "test" (test analyzed) or "done" (log finished).
+        poll_interval (float): Seconds between polls.
+    """
+    def __init__(self, drop_dir, output_dir, on_event=None, poll_interval=INGEST_POLL_INTERVAL):
+        self.drop_dir = drop_dir
+        self.output_dir = output_dir
+        self.on_event = on_event
+        self.poll_interval = poll_interval
+        self.state_path = os.path.join(output_dir, INGEST_STATE_FILE)
+        self._tailers = {}     # log path -> LogTailer
+        self._results = {}     # log path -> {test directory: anomaly severity}
+        self._pending = {}     # test directory -> (log path, analysis job)
+        self._finished = self._load_state()   # log path -> summary, see _retire
+        self._published = []
+        self.revision = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError as e:
+            logger.warning("Ignoring %s: %s", self.state_path, e)
+            return {}
+        if data.get('version') != INGEST_STATE_VERSION:
+            return {}
+        return data['logs']
+
+    def _save_state(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        with self._lock:
+            logs = dict(self._finished)
+        tmp_path = f"{self.state_path}.tmp-{os.getpid()}"
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': INGEST_STATE_VERSION, 'logs': logs}, f)
+        os.replace(tmp_path, self.state_path)
+        metrics.inc(metrics.FILES_WRITTEN, kind="ingest")
+
+    def scan(self):
+        """
+        Starts tailing the log files that appeared in the drop directory, except for
+        finished logs that did not change since.
+        """
+        os.makedirs(self.drop_dir, exist_ok=True)
+        changed = False
+        for filename in sorted(os.listdir(self.drop_dir)):
+            log_path = os.path.join(self.drop_dir, filename)
+            if not filename.endswith(INGEST_SUFFIXES) or log_path in self._tailers or not os.path.isfile(log_path):
+                continue
+            finished = self._finished.get(log_path)
+            if finished is not None:
+                stat = os.stat(log_path)
+                if (stat.st_ino, stat.st_size) == (finished['inode'], finished['size']):
+                    continue
+                logger.info("%s changed after it was ingested", log_path)
+                with self._lock:
+                    del self._finished[log_path]
+                changed = True
+            logger.info("Tailing %s", log_path)
+            with self._lock:
+                self._tailers[log_path] = LogTailer(
+                    log_path, self.output_dir, before_write=self._wait_for_analysis,
+                    on_complete=lambda test, log_path=log_path: self._analyze(log_path, test))
+                self._results[log_path] = {}
+            self._emit("log", log_path)
+        # finished logs removed from the drop directory are forgotten
+        removed = [log_path for log_path in self._finished if not os.path.exists(log_path)]
+        if removed:
+            with self._lock:
+                for log_path in removed:
+                    del self._finished[log_path]
+            changed = True
+        if changed:
+            self._save_state()
+
+    def poll_once(self):
+        """
+        Scans the drop directory, reads all logs being written, submits the tests they
+        completed and collects the analyses that finished.
+        """
+        self.scan()
+        for log_path, tailer in list(self._tailers.items()):
+            if tailer.state == LOG_TAILING:
+                tailer.poll()
+        self._collect()
+        for log_path, tailer in list(self._tailers.items()):
+            # a log is done once the analyses of all its tests are collected
+            if tailer.state != LOG_TAILING and not any(p[0] == log_path for p in self._pending.values()):
+                self._emit("done", log_path)
+                self._retire(log_path, tailer)
+
+    def _analyze(self, log_path, test):
+        # imported here, the scheduler is not needed to import the analysis modules
+        from shmooapp.analysis.jobs import job_scheduler, PRIORITY_BATCH
+        job = job_scheduler.submit(analyze_ingested_test, test, priority=PRIORITY_BATCH,
+                                   name=f"ingest {os.path.basename(test)}")
+        self._pending[test] = (log_path, job)
+
+    def _wait_for_analysis(self, test):
+        # a repeated test title: its files must not change under a running analysis
+        if test in self._pending:
+            self._pending[test][1].future.exception()
+            self._collect()
+
+    def _collect(self):
+        for test, (log_path, job) in list(self._pending.items()):
+            if not job.future.done():
+                continue
+            del self._pending[test]
+            try:
+                severity = job.future.result()
+            except Exception as e:
+                logger.error("Analysis of %s failed: %s", test, e)
+                metrics.inc(metrics.ERRORS, stage="ingest")
+                continue
+            with self._lock:
+                self._results[log_path][test] = severity
+            self._emit("test", log_path, test)
+
+    def _retire(self, log_path, tailer):
+        # the tailer and its splitter are dropped, the summary is kept and recorded
+        try:
+            stat = os.stat(log_path)
+        except FileNotFoundError:
+            stat = None
+        with self._lock:
+            del self._tailers[log_path]
+            tests = self._results.pop(log_path)
+            if stat is None:
+                return
+            self._finished[log_path] = {
+                'inode': stat.st_ino,
+                'size': stat.st_size,
+                'log_dir': tailer.log_dir,
+                'state': tailer.state,
+                'started_at': tailer.started_at,
+                'sections': tailer.splitter.sections,
+                'tests': tests,
+            }
+        self._save_state()
+
+    def _emit(self, kind, log_path, test=None):
+        if self.on_event is not None:
+            self.on_event(kind, log_path, test)
+
+    def _publish(self):
+        logs = self.snapshot()
+        with self._lock:
+            if logs != self._published:
+                self._published = logs
+                self.revision += 1
+
+    def published(self):
+        """
+        The snapshot taken after the last poll, so that any number of viewers can
+        follow the daemon without reading its logs.
+
+        Returns:
+            tuple: (revision, logs); the revision changes whenever the logs do.
+        """
+        with self._lock:
+            return self.revision, self._published
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                self.poll_once()
+                self._publish()
+            except Exception:
+                logger.exception("Ingestion of %s failed", self.drop_dir)
+                metrics.inc(metrics.ERRORS, stage="ingest")
+            self._stop.wait(self.poll_interval)
+
+    def start(self):
+        if self.is_running():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="shmoo-ingest", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def snapshot(self):
+        """
+        Returns:
+            list: Per log (newest first) 'log', 'log_dir', 'state', 'started_at',
+            'sections', 'current' test and the analyzed 'tests' with their severity.
+        """
+        with self._lock:
+            logs = [{
+                'log': os.path.basename(log_path),
+                'log_dir': tailer.log_dir,
+                'state': tailer.state,
+                'started_at': tailer.started_at,
+                'sections': tailer.splitter.sections,
+                'current': tailer.splitter.current,
+                'tests': dict(self._results[log_path]),
+            } for log_path, tailer in self._tailers.items()]
+            logs += [{
+                'log': os.path.basename(log_path),
+                'log_dir': log['log_dir'],
+                'state': log['state'],
+                'started_at': log['started_at'],
+                'sections': log['sections'],
+                'current': None,
+                'tests': dict(log['tests']),
+            } for log_path, log in self._finished.items()]
+        return sorted(logs, key=lambda log: log['started_at'], reverse=True)
+
+
+def format_ingest_status(log):
+    tests = log['tests']
+    status = (f"{log['log']} [{log['state']}] started {log['started_at'] or '-'}: "
+              f"{log['sections']} sections, {len(tests)} tests analyzed")
+    if tests:
+        worst = max(tests, key=tests.get)
+        status += f", worst {os.path.basename(worst)} severity={tests[worst]:.3f}"
+    return status
+
+
+_daemon = None
+_daemon_lock = threading.Lock()
+
+def get_ingest_daemon():
+    return _daemon
+
+def start_ingest_daemon(drop_dir, output_dir):
+    """
+    Starts the process-wide IngestDaemon (once) and returns it.
+    """
+    global _daemon
+    with _daemon_lock:
+        if _daemon is None:
+            _daemon = IngestDaemon(drop_dir, output_dir)
+        _daemon.start()
+        return _daemon
+
+def stop_ingest_daemon():
+    with _daemon_lock:
+        if _daemon is not None:
+            _daemon.stop()
@@ -0,0 +1,241 @@
+import os
+import re
+import time
+import heapq
+import uuid
+import shutil
+import logging
+import itertools
+import threading
+from datetime import datetime
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+# CPU-bound analysis runs as jobs: at most MAX_CONCURRENT_JOBS run at once
+# (SHMOO_MAX_JOBS), the others wait in a FIFO queue where interactive single-test
+# views go before full-lot runs.
+MAX_JOBS_ENV = "SHMOO_MAX_JOBS"
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+FINISHED_JOBS_KEPT = 100
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+
+def default_max_jobs():
+    value = os.environ.get(MAX_JOBS_ENV, "")
+    if value:
+        return max(1, int(value))
+    return max(1, (os.cpu_count() or 2) // 2)
+
+def new_job_id():
+    # e.g. 20241203-153012-1a2b3c4d, sortable by submission time
+    return f"{datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}"
+
+# Workspaces are kept while they are in use and pruned when a new one is created: a
+# workspace not written for WORKSPACE_MAX_AGE seconds is deleted, and so are the oldest
+# ones beyond WORKSPACE_MAX_COUNT once they were idle for WORKSPACE_MIN_IDLE seconds.
+# Directories are discarded by renaming them (fast, so the caller never waits) and
+# deleting them on a background thread; leftovers of an interrupted delete are pruned too.
+WORKSPACE_MAX_AGE = 7 * 24 * 3600
+WORKSPACE_MAX_COUNT = 50
+WORKSPACE_MIN_IDLE = 3600
+WORKSPACE_NAME_PATTERN = re.compile(r'^\d{8}-\d{6}-[0-9a-f]{8}$')
+DISCARD_MARK = ".discard-"
+
+def create_workspace(root, job_id=None):
+    """
+    Creates an isolated output directory for a job below root (e.g. PLOTSDIR/<job_id>),
+    so that two users processing the same log never write into the same files.
+
+    Returns:
+        str: The workspace directory.
+    """
+    workspace = os.path.join(root, job_id or new_job_id())
+    os.makedirs(workspace, exist_ok=True)
+    return workspace
+
+def discard_directory(path):
+    """
+    Renames a directory out of the way and deletes it on a background thread.
+    """
+    discarded = f"{path}{DISCARD_MARK}{uuid.uuid4().hex[:8]}"
+    try:
+        os.replace(path, discarded)
+    except FileNotFoundError:
+        return
+    threading.Thread(target=_delete_directory, args=(discarded,), name="discard", daemon=True).start()
+
+def _delete_directory(path):
+    shutil.rmtree(path, ignore_errors=True)
+    logger.info("Deleted %s", path)
+
+def workspace_last_used(workspace):
+    # newest mtime of the workspace and the log directories in it
+    mtimes = [os.stat(workspace).st_mtime]
+    with os.scandir(workspace) as entries:
+        mtimes += [entry.stat().st_mtime for entry in entries if entry.is_dir()]
+    return max(mtimes)
+
+def prune_workspaces(root, keep=(), now=None):
+    """
+    Discards the job workspaces below root that are too old or too many.
+
+    Args:
+        root (str): Directory holding the workspaces, e.g. PLOTSDIR.
+        keep (tuple): Workspaces that stay regardless of their age.
+
+    Returns:
+        list: The discarded workspaces.
+    """
+    now = time.time() if now is None else now
+    keep = {os.path.abspath(path) for path in keep}
+    workspaces = []
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if DISCARD_MARK in name:
+            threading.Thread(target=_delete_directory, args=(path,), name="discard", daemon=True).start()
+        elif WORKSPACE_NAME_PATTERN.match(name) and os.path.isdir(path) and os.path.abspath(path) not in keep:
+            try:
+                workspaces.append((workspace_last_used(path), path))
+            except FileNotFoundError:
+                continue
+    workspaces.sort(reverse=True)
+    pruned = [path for i, (last_used, path) in enumerate(workspaces)
+              if now - last_used > WORKSPACE_MAX_AGE
+              or (i + len(keep) >= WORKSPACE_MAX_COUNT and now - last_used > WORKSPACE_MIN_IDLE)]
+    for path in pruned:
+        discard_directory(path)
+    if pruned:
+        logger.info("Pruning %d workspaces below %s", len(pruned), root)
+    return pruned
+
+
+class Job:
+    def __init__(self, fn, args, kwargs, priority, name):
+        self.id = new_job_id()
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.name = name
+        self.seq = 0
+        self.state = JOB_QUEUED
+        self.submitted = datetime.now()
+        self.started = None
+        self.finished = None
+        self.future = Future()
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'priority': self.priority,
+            'state': self.state,
+            'submitted': self.submitted.isoformat(timespec='seconds'),
+            'started': self.started.isoformat(timespec='seconds') if self.started else None,
+            'finished': self.finished.isoformat(timespec='seconds') if self.finished else None,
+        }
+
+
+class JobScheduler:
+    """
+    Runs submitted jobs on worker threads with a global concurrency cap.
+    Queued jobs are ordered by (priority, submission order).
+    """
+    def __init__(self, max_concurrent=None):
+        self.max_concurrent = max_concurrent or default_max_jobs()
+        self._lock = threading.Lock()
+        self._queue = []      # heap of (priority, seq, job)
+        self._seq = itertools.count()
+        self._running = 0
+        self._jobs = {}       # id -> Job, including recently finished ones
+
+    def submit(self, fn, *args, priority=PRIORITY_BATCH, name="", **kwargs):
+        """
+        Queues fn(*args, **kwargs) as a job.
+
+        Returns:
+            Job: Its future holds the result; await it with asyncio.wrap_future(job.future).
+        """
+        job = Job(fn, args, kwargs, priority, name or getattr(fn, '__name__', 'job'))
+        with self._lock:
+            job.seq = next(self._seq)
+            heapq.heappush(self._queue, (priority, job.seq, job))
+            self._jobs[job.id] = job
+        logger.debug("Job %s (%s) queued", job.id, job.name)
+        self._dispatch()
+        return job
+
+    def _dispatch(self):
+        with self._lock:
+            while self._running < self.max_concurrent and self._queue:
+                _, _, job = heapq.heappop(self._queue)
+                job.state = JOB_RUNNING
+                job.started = datetime.now()
+                self._running += 1
+                threading.Thread(target=self._run, args=(job,), name=f"job-{job.id}", daemon=True).start()
+
+    def _run(self, job):
+        try:
+            result = job.fn(*job.args, **job.kwargs)
+        except BaseException as e:
+            logger.error("Job %s (%s) failed: %s", job.id, job.name, e)
+            self._finish(job, JOB_FAILED)
+            job.future.set_exception(e)
+        else:
+            self._finish(job, JOB_DONE)
+            job.future.set_result(result)
+        self._dispatch()
+
+    def _finish(self, job, state):
+        with self._lock:
+            job.finished = datetime.now()
+            job.state = state
+            self._running -= 1
+            self._prune_finished()
+
+    def _prune_finished(self):
+        finished = [j for j in self._jobs.values() if j.state in (JOB_DONE, JOB_FAILED)]
+        for job in sorted(finished, key=lambda j: j.finished)[:-FINISHED_JOBS_KEPT or None]:
+            del self._jobs[job.id]
+
+    def processes_per_job(self):
+        """
+        Worker processes a job may start (e.g. to render heatmaps), so that the jobs
+        running at once do not start more processes than there are CPUs.
+        """
+        return max(1, (os.cpu_count() or 1) // self.max_concurrent)
+
+    def queue_position(self, job):
+        """
+        Returns the 1-based position of a queued job, or 0 if it is already running or finished.
+        """
+        with self._lock:
+            if job.state != JOB_QUEUED:
+                return 0
+            return 1 + sum(1 for priority, seq, _ in self._queue if (priority, seq) < (job.priority, job.seq))
+
+    def describe(self, job):
+        """
+        Short status of a job for the UI.
+        """
+        position = self.queue_position(job)
+        if job.state == JOB_QUEUED:
+            return f"待機中: {position}番目 ({job.name})"
+        if job.state == JOB_RUNNING:
+            return f"実行中: {job.name}"
+        if job.state == JOB_FAILED:
+            return f"エラー: {job.name}"
+        return f"完了: {job.name}"
+
+    def jobs(self):
+        with self._lock:
+            return [job.to_dict() for job in self._jobs.values()]
+
+
+job_scheduler = JobScheduler()
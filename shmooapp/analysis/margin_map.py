@@ -0,0 +1,265 @@
+import os
+import logging
+from shmooapp.analysis.common_utils import collect_archived_logs
+from shmooapp.analysis.shmoo_header import ShmooHeader
+from shmooapp.analysis.heatmap import read_grid
+from shmooapp.analysis.spec_check import test_plot_files
+from shmooapp.analysis import metrics
+
+logger = logging.getLogger(__name__)
+
+# Margins of every cell of a plot as a candidate operating point: on each axis the
+# distance the point can move in both directions and still pass, i.e. the smaller of
+# the distances to the last pass before a fail or the plot's edge on either side.
+# They come from run-length arrays built in one pass over the grid per direction
+# (a pass extends the run of its neighbour by one), so a whole plot costs O(rows x cols).
+# The recommended op-center maximizes the smaller of the two margins, each normalized
+# by the extent of its axis; ties go to the larger sum of the normalized margins.
+#
+# The margins at the header's op-center are ShmooMarginCalculator's one-sided ones:
+#   X margin: X of the op-center minus X of the first pass of its row,
+#   Y margin: number of consecutive passes from the op-center downwards times the Y step.
+# Plots whose X op-center is off the axis (the calculator's out-of-range case, e.g. an
+# X center of 0.000) have none.
+#
+# The pass window is the largest all-pass rectangle of a plot, the 2-D region that the
+# two margins through one cell do not describe. It is found row by row as the largest
+# rectangle under the histogram of the pass runs ending at the row (a stack of
+# increasing heights, so each column is pushed and popped once): O(rows x cols) too.
+# Its size counts one step per cell on both axes, as the calculator's Y margin does.
+PASS_CELL = 'P'
+
+
+def _runs(cells):
+    # length of the pass run ending at each cell, in the order of cells
+    counts = []
+    run = 0
+    for cell in cells:
+        run = run + 1 if cell == PASS_CELL else 0
+        counts.append(run)
+    return counts
+
+def pass_runs(rows):
+    """
+    Run lengths of passes per cell, in the four directions.
+
+    Args:
+        rows (list): Grid rows, top row first, all of the same width.
+
+    Returns:
+        tuple: (left, right, up, down) lists of lists; left[r][c] counts the passes
+        from (r, c) leftwards including the cell, and so on, all 0 on a failing cell.
+    """
+    left = [_runs(row) for row in rows]
+    right = [_runs(row[::-1])[::-1] for row in rows]
+    columns = [_runs(column) for column in zip(*rows)]
+    up = [list(row) for row in zip(*columns)]
+    columns = [_runs(column[::-1])[::-1] for column in zip(*rows)]
+    down = [list(row) for row in zip(*columns)]
+    return left, right, up, down
+
+
+def largest_pass_rectangle(rows):
+    """
+    Largest all-pass rectangle of a grid (histogram/stack method).
+
+    Args:
+        rows (list): Grid rows, top row first; missing cells of shorter rows fail.
+
+    Returns:
+        tuple: (top, left, bottom, right) cell indices, inclusive, or None if the grid has no pass.
+    """
+    width = max((len(row) for row in rows), default=0)
+    heights = [0] * (width + 1)   # the last column stays 0 and empties the stack
+    best_area, best = 0, None
+    for r, row in enumerate(rows):
+        for c in range(width):
+            heights[c] = heights[c] + 1 if c < len(row) and row[c] == PASS_CELL else 0
+        stack = []   # (first column, height), heights increasing
+        for c, height in enumerate(heights):
+            start = c
+            while stack and stack[-1][1] >= height:
+                start, top_height = stack.pop()
+                area = top_height * (c - start)
+                if area > best_area:
+                    best_area, best = area, (r - top_height + 1, start, r, c - 1)
+            stack.append((start, height))
+    return best
+
+
+class MarginMap:
+    """
+    X and Y margins of every cell of a plot.
+
+    Args:
+        grid (ShmooGrid): The plot.
+        vdd (list): VDD in V per row.
+        x (list): X value per column.
+        header (ShmooHeader): Axes of the plot (steps and op-center).
+    """
+    def __init__(self, grid, vdd, x, header):
+        if header.x_step is None or header.y_step is None or None in vdd or None in x:
+            raise ValueError("X-Axis or Y-Axis information not found.")
+        self.grid = grid
+        self.vdd = vdd
+        self.x = x
+        self.header = header
+        self.x_step = abs(header.x_step)
+        self.y_step = abs(header.y_step)
+        self.left, self.right, self.up, self.down = pass_runs(grid.rows)
+
+    @classmethod
+    def read(cls, file_path):
+        grid, vdd, x = read_grid(file_path)
+        return cls(grid, vdd, x, ShmooHeader.read(file_path))
+
+    def x_margin(self, row, col):
+        # passes beyond the cell towards the nearer fail or edge, None on a failing cell
+        run = min(self.left[row][col], self.right[row][col])
+        return (run - 1) * self.x_step if run else None
+
+    def y_margin(self, row, col):
+        run = min(self.up[row][col], self.down[row][col])
+        return (run - 1) * self.y_step if run else None
+
+    def best(self):
+        """
+        Recommended op-center.
+
+        Returns:
+            dict: 'row', 'col', 'vdd', 'x', the two-sided 'x_margin' and 'y_margin' and
+            'score' (the smaller normalized margin), or None if the plot has no pass.
+        """
+        height, width = self.grid.height, self.grid.width
+        x_extent = max(width - 1, 1)
+        y_extent = max(height - 1, 1)
+        best_key, best_cell = None, None
+        for r in range(height):
+            left_row, right_row = self.left[r], self.right[r]
+            up_row, down_row = self.up[r], self.down[r]
+            for c in range(width):
+                if not left_row[c]:
+                    continue
+                nx = (min(left_row[c], right_row[c]) - 1) / x_extent
+                ny = (min(up_row[c], down_row[c]) - 1) / y_extent
+                key = (min(nx, ny), nx + ny)
+                if best_key is None or key > best_key:
+                    best_key, best_cell = key, (r, c)
+        if best_cell is None:
+            return None
+        r, c = best_cell
+        return {
+            'row': r, 'col': c, 'vdd': self.vdd[r], 'x': self.x[c],
+            'x_margin': self.x_margin(r, c), 'y_margin': self.y_margin(r, c),
+            'score': round(best_key[0], 6),
+        }
+
+    def pass_window(self):
+        """
+        Largest all-pass rectangle of the plot.
+
+        Returns:
+            dict: 'rows' and 'cols' (first, last index), 'x' and 'vdd' (low, high value),
+            'width' (X), 'height' (V) and 'area' (X x V), or None if the plot has no pass.
+        """
+        rect = largest_pass_rectangle(self.grid.rows)
+        if rect is None:
+            return None
+        top, left, bottom, right = rect
+        width = (right - left + 1) * self.x_step
+        height = (bottom - top + 1) * self.y_step
+        return {
+            'rows': (top, bottom), 'cols': (left, right),
+            'x': tuple(sorted((self.x[left], self.x[right]))),
+            'vdd': tuple(sorted((self.vdd[top], self.vdd[bottom]))),
+            'width': round(width, 6), 'height': round(height, 6), 'area': round(width * height, 6),
+        }
+
+    def at_op_center(self):
+        """
+        One-sided margins at the header's op-center as ShmooMarginCalculator computes
+        them, or None if the op-center is not on the plot.
+        """
+        c = self.grid.x_center_col
+        if c is None or self.header.y_center is None:
+            return None
+        # the calculator's row: the Y center rounded to a step and clamped to the plot
+        r = round((self.header.y_center - self.header.y_first) / self.header.y_step)
+        r = max(0, min(self.grid.height - 1, r))
+        first = self.grid.rows[r].find(PASS_CELL)
+        # the calculator measures from the header's X center, which may lie between columns
+        x_margin = round(self.header.x_center - self.x[first], 6) if first >= 0 else None
+        return {'row': r, 'col': c, 'vdd': self.vdd[r], 'x': self.x[c],
+                'x_margin': x_margin, 'y_margin': self.down[r][c] * self.y_step}
+
+
+def test_margin_maps(test_dir):
+    """
+    Margin maps of every site plot and existing aggregate of a test.
+
+    Returns:
+        list: (plot name, MarginMap) tuples; plots without axes are skipped.
+    """
+    margin_maps = []
+    for name, file_path in test_plot_files(test_dir):
+        try:
+            margin_maps.append((name, MarginMap.read(file_path)))
+        except ValueError as e:
+            logger.error("Error reading %s: %s", file_path, e)
+            metrics.inc(metrics.ERRORS, stage="margin_map")
+    return margin_maps
+
+def test_op_centers(test_dir):
+    """
+    Recommended and current op-centers of every site plot and aggregate of a test.
+
+    Returns:
+        dict: Plot name (site file or aggregation mode) to {'best', 'current'}.
+    """
+    return {name: {'best': margin_map.best(), 'current': margin_map.at_op_center()}
+            for name, margin_map in test_margin_maps(test_dir)}
+
+def test_pass_windows(test_dir):
+    """
+    Pass windows of every site plot and aggregate of a test.
+
+    Returns:
+        dict: Plot name to {'window', 'current'} (the margins at the op-center).
+    """
+    return {name: {'window': margin_map.pass_window(), 'current': margin_map.at_op_center()}
+            for name, margin_map in test_margin_maps(test_dir)}
+
+
+def log_op_centers(log_dir):
+    """
+    Returns:
+        dict: Test name to test_op_centers result, for all tests of a processed log.
+    """
+    return {os.path.basename(test_dir): test_op_centers(test_dir) for test_dir in collect_archived_logs(log_dir)}
+
+def log_pass_windows(log_dir):
+    """
+    Returns:
+        dict: Test name to test_pass_windows result, for all tests of a processed log.
+    """
+    return {os.path.basename(test_dir): test_pass_windows(test_dir) for test_dir in collect_archived_logs(log_dir)}
+
+
+def _format_point(point, sign=""):
+    # sign "±" marks the two-sided margins of a recommended op-center
+    if point is None:
+        return "-"
+    x_margin = "-" if point['x_margin'] is None else f"{sign}{point['x_margin']:g}"
+    y_margin = "-" if point['y_margin'] is None else f"{sign}{point['y_margin']:.3f}"
+    return f"({point['x']:g}, {point['vdd']:.3f}V) margin X {x_margin} Y {y_margin}"
+
+def format_op_center(name, result):
+    return f"{name}: best {_format_point(result['best'], '±')}, current {_format_point(result['current'])}"
+
+def format_pass_window(name, result):
+    window = result['window']
+    if window is None:
+        return f"{name}: window -, current {_format_point(result['current'])}"
+    return (f"{name}: window X {window['x'][0]:g}..{window['x'][1]:g} x VDD "
+            f"{window['vdd'][0]:.3f}..{window['vdd'][1]:.3f}V = {window['width']:g} x {window['height']:.3f}V "
+            f"({window['area']:g}), current {_format_point(result['current'])}")
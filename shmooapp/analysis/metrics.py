@@ -0,0 +1,124 @@
+import os
+import logging
+import threading
+
+# Log level of the analysis modules, e.g. SHMOO_LOG_LEVEL=DEBUG to see every written file
+LOG_LEVEL_ENV = "SHMOO_LOG_LEVEL"
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+# Metric names
+SECTIONS_PARSED = "shmoo_sections_parsed_total"
+ROWS_REJECTED = "shmoo_rows_rejected_total"
+FILES_WRITTEN = "shmoo_files_written_total"
+ERRORS = "shmoo_errors_total"
+STAGE_LATENCY = "shmoo_stage_latency_seconds"
+CACHE_REQUESTS = "shmoo_cache_requests_total"
+HEADER_MISMATCHES = "shmoo_header_mismatches_total"
+
+METRIC_HELP = {
+    SECTIONS_PARSED: ("counter", "TestMethod Shmoo sections parsed from datalogs."),
+    ROWS_REJECTED: ("counter", "Plot lines that could not be parsed as shmoo rows."),
+    FILES_WRITTEN: ("counter", "Plot files written, by kind."),
+    ERRORS: ("counter", "Files skipped because of processing errors, by stage."),
+    STAGE_LATENCY: ("summary", "Latency of pipeline stages in seconds."),
+    CACHE_REQUESTS: ("counter", "Result cache lookups, by stage and hit/miss."),
+    HEADER_MISMATCHES: ("counter", "Site plots whose axes differ from the other sites of the test."),
+}
+
+
+def configure_logging(level=None):
+    """
+    Configures the 'shmooapp' logger once for the process.
+
+    Args:
+        level (str): Log level name; defaults to SHMOO_LOG_LEVEL or INFO.
+    """
+    if level is None:
+        level = os.environ.get(LOG_LEVEL_ENV, "INFO")
+    logger = logging.getLogger("shmooapp")
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        logger.addHandler(handler)
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+    return logger
+
+
+class MetricsRegistry:
+    """
+    In-process counters and latency summaries, rendered in the Prometheus text format.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}    # (name, labels) -> value
+        self._summaries = {}   # (name, labels) -> [count, sum]
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is None:
+                self._summaries[key] = [1, value]
+            else:
+                summary[0] += 1
+                summary[1] += value
+
+    def get(self, name, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key in self._counters:
+                return self._counters[key]
+            summary = self._summaries.get(key)
+            return tuple(summary) if summary else 0
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._summaries.clear()
+
+    def render_prometheus(self):
+        with self._lock:
+            counters = sorted(self._counters.items())
+            summaries = sorted(self._summaries.items())
+        lines = []
+        seen = set()
+
+        def add_help(name):
+            if name not in seen and name in METRIC_HELP:
+                kind, text = METRIC_HELP[name]
+                lines.append(f"# HELP {name} {text}")
+                lines.append(f"# TYPE {name} {kind}")
+            seen.add(name)
+
+        for (name, labels), value in counters:
+            add_help(name)
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        for (name, labels), (count, total) in summaries:
+            add_help(name)
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total:.6f}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in labels)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + "}"
+
+
+registry = MetricsRegistry()
+
+def inc(name, value=1, **labels):
+    registry.inc(name, value, **labels)
+
+def observe(name, value, **labels):
+    registry.observe(name, value, **labels)
+
+def render_prometheus():
+    return registry.render_prometheus()
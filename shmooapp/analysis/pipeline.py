@@ -0,0 +1,188 @@
+import os
+import queue
+import logging
+import threading
+from shmooapp.analysis.common_utils import extract_logfilename_from_path
+from shmooapp.analysis.create_shmooplot_files import extract_test_results, TestSplitter
+from shmooapp.analysis.fill_missing_vdd import update_files_for_vdd
+from shmooapp.analysis.update_shmoo_range import update_files_for_range
+from shmooapp.analysis.result_cache import cached_margins, cached_aggregation, cached_anomalies
+from shmooapp.analysis.detect_anomaly import AGGREGATION_MODES
+from shmooapp.analysis.profiling import start_run, finish_run, stage, attach_run
+from shmooapp.analysis.heatmap import render_test_images, render_log_images
+
+logger = logging.getLogger(__name__)
+
+# The CPU-bound part of the analysis without any frontend state, so that it can run
+# as a job of the scheduler (see jobs.py) and be shared by the Reflex and Tk frontends.
+
+# Overlapped mode (run_log_pipeline_overlapped): the splitter hands each test to a pool
+# of PIPELINE_WORKERS analysis threads as soon as its last site is written. At most
+# PIPELINE_QUEUE_SIZE tests wait in the queue; the splitter blocks when it is full, so
+# memory does not grow with the size of the log.
+PIPELINE_WORKERS = max(1, min(4, (os.cpu_count() or 2) // 2))
+PIPELINE_QUEUE_SIZE = 4
+
+
+def render_processes():
+    # the pipeline runs as a job, its render pool takes the job's share of the CPUs;
+    # imported here, the scheduler is not needed to import the analysis modules
+    from shmooapp.analysis.jobs import job_scheduler
+    return job_scheduler.processes_per_job()
+
+
+def run_test_pipeline(test):
+    """
+    Runs the per-test stages: fill VDD labels, update pass ranges, margins,
+    aggregation for all modes and anomaly detection. XOR is computed lazily per mode.
+
+    Args:
+        test (str): Test directory holding the site .log files.
+
+    Returns:
+        dict: 'margins', 'aggregates' (mode -> aggregated file) and 'anomalies'.
+    """
+    with stage("update_files_for_vdd", test=test):
+        update_files_for_vdd(test)
+    with stage("update_files_for_range", test=test):
+        update_files_for_range(test)
+    with stage("calculate_files_for_margin", test=test):
+        margins = cached_margins(test)
+    with stage("process_aggregation", test=test):
+        aggregates = {mode: cached_aggregation(test, mode) for mode in AGGREGATION_MODES}
+    with stage("detect_test_anomalies", test=test):
+        anomalies = cached_anomalies(test)
+    return {'margins': margins, 'aggregates': aggregates, 'anomalies': anomalies}
+
+def run_single_test(test):
+    """
+    Job body for viewing a single test; the profile report (SHMOO_PROFILE=1)
+    is saved next to the test directory.
+    """
+    start_run(os.path.basename(test))
+    try:
+        with stage("test", test=test):
+            result = run_test_pipeline(test)
+        with stage("render_test_images", test=test):
+            render_test_images(test)
+        return result
+    finally:
+        finish_run(os.path.dirname(test))
+
+def extract_log(log_path, output_dir):
+    """
+    Splits a datalog into per-test directories below output_dir/<log>.
+
+    Returns:
+        list: Test directories.
+    """
+    with stage("extract_test_results", log=log_path):
+        return extract_test_results(log_path, output_dir)
+
+def run_log_pipeline(log_path, output_dir, on_test=None):
+    """
+    Job body for a full-lot run: splits the datalog and runs the per-test stages for
+    every test. The profile report (SHMOO_PROFILE=1) is saved into output_dir/<log>.
+
+    Args:
+        log_path (str): Path to the datalog.
+        output_dir (str): Directory receiving <log>/<test> directories.
+        on_test (callable): Optional callback(index, count, test) before each test.
+
+    Returns:
+        list: Test directories.
+    """
+    logname = extract_logfilename_from_path(log_path)
+    start_run(logname)
+    try:
+        subdirs = extract_log(log_path, output_dir)
+        for i, test in enumerate(subdirs):
+            if on_test is not None:
+                on_test(i, len(subdirs), test)
+            with stage("test", test=test):
+                run_test_pipeline(test)
+        # heatmaps of all tests in one parallel batch
+        with stage("render_log_images", log=log_path):
+            render_log_images(subdirs, render_processes())
+        logger.info("Processed %d tests of %s", len(subdirs), logname)
+        return subdirs
+    finally:
+        finish_run(os.path.join(output_dir, logname))
+
+def run_log_pipeline_overlapped(log_path, output_dir, on_test=None, workers=PIPELINE_WORKERS):
+    """
+    Like run_log_pipeline, but the per-test stages of completed tests run on worker
+    threads while the rest of the datalog is still being split. The workers are attached
+    to the profile run, so the report has the same stages as that of run_log_pipeline.
+
+    Args:
+        log_path (str): Path to the datalog.
+        output_dir (str): Directory receiving <log>/<test> directories.
+        on_test (callable): Optional callback(index, None, test) when a test is queued;
+            the number of tests is not known until the log is split.
+        workers (int): Number of analysis threads.
+
+    Returns:
+        list: Test directories.
+
+    Raises:
+        Exception: The first error of a worker, after all queued tests are done.
+    """
+    logname = extract_logfilename_from_path(log_path)
+    tests = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    idle = {}     # test -> Event set while no analysis of the test is queued or running
+    errors = []
+    lock = threading.Lock()
+
+    def consume(run):
+        with attach_run(run):
+            while True:
+                test = tests.get()
+                if test is None:
+                    return
+                try:
+                    with stage("test", test=test):
+                        run_test_pipeline(test)
+                except Exception as e:
+                    logger.exception("Analysis of %s failed", test)
+                    with lock:
+                        errors.append(e)
+                finally:
+                    idle[test].set()
+
+    def wait_for_analysis(test):
+        # a repeated test title: its files must not change under a running analysis
+        idle[test].wait()
+
+    run = start_run(logname)
+    try:
+        threads = [threading.Thread(target=consume, args=(run,), name=f"shmoo-test-{i}", daemon=True)
+                   for i in range(max(1, workers))]
+        for thread in threads:
+            thread.start()
+        try:
+            splitter = TestSplitter(log_path, output_dir, before_write=wait_for_analysis)
+            with stage("extract_test_results", log=log_path):
+                with open(log_path, 'r') as file:
+                    for i, test in enumerate(splitter.iter_tests(file)):
+                        if on_test is not None:
+                            on_test(i, None, test)
+                        idle.setdefault(test, threading.Event()).clear()
+                        tests.put(test)
+            logger.info("Extracted %d sections into %d tests from %s",
+                        splitter.sections, len(splitter.subdirs), log_path)
+        finally:
+            for _ in threads:
+                tests.put(None)
+            for thread in threads:
+                thread.join()
+        if errors:
+            raise errors[0]
+        subdirs = list(splitter.subdirs)
+        # heatmaps of all tests in one parallel batch
+        with stage("render_log_images", log=log_path):
+            render_log_images(subdirs, render_processes())
+        logger.info("Processed %d tests of %s", len(subdirs), logname)
+        return subdirs
+    finally:
+        finish_run(os.path.join(output_dir, logname))
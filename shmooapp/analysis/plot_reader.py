@@ -0,0 +1,138 @@
+import os
+import threading
+from collections import OrderedDict
+
+# Plot files are small, so reading is dominated by the open latency of the storage.
+# Reads run concurrently in a bounded pool, and unchanged files are served from a cache.
+# A cached text is valid while (mtime_ns, size) of the file and its write generation
+# are unchanged. The generation is bumped by note_plot_write, which every writer of
+# plot files in this process calls: a rewrite that keeps the size (e.g. a range
+# "(18.000..      )" -> "(18.000..50.000)") within the mtime resolution of a coarse or
+# network filesystem is caught by it. Writes by other processes are only seen through
+# mtime and size.
+READ_WORKERS = 8
+CACHE_SIZE = 512
+
+
+class TextFileCache:
+    """
+    Small LRU cache of file texts, validated by (mtime_ns, size) and write generation.
+    """
+    def __init__(self, maxsize=CACHE_SIZE):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # path -> (mtime_ns, size, generation, text)
+        self._generations = {}          # path -> number of writes noted
+
+    def generation(self, path):
+        with self._lock:
+            return self._generations.get(path, 0)
+
+    def note_write(self, path):
+        with self._lock:
+            self._generations[path] = self._generations.get(path, 0) + 1
+            self._entries.pop(path, None)
+
+    def get(self, path, stat):
+        with self._lock:
+            entry = self._entries.get(path)
+            if (entry is None or entry[0] != stat.st_mtime_ns or entry[1] != stat.st_size
+                    or entry[2] != self._generations.get(path, 0)):
+                return None
+            self._entries.move_to_end(path)
+            return entry[3]
+
+    def put(self, path, stat, generation, text):
+        """
+        Caches text read at the given generation, unless the file was written since.
+        """
+        with self._lock:
+            if generation != self._generations.get(path, 0):
+                return
+            self._entries[path] = (stat.st_mtime_ns, stat.st_size, generation, text)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generations.clear()
+
+
+_cache = TextFileCache()
+_executor = None
+_executor_lock = threading.Lock()
+
+def _get_executor():
+    # imported here, so the writers that note their writes do not pay for the pool
+    from concurrent.futures import ThreadPoolExecutor
+
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=READ_WORKERS, thread_name_prefix="plot-reader")
+        return _executor
+
+
+def note_plot_write(path):
+    """
+    Marks a plot file as rewritten, so a cached text of it is not served again.
+    """
+    _cache.note_write(os.path.abspath(path))
+
+def plot_version(path):
+    """
+    Short tag that changes whenever a plot file is rewritten, e.g. to version its URL.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return "0"
+    return f"{stat.st_mtime_ns:x}-{stat.st_size:x}-{_cache.generation(os.path.abspath(path))}"
+
+def read_text(path):
+    """
+    Reads a plot file as UTF-8 text, answering from the cache if the file is unchanged.
+
+    Args:
+        path (str): Path to the plot file.
+
+    Returns:
+        str: Content of the file.
+    """
+    key = os.path.abspath(path)
+    generation = _cache.generation(key)
+    stat = os.stat(path)
+    text = _cache.get(key, stat)
+    if text is None:
+        with open(path, encoding='UTF-8') as f:
+            text = f.read()
+        _cache.put(key, stat, generation, text)
+    return text
+
+def read_texts(paths):
+    """
+    Reads several plot files concurrently and returns their texts in the order of paths.
+    """
+    return list(_get_executor().map(read_text, paths))
+
+async def read_texts_async(paths):
+    """
+    Reads several plot files concurrently from async code (e.g. Reflex event handlers)
+    without blocking the event loop. Texts are returned in the order of paths.
+    """
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+    executor = _get_executor()
+    return list(await asyncio.gather(*(loop.run_in_executor(executor, read_text, path) for path in paths)))
+
+async def list_dir_async(directory):
+    """
+    Lists a directory (sorted) in the reader pool, for the same reason as the reads.
+    """
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+    return sorted(await loop.run_in_executor(_get_executor(), os.listdir, directory))
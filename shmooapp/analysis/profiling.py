@@ -0,0 +1,308 @@
+import os
+import sys
+import json
+import time
+import logging
+import threading
+from datetime import datetime
+from contextlib import contextmanager
+from shmooapp.analysis import metrics
+
+logger = logging.getLogger(__name__)
+
+# Profiling is opt-in: set SHMOO_PROFILE=1 to record a report for each run
+PROFILE_ENV = "SHMOO_PROFILE"
+
+
+def is_profiling_enabled():
+    return os.environ.get(PROFILE_ENV, "") not in ("", "0")
+
+
+class StageRecord:
+    """
+    Measurements of a single pipeline stage (or test, or run), possibly with nested stages.
+    """
+    def __init__(self, name, tags):
+        self.name = name
+        self.tags = tags
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.files_read = {}      # path -> size when opened
+        self.files_written = set()
+        self.bytes_written = 0
+        self.mem_base = 0
+        self.mem_peak_abs = 0
+        self.mem_peak = 0
+        self.children = []
+        self._t0 = None
+        self._c0 = None
+
+    @property
+    def bytes_read(self):
+        return sum(self.files_read.values())
+
+    @property
+    def files_touched(self):
+        return len(self.files_written.union(self.files_read))
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'tags': self.tags,
+            'wall_s': round(self.wall, 6),
+            'cpu_s': round(self.cpu, 6),
+            'bytes_read': self.bytes_read,
+            'bytes_written': self.bytes_written,
+            'files_touched': self.files_touched,
+            'tracemalloc_peak_bytes': self.mem_peak,
+            'stages': [child.to_dict() for child in self.children],
+        }
+
+
+class ProfileRun:
+    """
+    Collects StageRecords of one pipeline run on the thread that started it and on
+    worker threads attached with attach_run; every thread has its own stack of open
+    stages, the outermost stages of a worker become children of the run's root.
+    File access is observed through the 'open' audit event, memory through tracemalloc
+    (which is process-wide, so the peaks of stages running concurrently overlap).
+    """
+    def __init__(self, name):
+        self.name = name
+        self.thread_id = threading.get_ident()
+        self.started = datetime.now()
+        self.finished = None
+        # imported only when profiling, it is not needed by the analysis itself
+        import tracemalloc
+        self._tracemalloc = tracemalloc
+        self._own_tracemalloc = not self._tracemalloc.is_tracing()
+        if self._own_tracemalloc:
+            self._tracemalloc.start()
+        self.root = StageRecord(name, {})
+        self._stacks = {self.thread_id: []}   # thread id -> open stages
+        self._lock = threading.Lock()
+        self._enter(self.root)
+
+    @property
+    def _stack(self):
+        return self._stacks[threading.get_ident()]
+
+    def attach_thread(self):
+        # stages of the calling thread are recorded below the root from now on
+        self._stacks[threading.get_ident()] = [self.root]
+
+    def detach_thread(self):
+        self._stacks.pop(threading.get_ident(), None)
+
+    def _enter(self, record):
+        current, peak = self._tracemalloc.get_traced_memory()
+        if self._stack:
+            parent = self._stack[-1]
+            with self._lock:
+                parent.mem_peak_abs = max(parent.mem_peak_abs, peak)
+        self._tracemalloc.reset_peak()
+        record.mem_base = current
+        record.mem_peak_abs = current
+        record._t0 = time.perf_counter()
+        record._c0 = time.process_time()
+        self._stack.append(record)
+
+    def _exit(self, record):
+        record.wall = time.perf_counter() - record._t0
+        record.cpu = time.process_time() - record._c0
+        _, peak = self._tracemalloc.get_traced_memory()
+        record.mem_peak_abs = max(record.mem_peak_abs, peak)
+        record.mem_peak = record.mem_peak_abs - record.mem_base
+        record.bytes_written = sum(_file_size(path) for path in record.files_written)
+        # children of concurrent threads end in any order, the report lists them as started
+        record.children.sort(key=lambda child: child._t0)
+        self._stack.pop()
+        if self._stack:
+            parent = self._stack[-1]
+            with self._lock:
+                parent.mem_peak_abs = max(parent.mem_peak_abs, record.mem_peak_abs)
+                parent.children.append(record)
+        self._tracemalloc.reset_peak()
+
+    @contextmanager
+    def stage(self, name, **tags):
+        record = StageRecord(name, tags)
+        self._enter(record)
+        try:
+            yield record
+        finally:
+            self._exit(record)
+
+    def on_open(self, path, mode):
+        stack = self._stacks.get(threading.get_ident())
+        if not stack:
+            return
+        path = os.path.abspath(os.fsdecode(path))
+        if mode and ('w' in mode or 'a' in mode or 'x' in mode or '+' in mode):
+            with self._lock:
+                for record in stack:
+                    record.files_written.add(path)
+        else:
+            size = _file_size(path)
+            with self._lock:
+                for record in stack:
+                    record.files_read.setdefault(path, size)
+
+    def finish(self):
+        while self._stack:
+            self._exit(self._stack[-1])
+        self.finished = datetime.now()
+        if self._own_tracemalloc:
+            self._tracemalloc.stop()
+
+    def report(self):
+        return {
+            'run': self.name,
+            'started': self.started.isoformat(timespec='seconds'),
+            'finished': self.finished.isoformat(timespec='seconds') if self.finished else None,
+            'profile': self.root.to_dict(),
+        }
+
+    def format_table(self):
+        header = f"{'Stage':<40} {'Test':<40} {'Wall[s]':>9} {'CPU[s]':>9} {'Read[KB]':>10} {'Write[KB]':>10} {'Files':>6} {'Peak[KB]':>10}"
+        lines = [f"Profile: {self.name}  ({self.started.isoformat(timespec='seconds')})", header, "-" * len(header)]
+
+        def add(record, depth):
+            test = os.path.basename(str(record.tags.get('test', '')))
+            lines.append(
+                f"{'  ' * depth + record.name:<40} {test:<40} {record.wall:>9.3f} {record.cpu:>9.3f} "
+                f"{record.bytes_read / 1024:>10.1f} {record.bytes_written / 1024:>10.1f} "
+                f"{record.files_touched:>6} {record.mem_peak / 1024:>10.1f}"
+            )
+            for child in record.children:
+                add(child, depth + 1)
+
+        add(self.root, 0)
+        return "\n".join(lines) + "\n"
+
+    def save(self, output_dir):
+        """
+        Saves the report as JSON and as a text table into output_dir.
+
+        Returns:
+            tuple: (json_path, txt_path)
+        """
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        stamp = self.started.strftime("%Y%m%d-%H%M%S")
+        json_path = os.path.join(output_dir, f"profile_{stamp}.json")
+        txt_path = os.path.join(output_dir, f"profile_{stamp}.txt")
+        # Stop observing before writing the report itself
+        if _active_runs.get(self.thread_id) is self:
+            del _active_runs[self.thread_id]
+        with open(json_path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+        with open(txt_path, 'w') as f:
+            f.write(self.format_table())
+        return json_path, txt_path
+
+
+def _file_size(path):
+    try:
+        return os.stat(path).st_size
+    except OSError:
+        return 0
+
+
+# Active run per thread, so that jobs running concurrently are profiled separately;
+# worker threads of a run are attached to it with attach_run
+_active_runs = {}
+_hook_installed = False
+
+def _audit_hook(event, args):
+    if event == "open" and _active_runs:
+        run = _active_runs.get(threading.get_ident())
+        path, mode = args[0], args[1]
+        if run is not None and isinstance(path, (str, bytes, os.PathLike)):
+            run.on_open(path, mode)
+
+
+def start_run(name, enabled=None):
+    """
+    Starts profiling a pipeline run if profiling is enabled.
+
+    Args:
+        name (str): Name of the run, e.g. the log file name.
+        enabled (bool): Overrides the SHMOO_PROFILE environment variable.
+
+    Returns:
+        ProfileRun or None if profiling is disabled.
+    """
+    global _hook_installed
+    if enabled is None:
+        enabled = is_profiling_enabled()
+    if not enabled:
+        return None
+    if not _hook_installed:
+        # Audit hooks can not be removed, so the hook is installed once and stays idle between runs
+        sys.addaudithook(_audit_hook)
+        _hook_installed = True
+    run = ProfileRun(name)
+    _active_runs[run.thread_id] = run
+    return run
+
+
+def finish_run(output_dir):
+    """
+    Finishes the active run of the current thread and saves its report into output_dir.
+
+    Returns:
+        tuple: (json_path, txt_path) or None if no run is active.
+    """
+    run = _active_runs.get(threading.get_ident())
+    if run is None:
+        return None
+    run.finish()
+    paths = run.save(output_dir)
+    _active_runs.pop(run.thread_id, None)
+    logger.info("Profile saved to: %s", paths[0])
+    return paths
+
+
+@contextmanager
+def attach_run(run):
+    """
+    Makes run the active run of the calling thread, e.g. in a worker thread of the
+    pipeline, so that its stages are recorded in the run that started it.
+
+    Args:
+        run (ProfileRun): Run returned by start_run, or None when not profiling.
+    """
+    if run is None:
+        yield None
+        return
+    ident = threading.get_ident()
+    run.attach_thread()
+    _active_runs[ident] = run
+    try:
+        yield run
+    finally:
+        _active_runs.pop(ident, None)
+        run.detach_thread()
+
+
+@contextmanager
+def stage(name, **tags):
+    """
+    Profiles a pipeline stage (or a test) within the active run. When not profiling,
+    only the stage latency is recorded in the metrics.
+
+    Example:
+        with stage("fill_missing_vdd", test=curdir):
+            update_files_for_vdd(curdir)
+    """
+    run = _active_runs.get(threading.get_ident())
+    t0 = time.perf_counter()
+    try:
+        if run is None:
+            yield None
+        else:
+            with run.stage(name, **tags) as record:
+                yield record
+    finally:
+        metrics.observe(metrics.STAGE_LATENCY, time.perf_counter() - t0, stage=name)
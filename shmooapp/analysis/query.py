@@ -0,0 +1,262 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from shmooapp.analysis.common_utils import filter_original_dir_only, generate_aggfile_name
+from shmooapp.analysis.heatmap import read_grid
+from shmooapp.analysis.result_cache import result_cache, directory_signature, cached_margins
+from shmooapp.analysis.xor_shmoo import load_xor_sparse, is_xor_current, generate_xor_sparse_name
+from shmooapp.analysis import metrics
+
+logger = logging.getLogger(__name__)
+
+# Read-only queries on processed logs (out.plot/... or out.archive/...) for the JSON API.
+# The ETag of a response is derived from the content hash of the test directory
+# (see result_cache) and the signatures of the other files it is built from, so a
+# response is served from QUERY_CACHE_SIZE encoded bodies until the data changes.
+# Grids are encoded compactly: one string per row with one character per cell and the
+# VDD/X axes once per test (per site only if they differ from the test's axes).
+QUERY_CACHE_SIZE = 512
+LOG_SEARCH_DEPTH = 2
+
+QUERY_TESTS = "tests"
+QUERY_SITES = "sites"
+QUERY_AGGREGATES = "aggregates"
+QUERY_XOR = "xor"
+QUERY_MARGINS = "margins"
+
+# aggregation mode -> XOR prefix
+XOR_PREFIXES = {"OR": "OR_XOR", "AND": "AND_XOR", "Majority": "MajorityVote_XOR"}
+
+
+class QueryNotFound(Exception):
+    """Raised when the requested log, test or mode does not exist."""
+
+
+class QueryResult:
+    def __init__(self, etag, last_modified, body):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.body = body
+
+
+class QueryCache:
+    """
+    LRU of encoded response bodies keyed by ETag.
+    """
+    def __init__(self, maxsize=QUERY_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._bodies = OrderedDict()
+
+    def get(self, etag):
+        with self._lock:
+            body = self._bodies.get(etag)
+            if body is not None:
+                self._bodies.move_to_end(etag)
+            return body
+
+    def put(self, etag, body):
+        with self._lock:
+            self._bodies[etag] = body
+            self._bodies.move_to_end(etag)
+            while len(self._bodies) > self.maxsize:
+                self._bodies.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._bodies.clear()
+
+
+query_cache = QueryCache()
+
+
+def _is_log_dir(path):
+    # a log directory holds test directories with site .log files
+    for p in path.iterdir():
+        if p.is_dir() and filter_original_dir_only(p) and any(p.glob('*.log')):
+            return True
+    return False
+
+def find_log_dirs(roots, depth=LOG_SEARCH_DEPTH):
+    """
+    Finds processed logs below the roots, e.g. out.plot/<job>/<log> and out.archive/<date>-<log>.
+
+    Returns:
+        list: Log directories relative to the working directory.
+    """
+    found = []
+    level = [Path(root) for root in roots if os.path.isdir(root)]
+    for _ in range(depth):
+        next_level = []
+        for directory in level:
+            for p in sorted(directory.iterdir()):
+                if not p.is_dir() or p.is_symlink() or not filter_original_dir_only(p):
+                    continue
+                if _is_log_dir(p):
+                    found.append(os.path.relpath(p))
+                else:
+                    next_level.append(p)
+        level = next_level
+    return found
+
+def resolve_log_dir(roots, log):
+    """
+    Resolves a log path given by a client to a directory below one of the roots.
+
+    Raises:
+        QueryNotFound: If it is outside the roots or does not exist.
+    """
+    if not log:
+        raise QueryNotFound("No log given")
+    full_path = os.path.realpath(log)
+    allowed = any(full_path.startswith(os.path.realpath(root) + os.sep) for root in roots)
+    if not allowed or not os.path.isdir(full_path):
+        raise QueryNotFound(f"Log not found: {log}")
+    return full_path
+
+def resolve_test_dir(log_dir, test):
+    if not test or os.sep in test or test in (os.curdir, os.pardir):
+        raise QueryNotFound(f"Test not found: {test}")
+    test_dir = os.path.join(log_dir, test)
+    if not os.path.isdir(test_dir) or not filter_original_dir_only(Path(test_dir)):
+        raise QueryNotFound(f"Test not found: {test}")
+    return test_dir
+
+def list_tests(log_dir):
+    return [p.name for p in sorted(Path(log_dir).iterdir()) if p.is_dir() and filter_original_dir_only(p)]
+
+def _file_signature(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return (os.path.basename(path), None, None)
+    return (os.path.basename(path), stat.st_mtime_ns, stat.st_size)
+
+
+# Payloads
+def encode_grids(named_files):
+    """
+    Encodes plots compactly.
+
+    Args:
+        named_files (list): (name, file path) tuples.
+
+    Returns:
+        dict: 'vdd' and 'x' axes and, per name, 'rows' and 'star_row'.
+    """
+    payload = {'vdd': None, 'x': None, 'plots': {}}
+    for name, file_path in named_files:
+        try:
+            grid, vdd, x = read_grid(file_path)
+        except ValueError as e:
+            logger.error("Error reading %s: %s", file_path, e)
+            metrics.inc(metrics.ERRORS, stage="query")
+            continue
+        entry = {'rows': grid.rows, 'star_row': grid.star_row}
+        if payload['vdd'] is None:
+            payload['vdd'], payload['x'] = vdd, x
+        elif (vdd, x) != (payload['vdd'], payload['x']):
+            entry['vdd'], entry['x'] = vdd, x
+        payload['plots'][name] = entry
+    return payload
+
+def sites_payload(test_dir):
+    sites = sorted(f for f in os.listdir(test_dir) if f.endswith('.log'))
+    return encode_grids([(site, os.path.join(test_dir, site)) for site in sites])
+
+def aggregates_payload(test_dir):
+    files = [(mode, generate_aggfile_name(test_dir, mode)) for mode in XOR_PREFIXES]
+    return encode_grids([(mode, path) for mode, path in files if os.path.exists(path)])
+
+def xor_payload(test_dir, mode):
+    """
+    XOR masks of all sites as runs [vdd_mv, x_start, x_end) of cells differing from
+    the aggregate. Queries only read: the sparse XOR file must have been computed
+    (by the pages or the pipeline) and be newer than its inputs.
+    """
+    aggfile = generate_aggfile_name(test_dir, mode)
+    if not os.path.exists(aggfile):
+        raise QueryNotFound(f"No {mode} aggregate for {os.path.basename(test_dir)}")
+    if not is_xor_current(test_dir, aggfile, XOR_PREFIXES[mode]):
+        raise QueryNotFound(f"No current {mode} XOR for {os.path.basename(test_dir)}")
+    sparse = load_xor_sparse(generate_xor_sparse_name(test_dir, XOR_PREFIXES[mode]))
+    return {
+        'mode': mode,
+        'vdd_mv': sparse['vdd_mv'],
+        'sites': {
+            site: {'mismatches': entry['mismatches'], 'diff': entry['diff'], 'invalid': entry['invalid']}
+            for site, entry in sorted(sparse['sites'].items())
+        },
+    }
+
+def margins_payload(test_dir):
+    sites = sorted(f for f in os.listdir(test_dir) if f.endswith('.log'))
+    return {'sites': {
+        site: {'x_center': m[0], 'y_center': m[1], 'x_margin': m[2], 'y_margin': m[3]}
+        for site, m in zip(sites, cached_margins(test_dir))
+    }}
+
+
+def run_query(roots, kind, log=None, test=None, mode=None):
+    """
+    Answers a query, from query_cache when the data is unchanged.
+
+    Args:
+        roots (tuple): Directories the client may read (PLOTSDIR, ARCHIVEDIR).
+        kind (str): QUERY_TESTS, QUERY_SITES, QUERY_AGGREGATES, QUERY_XOR or QUERY_MARGINS.
+        log (str): Log directory, as listed by find_log_dirs.
+        test (str): Test name, as listed by the tests query.
+        mode (str): Aggregation mode of the XOR query.
+
+    Returns:
+        QueryResult
+
+    Raises:
+        QueryNotFound: For unknown logs, tests or modes, or XOR masks not computed yet.
+        ValueError: For plots that cannot be parsed.
+    """
+    log_dir = resolve_log_dir(roots, log)
+    if kind == QUERY_TESTS:
+        tests = list_tests(log_dir)
+        signature = [kind, log] + tests
+        last_modified = os.stat(log_dir).st_mtime
+        build = lambda: {'log': log, 'tests': tests}
+    else:
+        test_dir = resolve_test_dir(log_dir, test)
+        if kind == QUERY_XOR and mode not in XOR_PREFIXES:
+            raise QueryNotFound(f"Unknown mode: {mode}")
+        files = directory_signature(test_dir)
+        # log and test are part of the body, so archived copies of a test get their own entry
+        signature = [kind, mode, log, test, result_cache.content_hash(test_dir)]
+        if kind in (QUERY_AGGREGATES, QUERY_XOR):
+            modes = [mode] if kind == QUERY_XOR else list(XOR_PREFIXES)
+            extra = [_file_signature(generate_aggfile_name(test_dir, m)) for m in modes]
+            if kind == QUERY_XOR:
+                # the sparse file is not computed by the query, it appears or changes later
+                extra.append(_file_signature(generate_xor_sparse_name(test_dir, XOR_PREFIXES[mode])))
+            signature += extra
+            files += tuple(s for s in extra if s[1] is not None)
+        last_modified = max((s[1] for s in files), default=0) / 1e9
+        payloads = {
+            QUERY_SITES: sites_payload,
+            QUERY_AGGREGATES: aggregates_payload,
+            QUERY_XOR: lambda d: xor_payload(d, mode),
+            QUERY_MARGINS: margins_payload,
+        }
+        if kind not in payloads:
+            raise QueryNotFound(f"Unknown query: {kind}")
+        build = lambda: dict(payloads[kind](test_dir), log=log, test=test)
+
+    etag = hashlib.sha1(json.dumps(signature).encode('utf-8')).hexdigest()
+    body = query_cache.get(etag)
+    if body is not None:
+        metrics.inc(metrics.CACHE_REQUESTS, stage="query", result="hit")
+    else:
+        metrics.inc(metrics.CACHE_REQUESTS, stage="query", result="miss")
+        body = json.dumps(build(), separators=(',', ':')).encode('utf-8')
+        query_cache.put(etag, body)
+    return QueryResult(etag, last_modified, body)
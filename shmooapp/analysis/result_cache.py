@@ -0,0 +1,128 @@
+import os
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from shmooapp.analysis import metrics
+from shmooapp.analysis.common_utils import generate_aggfile_name, directory_signature
+from shmooapp.analysis.calculate_margin import calculate_files_for_margin
+from shmooapp.analysis.aggregated_shmoo import process_aggregation
+from shmooapp.analysis.xor_shmoo import ensure_xor, generate_xor_sparse_name
+from shmooapp.analysis.detect_anomaly import AGGREGATION_MODES, detect_test_anomalies
+
+logger = logging.getLogger(__name__)
+
+# Results of the analysis stages (margins, aggregated files, XOR files, anomalies), shared by all
+# sessions of the Reflex backend and by the Tk GUI of the same process.
+# Keys are (content hash of the test directory, stage, mode), so a result is reused as
+# long as the site logs are unchanged, and is recomputed after e.g. fill_missing_vdd.
+RESULT_CACHE_SIZE = 256
+HASH_CACHE_SIZE = 1024
+
+
+class ResultCache:
+    """
+    Size-bounded LRU cache of stage results keyed by (content hash, stage, mode).
+    Content hashes are memoized by the directory signature, so unchanged
+    directories are not read again.
+    """
+    def __init__(self, maxsize=RESULT_CACHE_SIZE, hash_maxsize=HASH_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hash_maxsize = hash_maxsize
+        self._lock = threading.Lock()
+        self._results = OrderedDict()   # (hash, stage, mode) -> result
+        self._hashes = OrderedDict()    # (directory, signature) -> hash
+
+    def content_hash(self, directory):
+        """
+        Returns the SHA-1 over names and contents of the files of a test directory.
+        """
+        directory = os.path.abspath(directory)
+        signature = directory_signature(directory)
+        key = (directory, signature)
+        with self._lock:
+            digest = self._hashes.get(key)
+            if digest is not None:
+                self._hashes.move_to_end(key)
+                return digest
+        sha = hashlib.sha1()
+        for name, _, _ in signature:
+            sha.update(name.encode('utf-8') + b'\0')
+            with open(os.path.join(directory, name), 'rb') as f:
+                sha.update(f.read())
+        digest = sha.hexdigest()
+        with self._lock:
+            self._hashes[key] = digest
+            while len(self._hashes) > self.hash_maxsize:
+                self._hashes.popitem(last=False)
+        return digest
+
+    def get_or_compute(self, directory, stage, compute, mode=None, validate=None):
+        """
+        Returns the cached result of a stage for the test directory, or computes and caches it.
+
+        Args:
+            directory (str): Test directory holding the site .log files.
+            stage (str): Stage name, e.g. "margin" or "aggregation".
+            compute (callable): Computes the result when it is not cached.
+            mode (str): Aggregation mode or None.
+            validate (callable): Optional check of a cached result, e.g. that an output file
+                                 still exists; the result is recomputed if it returns False.
+
+        Returns:
+            The result of compute.
+        """
+        key = (self.content_hash(directory), stage, mode)
+        with self._lock:
+            found = key in self._results
+            result = self._results.get(key)
+            if found:
+                self._results.move_to_end(key)
+        if found and (validate is None or validate(result)):
+            metrics.inc(metrics.CACHE_REQUESTS, stage=stage, result="hit")
+            return result
+        metrics.inc(metrics.CACHE_REQUESTS, stage=stage, result="miss")
+        result = compute()
+        with self._lock:
+            self._results[key] = result
+            self._results.move_to_end(key)
+            while len(self._results) > self.maxsize:
+                self._results.popitem(last=False)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+            self._hashes.clear()
+
+
+result_cache = ResultCache()
+
+
+def cached_margins(directory):
+    return result_cache.get_or_compute(directory, "margin", lambda: calculate_files_for_margin(directory))
+
+def cached_aggregation(directory, mode):
+    expected = generate_aggfile_name(directory, mode)
+    return result_cache.get_or_compute(
+        directory, "aggregation", lambda: process_aggregation(directory, mode), mode=mode,
+        validate=lambda path: path == expected and os.path.exists(path))
+
+def cached_anomalies(directory):
+    # the aggregates are scored too; they live next to the test directory, so their
+    # signatures are part of the key
+    aggregates = tuple(_file_signature(generate_aggfile_name(directory, mode)) for mode in AGGREGATION_MODES)
+    return result_cache.get_or_compute(directory, "anomaly", lambda: detect_test_anomalies(directory), mode=aggregates)
+
+def _file_signature(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+def cached_xor(directory, aggfile, xor_prefix):
+    expected = generate_xor_sparse_name(directory, xor_prefix)
+    return result_cache.get_or_compute(
+        directory, "xor", lambda: ensure_xor(directory, aggfile, xor_prefix), mode=xor_prefix,
+        validate=lambda path: path == expected and os.path.exists(path))
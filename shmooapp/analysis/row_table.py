@@ -0,0 +1,98 @@
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Dictionary encoding of shmoo rows. Most VDD rows of a site are identical
+# ("!.PPPP...") and the same rows recur across sites and tests, so plots are held as
+# VDD -> row id into a table of unique data strings, and per-row work (aggregation of
+# a combination of rows, XOR of two rows, pass span of a row) is memoized by row ids.
+# Row ids are valid for the RowTable they came from; shared_row_table() starts a new
+# table once ROW_TABLE_MAX_ROWS unique rows or ROW_MEMO_MAX_ENTRIES results are held,
+# so memory stays bounded in a long-running server while stages still holding the
+# old table can finish.
+ROW_TABLE_MAX_ROWS = 100000
+ROW_MEMO_MAX_ENTRIES = 400000
+
+
+class RowTable:
+    """
+    Table of unique shmoo data strings with memoized results of row computations.
+    """
+    def __init__(self):
+        self.rows = []        # id -> data string
+        self._ids = {}        # data string -> id
+        self._memo = {}       # (operation, row ids...) -> result
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.rows)
+
+    def intern(self, row):
+        """
+        Returns the id of a data string, adding it to the table if it is new.
+        """
+        row_id = self._ids.get(row)
+        if row_id is None:
+            with self._lock:
+                row_id = self._ids.get(row)
+                if row_id is None:
+                    row_id = len(self.rows)
+                    self.rows.append(row)
+                    self._ids[row] = row_id
+        return row_id
+
+    def encode(self, vdd_data):
+        """
+        Encodes a plot given as VDD -> data string into VDD -> row id.
+        """
+        return {vdd: self.intern(row) for vdd, row in vdd_data.items()}
+
+    def decode(self, vdd_ids):
+        rows = self.rows
+        return {vdd: rows[row_id] for vdd, row_id in vdd_ids.items()}
+
+    def memoize(self, key, compute):
+        """
+        Returns the memoized result for key, computing it on the first call.
+        Exceptions of compute are not memoized.
+        """
+        try:
+            return self._memo[key]
+        except KeyError:
+            pass
+        result = compute()
+        self._memo[key] = result
+        return result
+
+    def span(self, row_id):
+        """
+        First and last pass ('P') column of a row, or None if the row has no pass.
+        """
+        def compute():
+            row = self.rows[row_id]
+            first = row.find('P')
+            return None if first < 0 else (first, row.rfind('P'))
+        return self.memoize(('span', row_id), compute)
+
+    def is_full(self):
+        return len(self.rows) >= ROW_TABLE_MAX_ROWS or len(self._memo) >= ROW_MEMO_MAX_ENTRIES
+
+    def stats(self):
+        return {'rows': len(self.rows), 'memo': len(self._memo)}
+
+
+_shared_table = RowTable()
+_shared_lock = threading.Lock()
+
+def shared_row_table():
+    """
+    Returns the process-wide RowTable; take it once per stage and use that object
+    for all encoding and decoding of the stage.
+    """
+    global _shared_table
+    with _shared_lock:
+        if _shared_table.is_full():
+            logger.debug("Starting a new row table after %s", _shared_table.stats())
+            _shared_table = RowTable()
+        return _shared_table
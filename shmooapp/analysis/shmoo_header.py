@@ -0,0 +1,216 @@
+import os
+import re
+import logging
+import threading
+import weakref
+from collections import Counter, OrderedDict
+from shmooapp.analysis.common_utils import VDD_PATTERNS, directory_signature
+from shmooapp.analysis import metrics
+
+logger = logging.getLogger(__name__)
+
+# Every site file of a test carries the same "Shmoo Parameter" header:
+#  X-Axis:   Period    [  10.000 ..  50.000 ns  ] step   1.000 ns  (  20.800 ns  )
+#  Y-Axis:   Vvdd12    [   1.600 ..   0.650 V   ] step  -0.050 V   (   1.350 V   )
+# It is parsed once per test (load_test_header), compared across the sites, and the
+# ShmooHeader objects are interned so that sites with equal headers share one object.
+TEST_HEADER_CACHE_SIZE = 256
+
+X_AXIS_PATTERN = re.compile(
+    r"X-Axis\s*:\s*(\w+)\s*\[\s*([-+]?[\d.]+)\s*\.\.\s*([-+]?[\d.]+)\s*ns\s*\]\s*step\s*([-+]?\d*\.\d+|\d+)\s*ns"
+    r"(?:\s*\(\s*([-+]?[\d.]+))?",
+    re.IGNORECASE
+)
+Y_AXIS_PATTERN = re.compile(
+    rf"Y-Axis\s*:\s*({'|'.join(map(re.escape, VDD_PATTERNS))})\s*\[\s*([\d.]+)\s*\.\.\s*([\d.]+)\s*V\s*\]"
+    r"\s*step\s*([-+]?\d*\.\d+|\d+)\s*V(?:\s*\(\s*([-+]?[\d.]+))?",
+    re.IGNORECASE
+)
+
+
+def _float_or_none(value):
+    return None if value is None else float(value)
+
+
+class ShmooHeader:
+    """
+    Axes of a shmoo plot and the position of its data block.
+
+    Attributes:
+        x_name (str): X parameter, e.g. "Period".
+        x_start, x_end, x_step (float): X-Axis range in ns, x_start is the first column.
+        x_center (float): X operation center, 0.0 when the tester prints none.
+        y_name (str): VDD name, one of VDD_PATTERNS.
+        y_first, y_last, y_step (float): Y-Axis range in V, y_first is the top row.
+        y_center (float): Raw Y operation center in V.
+        data_start (int): Index of the first data row (two lines below the VDD line).
+    An axis that is missing from the header has None in all of its fields.
+    """
+    __slots__ = ('x_name', 'x_start', 'x_end', 'x_step', 'x_center',
+                 'y_name', 'y_first', 'y_last', 'y_step', 'y_center',
+                 'data_start', '__weakref__')
+
+    def __init__(self, x_axis, y_axis, data_start):
+        self.x_name, self.x_start, self.x_end, self.x_step, self.x_center = x_axis
+        self.y_name, self.y_first, self.y_last, self.y_step, self.y_center = y_axis
+        self.data_start = data_start
+
+    @property
+    def axes(self):
+        # what every site of a test must agree on
+        return (self.x_name, self.x_start, self.x_end, self.x_step, self.x_center,
+                self.y_name, self.y_first, self.y_last, self.y_step, self.y_center)
+
+    @property
+    def key(self):
+        return self.axes + (self.data_start,)
+
+    def x_axis_info(self):
+        """
+        Returns:
+            tuple: (x_start, x_end, step), as extract_x_axis_info.
+        """
+        if self.x_start is None:
+            raise ValueError("X-Axis information not found or malformed.")
+        return self.x_start, self.x_end, self.x_step
+
+    def y_axis_info(self):
+        """
+        Returns:
+            tuple: (max_vdd, min_vdd, step), as extract_y_axis_info.
+        """
+        if self.y_first is None:
+            raise ValueError("Y-Axis information not found or malformed.")
+        return self.y_first, self.y_last, self.y_step
+
+    def describe(self):
+        return (f"X {self.x_name} [{self.x_start}..{self.x_end}] step {self.x_step} ({self.x_center}), "
+                f"Y {self.y_name} [{self.y_first}..{self.y_last}] step {self.y_step} ({self.y_center})")
+
+    @classmethod
+    def parse(cls, lines):
+        """
+        Parses the header of a plot, up to the VDD line.
+
+        Args:
+            lines (iterable): Lines of the plot file; only the header is consumed.
+
+        Returns:
+            ShmooHeader: The interned header.
+
+        Raises:
+            ValueError: If the VDD line of the data block is missing.
+        """
+        x_axis = (None,) * 5
+        y_axis = (None,) * 5
+        for i, line in enumerate(lines):
+            if line.strip() in VDD_PATTERNS:
+                return intern_header(cls(x_axis, y_axis, i + 2))  # Two lines below "VDD" line
+            match = X_AXIS_PATTERN.search(line)
+            if match:
+                x_axis = (match.group(1), float(match.group(2)), float(match.group(3)),
+                          float(match.group(4)), _float_or_none(match.group(5)))
+                continue
+            match = Y_AXIS_PATTERN.search(line)
+            if match:
+                y_axis = (match.group(1), float(match.group(2)), float(match.group(3)),
+                          float(match.group(4)), _float_or_none(match.group(5)))
+        raise ValueError("VDD line not found.")
+
+    @classmethod
+    def read(cls, file_path):
+        with open(file_path, 'r') as f:
+            return cls.parse(f)
+
+
+_interned = weakref.WeakValueDictionary()
+_interned_lock = threading.Lock()
+
+def intern_header(header):
+    """
+    Returns the one ShmooHeader object with the same values.
+    """
+    with _interned_lock:
+        existing = _interned.get(header.key)
+        if existing is not None:
+            return existing
+        _interned[header.key] = header
+        return header
+
+
+class TestHeader:
+    """
+    Headers of the sites of a test.
+
+    Attributes:
+        sites (dict): Site .log file name to its ShmooHeader.
+        header (ShmooHeader): The header shared by most sites (None without valid sites).
+        mismatches (list): Sites whose axes differ from header.
+    """
+    def __init__(self, sites):
+        self.sites = sites
+        counts = Counter(h.axes for h in sites.values())
+        common = counts.most_common(1)[0][0] if counts else None
+        self.header = next((h for h in sites.values() if h.axes == common), None)
+        self.mismatches = sorted(site for site, h in sites.items() if h.axes != common)
+
+    def for_site(self, filename):
+        return self.sites.get(filename)
+
+
+def parse_test_header(input_directory):
+    """
+    Parses and validates the headers of all site .log files of a test.
+    Sites with a different header are reported but kept.
+
+    Returns:
+        TestHeader
+    """
+    sites = {}
+    for filename in sorted(os.listdir(input_directory)):
+        if filename.endswith('.log'):
+            file_path = os.path.join(input_directory, filename)
+            try:
+                sites[filename] = ShmooHeader.read(file_path)
+            except ValueError as e:
+                logger.error("Error reading header of %s: %s", file_path, e)
+                metrics.inc(metrics.ERRORS, stage="header")
+    test_header = TestHeader(sites)
+    for site in test_header.mismatches:
+        logger.warning("Header of %s differs from the test header: %s (expected %s)",
+                       site, sites[site].describe(), test_header.header.describe())
+        metrics.inc(metrics.HEADER_MISMATCHES)
+    return test_header
+
+
+_test_headers = OrderedDict()   # (directory, signature) -> TestHeader
+_test_headers_lock = threading.Lock()
+
+def load_test_header(input_directory):
+    """
+    Returns the TestHeader of a test, parsed again only after its files changed.
+    """
+    key = (os.path.abspath(input_directory), directory_signature(input_directory))
+    with _test_headers_lock:
+        test_header = _test_headers.get(key)
+        if test_header is not None:
+            _test_headers.move_to_end(key)
+            return test_header
+    test_header = parse_test_header(input_directory)
+    _store_test_header(key, test_header)
+    return test_header
+
+def keep_test_header(input_directory, test_header):
+    """
+    Registers test_header for the current files of a test, after a stage that rewrote
+    only their data rows (fill_missing_vdd, update_shmoo_range), so it is not parsed again.
+    """
+    key = (os.path.abspath(input_directory), directory_signature(input_directory))
+    _store_test_header(key, test_header)
+
+def _store_test_header(key, test_header):
+    with _test_headers_lock:
+        _test_headers[key] = test_header
+        _test_headers.move_to_end(key)
+        while len(_test_headers) > TEST_HEADER_CACHE_SIZE:
+            _test_headers.popitem(last=False)
@@ -0,0 +1,176 @@
+import os
+import csv
+import logging
+from shmooapp.analysis.common_utils import collect_archived_logs, generate_aggfile_name
+from shmooapp.analysis.detect_anomaly import AGGREGATION_MODES
+from shmooapp.analysis.heatmap import read_grid
+from shmooapp.analysis import metrics
+
+logger = logging.getLogger(__name__)
+
+# Pass/fail of spec corners (VDD in V, X in the unit of the X-Axis, e.g. Period in ns)
+# on every site plot and aggregate of a log or of a whole archive.
+# The cells of a point set are located once per distinct pair of axes (all sites of a
+# test share them), and every plot is then checked by indexing its rows. A point
+# between two grid steps must pass on all neighbouring cells; a point outside the
+# plot has no result (None).
+SPEC_PASS_CELL = 'P'
+AXIS_TOLERANCE = 1e-3   # fraction of a step within which a value is on a grid line
+
+
+def parse_spec_points(lines):
+    """
+    Parses spec points, one "vdd,x" (or "vdd x") per line; '#' starts a comment.
+
+    Returns:
+        list: (vdd, x) tuples.
+    """
+    points = []
+    for line in lines:
+        line = line.split('#', 1)[0].strip()
+        if not line:
+            continue
+        fields = line.replace(',', ' ').split()
+        if len(fields) != 2:
+            raise ValueError(f"Spec point must be 'vdd,x': {line}")
+        points.append((float(fields[0]), float(fields[1])))
+    return points
+
+def format_spec_point(point):
+    return f"{point[0]:.3f}V@{point[1]:g}"
+
+
+def axis_brackets(axis, value):
+    """
+    Indices of the grid lines a value falls on (one) or between (two).
+
+    Args:
+        axis (list): Axis values per index, ascending or descending.
+        value (float): The value to locate.
+
+    Returns:
+        list: Indices, or None if the value is outside the axis.
+    """
+    if not axis or None in axis:
+        return None
+    if len(axis) == 1:
+        return [0] if abs(axis[0] - value) < 1e-9 else None
+    step = axis[1] - axis[0]
+    position = (value - axis[0]) / step
+    nearest = round(position)
+    if abs(position - nearest) <= AXIS_TOLERANCE:
+        return [nearest] if 0 <= nearest < len(axis) else None
+    lower = int(position // 1)
+    if lower < 0 or lower + 1 >= len(axis):
+        return None
+    return [lower, lower + 1]
+
+def locate_points(vdd_axis, x_axis, points):
+    """
+    Locates the cells of spec points on a plot's axes.
+
+    Returns:
+        list: Per point the (row, column) cells that must pass, or None if outside.
+    """
+    located = []
+    for vdd, x in points:
+        rows = axis_brackets(vdd_axis, vdd)
+        cols = axis_brackets(x_axis, x)
+        located.append(None if rows is None or cols is None else [(r, c) for r in rows for c in cols])
+    return located
+
+def evaluate_grid(grid, located):
+    """
+    Returns:
+        list: Per point True (pass), False (fail) or None (outside the plot).
+    """
+    results = []
+    for cells in located:
+        if cells is None:
+            results.append(None)
+            continue
+        results.append(all(c < len(grid.rows[r]) and grid.rows[r][c] == SPEC_PASS_CELL for r, c in cells))
+    return results
+
+
+def test_plot_files(test_dir):
+    """
+    Site plots and existing aggregates of a test, as (name, file path) tuples.
+    """
+    plots = [(f, os.path.join(test_dir, f)) for f in sorted(os.listdir(test_dir)) if f.endswith('.log')]
+    for mode in AGGREGATION_MODES:
+        aggfile = generate_aggfile_name(test_dir, mode)
+        if os.path.exists(aggfile):
+            plots.append((mode, aggfile))
+    return plots
+
+def evaluate_log(log_dir, points, located_cache=None):
+    """
+    Checks spec points on all site plots and aggregates of a processed log.
+
+    Args:
+        log_dir (str): Directory holding one subdirectory per test.
+        points (list): (vdd, x) spec points.
+        located_cache (dict): Optional axes -> located cells, shared between logs.
+
+    Returns:
+        dict: 'log', 'points' and 'tests' (test -> plot name -> result per point).
+    """
+    located_cache = {} if located_cache is None else located_cache
+    tests = {}
+    for test_dir in collect_archived_logs(log_dir):
+        plots = {}
+        for name, file_path in test_plot_files(test_dir):
+            try:
+                grid, vdd, x = read_grid(file_path)
+            except ValueError as e:
+                logger.error("Error reading %s: %s", file_path, e)
+                metrics.inc(metrics.ERRORS, stage="spec")
+                continue
+            axes = (tuple(vdd), tuple(x))
+            located = located_cache.get(axes)
+            if located is None:
+                located = located_cache[axes] = locate_points(vdd, x, points)
+            plots[name] = evaluate_grid(grid, located)
+        tests[os.path.basename(test_dir)] = plots
+    return {'log': log_dir, 'points': list(points), 'tests': tests}
+
+def evaluate_archive(arcroot, points):
+    """
+    Checks spec points on every archived log below arcroot.
+
+    Returns:
+        list: evaluate_log results.
+    """
+    located_cache = {}
+    return [evaluate_log(log_dir, points, located_cache) for log_dir in collect_archived_logs(arcroot)]
+
+
+def failing_corners(results):
+    """
+    Returns:
+        list: (log, test, plot, point) of every failing spec point.
+    """
+    failing = []
+    for result in results:
+        for test, plots in result['tests'].items():
+            for plot, outcomes in plots.items():
+                failing += [(result['log'], test, plot, point)
+                            for point, outcome in zip(result['points'], outcomes) if outcome is False]
+    return failing
+
+def write_spec_csv(results, path):
+    """
+    Writes the pass matrix, one row per plot and one column per spec point
+    (PASS, FAIL or NA outside the plot).
+    """
+    labels = {None: "NA", True: "PASS", False: "FAIL"}
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        points = results[0]['points'] if results else []
+        writer.writerow(["log", "test", "plot"] + [format_spec_point(p) for p in points])
+        for result in results:
+            for test, plots in result['tests'].items():
+                for plot, outcomes in plots.items():
+                    writer.writerow([os.path.basename(result['log']), test, plot] + [labels[o] for o in outcomes])
+    metrics.inc(metrics.FILES_WRITTEN, kind="spec")
@@ -1,5 +1,13 @@
-import re
 import os
+import logging
+from shmooapp.analysis.common_utils import extract_x_axis_info
+from shmooapp.analysis.shmoo_header import load_test_header, keep_test_header
+from shmooapp.analysis.plot_reader import note_plot_write
+from shmooapp.analysis import metrics
+
+logger = logging.getLogger(__name__)
+
+NO_PASS_RANGE = "(      ..      )"
 
 def calculate_ns_range(shmoo_str, start_ns=5.0, step_ns=5.0):
     """
@@ -10,84 +18,125 @@ def calculate_ns_range(shmoo_str, start_ns=5.0, step_ns=5.0):
     :param step_ns: Step size in ns.
     :return: Tuple of (min_ns, max_ns) or None if no 'P' found.
     """
-    min_ns = None
-    max_ns = None
-    for index, char in enumerate(shmoo_str):
-        if char == 'P':
-            current_ns = start_ns + index * step_ns
-            if min_ns is None:
-                min_ns = current_ns
-            max_ns = current_ns
-    if min_ns is not None and max_ns is not None:
-        return (min_ns, max_ns)
-    return None
-
-def update_shmoo_log(file_path, output_path):
+    return calculate_ns_ranges([shmoo_str], start_ns, step_ns)[0]
+
+def calculate_ns_ranges(shmoo_rows, start_ns, step_ns):
+    """
+    Calculates the pass range of every row of a shmoo grid at once.
+    The first and last 'P' of each distinct row are located with str.find/str.rfind,
+    so no per-character loop runs in Python and repeated rows are searched once.
+
+    :param shmoo_rows: Data strings of the grid, one per VDD.
+    :param start_ns: X value of the first column (from the X-Axis header).
+    :param step_ns: X step size in ns (from the X-Axis header).
+    :return: List of (min_ns, max_ns) or None for rows without 'P'.
+    """
+    ranges = {}
+    for row in set(shmoo_rows):
+        first = row.find('P')
+        ranges[row] = None if first < 0 else (start_ns + first * step_ns, start_ns + row.rfind('P') * step_ns)
+    return [ranges[row] for row in shmoo_rows]
+
+def format_ns_range(ns_range):
+    """
+    Formats a pass range as written after each shmoo row, e.g. "(40.000..50.000)".
+
+    :param ns_range: Tuple of (min_ns, max_ns) or None.
+    :return: Formatted range, or the empty range of the tester if None.
+    """
+    if ns_range is None:
+        return NO_PASS_RANGE
+    min_ns, max_ns = ns_range
+    return f"({min_ns:.3f}..{max_ns:.3f})"
+
+def _split_shmoo_row(line):
+    """
+    Splits a shmoo row into (data string, range start, range end) positions.
+    #    0.740   !......P.PPPPPPPPPPPPPPPPPPPPP (40.000..50.000)
+
+    :return: Tuple of (shmoo_str, open_index, close_index) or None if not a shmoo row.
+    """
+    open_index = line.rfind('(')
+    if open_index < 0:
+        return None
+    close_index = line.find(')', open_index)
+    if close_index < 0:
+        return None
+    fields = line[:open_index].split()
+    if not fields:
+        return None
+    shmoo_str = fields[-1].lstrip('*')
+    if not shmoo_str or shmoo_str.strip('!.P'):
+        return None
+    return shmoo_str, open_index, close_index
+
+def update_shmoo_log(file_path, output_path, header=None):
     """
     Reads the Shmoo Plot log file, updates the min and max ns values for each voltage line,
     and writes the changes back to the file.
+    The ns values are taken from the X-Axis header of the section.
 
     :param file_path: Path to the Shmoo Plot log file.
+    :param header: ShmooHeader of the file from load_test_header, parsed here if None.
     """
     with open(file_path, 'r') as file:
         lines = file.readlines()
 
-    shmoo_section = False
-    updated_lines = []
-
-    for line in lines:
-        # Detect the start of the Shmoo Plot section
-        if '**** Shmoo Plot' in line:
-            shmoo_section = True
-            updated_lines.append(line)
-            continue
-
-        if shmoo_section:
-            # Detect the end of the Shmoo Plot section
-            #        V   +---------+*--------+--------+
-            end_matched = re.match(r'^\s*V\s++.*', line)
-            if end_matched:
-                shmoo_section = False
-                updated_lines.append(line)
-                continue
-
-            # Match lines with voltage and shmoo data
-            #    0.740   !......P.PPPPPPPPPPPPPPPPPPPPP (40.000..50.000)
-            match = re.match(r'^(\s*\d+\.\d+)[\s*]+([!\.P]+)\s+\(([^)]+)\)', line)
-            if match:
-                voltage = match.group(1)
-                shmoo_str = match.group(2)
-                existing_range = match.group(3)
-
-                # Calculate min and max ns
-                ns_range = calculate_ns_range(shmoo_str)
-                if ns_range:
-                    min_ns, max_ns = ns_range
-                    new_range = f"({min_ns:.3f}..{max_ns:.3f})"
-                    
-                    # Replace the existing range with the new range
-                    new_line = re.sub(r'\([^)]+\)', new_range, line)
-                    updated_lines.append(new_line)
-                else:
-                    # If no 'P' found, keep the line unchanged
-                    updated_lines.append(line)
-            else:
-                # Lines that do not match the shmoo data pattern
-                updated_lines.append(line)
-        else:
-            # Lines outside the Shmoo Plot section are kept unchanged
-            updated_lines.append(line)
+    try:
+        start_ns, _, step_ns = header.x_axis_info() if header else extract_x_axis_info(lines)
+    except ValueError as e:
+        logger.error("Error processing %s: %s", file_path, e)
+        metrics.inc(metrics.ERRORS, stage="range")
+        return
+
+    # Locate the Shmoo Plot section once
+    #  **** Shmoo Plot : ... *****
+    #        V   +---------+*--------+--------+
+    plot_start = None
+    plot_end = len(lines)
+    for i, line in enumerate(lines):
+        if plot_start is None:
+            if '**** Shmoo Plot' in line:
+                plot_start = i + 1
+        elif line.lstrip().startswith('V ') and ('+' in line or '*' in line):
+            plot_end = i
+            break
+    if plot_start is None:
+        logger.error("Error processing %s: Shmoo Plot section not found.", file_path)
+        metrics.inc(metrics.ERRORS, stage="range")
+        return
+
+    # Collect all shmoo rows, then compute their ranges in one call
+    row_indices = []
+    row_parts = []
+    for i in range(plot_start, plot_end):
+        parts = _split_shmoo_row(lines[i])
+        if parts:
+            row_indices.append(i)
+            row_parts.append(parts)
+    ns_ranges = calculate_ns_ranges([parts[0] for parts in row_parts], start_ns, step_ns)
+
+    for i, (shmoo_str, open_index, close_index), ns_range in zip(row_indices, row_parts, ns_ranges):
+        if ns_range:
+            line = lines[i]
+            lines[i] = line[:open_index] + format_ns_range(ns_range) + line[close_index + 1:]
+        # If no 'P' found, keep the line unchanged
 
     # Write the updated lines back to the file
     with open(output_path, 'w') as file:
-        file.writelines(updated_lines)
+        file.writelines(lines)
+    note_plot_write(output_path)
+    metrics.inc(metrics.FILES_WRITTEN, kind="range")
 
 def update_files_for_range(input_directory):
     # Process all .log files in the input directory
+    test_header = load_test_header(input_directory)
     for filename in sorted(os.listdir(input_directory)):
         if filename.endswith('.log'):
             file_path = os.path.join(input_directory, filename)
-            update_shmoo_log(file_path,file_path)
+            update_shmoo_log(file_path,file_path,test_header.for_site(filename))
+    # only data rows were rewritten, the headers stay valid
+    keep_test_header(input_directory, test_header)
 
 
 
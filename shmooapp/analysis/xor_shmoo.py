@@ -1,19 +1,29 @@
 import os
 import re
 import sys
-import argparse
+import json
+import logging
 from collections import defaultdict
-from shmooapp.analysis.common_utils import VDD_PATTERNS
+from shmooapp.analysis.common_utils import VDD_PATTERNS, extract_x_axis_info, vdd_to_mv, format_mv
+from shmooapp.analysis.update_shmoo_range import calculate_ns_ranges, format_ns_range
+from shmooapp.analysis.shmoo_header import load_test_header
+from shmooapp.analysis.row_table import shared_row_table
+from shmooapp.analysis.plot_reader import note_plot_write
+from shmooapp.analysis import metrics
 
-def parse_log_file(file_path):
+logger = logging.getLogger(__name__)
+
+def parse_log_file(file_path, data_start=None):
     """
     Parses a log file and extracts header, data block, footer, VDD data, and '*' presence.
 
     Args:
         file_path (str): Path to the log file.
+        data_start (int): First data row if known from the ShmooHeader; searched if None.
 
     Returns:
         tuple: (header_lines, data_block, footer_lines, vdd_data_dict, vdd_has_star_dict)
+               with VDD keys in integer mV
     """
     with open(file_path, 'r') as f:
         lines = f.readlines()
@@ -24,16 +34,19 @@ def parse_log_file(file_path):
     vdd_data = {}
     vdd_has_star = {}
 
-    data_start = None
     data_end = None
 
     # Identify the start of the data block
-    for i, line in enumerate(lines):
-        #if line.strip() == "VDD":
-        if line.strip() in VDD_PATTERNS:
-            data_start = i + 2  # Two lines below 'VDD'
-            header_lines = lines[:data_start]
-            break
+    if data_start is not None and data_start - 2 < len(lines) and lines[data_start - 2].strip() in VDD_PATTERNS:
+        header_lines = lines[:data_start]
+    else:
+        data_start = None
+        for i, line in enumerate(lines):
+            #if line.strip() == "VDD":
+            if line.strip() in VDD_PATTERNS:
+                data_start = i + 2  # Two lines below 'VDD'
+                header_lines = lines[:data_start]
+                break
 
     if data_start is None:
         raise ValueError(f"'VDD' line not found in {file_path}")
@@ -65,7 +78,7 @@ def parse_log_file(file_path):
         if not match:
             # Handle lines that don't match expected format
             continue
-        vdd = float(match.group(1))
+        vdd = vdd_to_mv(match.group(1))
         has_star = bool(match.group(2))
         data_str = match.group(3)
         # Remove '*' from data string if present
@@ -76,29 +89,6 @@ def parse_log_file(file_path):
 
     return header_lines, data_block, footer_lines, vdd_data, vdd_has_star
 
-def compute_xor_data(aggregated_data, original_data):
-    """
-    Computes XOR data string between aggregated and original data strings.
-
-    Args:
-        aggregated_data (str): Aggregated data string.
-        original_data (str): Original site data string.
-
-    Returns:
-        str: XOR data string.
-    """
-    if len(aggregated_data) != len(original_data):
-        raise ValueError("Data string lengths do not match for XOR operation.")
-
-    xor_data = []
-    for agg_char, orig_char in zip(aggregated_data, original_data):
-        if agg_char != orig_char:
-            xor_char = 'X'  # Define 'X' as the XOR result
-        else:
-            xor_char = '.'  # Mark similar positions with '.'
-        xor_data.append(xor_char)
-    return ''.join(xor_data)
-
 def aggregate_star_presence(aggregated_star, original_star):
     """
     Determines if any of the logs have '*' presence for a given VDD.
@@ -115,100 +105,265 @@ def aggregate_star_presence(aggregated_star, original_star):
         xor_star[vdd] = aggregated_star.get(vdd, False) or original_star.get(vdd, False)
     return xor_star
 
-def create_xor_log(header_lines, footer_lines, vdd_xor_data, vdd_xor_star, output_file):
+def format_xor_rows(vdd_xor_data, vdd_xor_star, ns_ranges):
     """
-    Creates a new log file with XOR data.
+    Formats the XOR data rows of a plot, highest VDD first.
 
     Args:
-        header_lines (list): Header lines from the aggregated log.
-        footer_lines (list): Footer lines from the aggregated log.
         vdd_xor_data (dict): VDD to XOR data string mapping.
         vdd_xor_star (dict): VDD to '*' presence mapping for XOR log.
-        output_file (str): Path to the output XOR log file.
+        ns_ranges (list): Pass range (or None) for each row, highest VDD first.
+
+    Returns:
+        list: Formatted rows including the line break.
     """
-    with open(output_file, 'w') as f:
-        # Write header
-        f.writelines(header_lines)
-        # Write XOR data strings
-        sorted_vdd = sorted(vdd_xor_data.keys(), reverse=True)
-        for vdd in sorted_vdd:
-            data_str = vdd_xor_data[vdd]
-            has_star = vdd_xor_star.get(vdd, False)
-            # Format VDD value to three decimal places
-            vdd_formatted = f"{vdd:7.3f}"
-            if has_star:
-                # Insert '*' before the data string and adjust spacing
-                f.write(f"{vdd_formatted}  *{data_str} (15.000..      )\n")
+    rows = []
+    sorted_vdd = sorted(vdd_xor_data.keys(), reverse=True)
+    for vdd, ns_range in zip(sorted_vdd, ns_ranges):
+        data_str = vdd_xor_data[vdd]
+        has_star = vdd_xor_star.get(vdd, False)
+        range_str = format_ns_range(ns_range)
+        # Format VDD value to three decimal places
+        vdd_formatted = f"{format_mv(vdd):>7}"
+        if has_star:
+            # Insert '*' before the data string and adjust spacing
+            rows.append(f"{vdd_formatted}  *{data_str} {range_str}\n")
+        else:
+            # Standard spacing with three spaces
+            rows.append(f"{vdd_formatted}   {data_str} {range_str}\n")
+    return rows
+
+
+# Sparse XOR format
+# Almost every XOR cell is '.', so instead of one full log per site, a single JSON file
+# per aggregation mode holds, per site, only the differing cells as runs
+# [vdd_mv, x_start, x_end) of a row. Full XOR logs are rendered from it on demand.
+# Everything else a rendered log shows is read from the plots next to the sparse file:
+# header, footer and row widths from the aggregated log, the range column (the pass
+# range of the site) from the site log.
+#   {"version": 2, "mode": "OR_XOR", "aggregate": "<test>_aggregated_OR.log",
+#    "vdd_mv": [1300, 1280, ...],
+#    "sites": {"<site>.log": {"mismatches": 3, "diff": [[1300, 4, 7], ...], "invalid": [],
+#                             "star": [1000]}}}
+XOR_SPARSE_VERSION = 2
+XOR_SPARSE_SUFFIX = ".json"
+
+def generate_xor_sparse_name(curdir, xor_prefix):
+    # e.g. out.plot/<log>/<test>.OR_XOR.json
+    return curdir + "." + xor_prefix + XOR_SPARSE_SUFFIX
+
+def xor_test_dir(sparse_path):
+    # e.g. out.plot/<log>/<test>.OR_XOR.json -> out.plot/<log>/<test>
+    return sparse_path[:-len(XOR_SPARSE_SUFFIX)].rsplit('.', 1)[0]
+
+def compute_xor_diff(aggregated_data, original_data):
+    """
+    Finds the runs of cells where the aggregated and original data strings differ.
+
+    Args:
+        aggregated_data (str): Aggregated data string.
+        original_data (str): Original site data string.
+
+    Returns:
+        list: (start, end) column runs of differing cells, end exclusive.
+    """
+    if len(aggregated_data) != len(original_data):
+        raise ValueError("Data string lengths do not match for XOR operation.")
+    if aggregated_data == original_data:
+        return []
+    runs = []
+    for x, (agg_char, orig_char) in enumerate(zip(aggregated_data, original_data)):
+        if agg_char != orig_char:
+            if runs and runs[-1][1] == x:
+                runs[-1][1] = x + 1
             else:
-                # Standard spacing with three spaces
-                f.write(f"{vdd_formatted}   {data_str} (15.000..      )\n")
-        # Write footer
-        f.writelines(footer_lines)
-    print(f"XOR log file created: {output_file}")
+                runs.append([x, x + 1])
+    return runs
 
-def process_xor(curdir:str,aggfile:str,xor_prefix:str):
-    #
-    aggregated_log_file = aggfile
-    original_logs_dir = curdir
-    output_dir = curdir+"."+xor_prefix
+def load_xor_sparse(file_path):
+    with open(file_path, 'r') as f:
+        return json.load(f)
 
+def render_xor_site(sparse, site, test_dir):
+    """
+    Renders the full XOR log text of a single site from the sparse XOR data.
+
+    Args:
+        sparse (dict): Sparse XOR data (see load_xor_sparse).
+        site (str): Site log file name, e.g. "site1.log".
+        test_dir (str): Test directory holding the site log, next to the aggregated log.
+
+    Returns:
+        str: XOR log text: the aggregate header and footer around the XOR rows, with
+        the pass range of the site on every row.
+    """
+    entry = sparse['sites'][site]
+    vdd_axis = sparse['vdd_mv']
+    aggfile = os.path.join(os.path.dirname(test_dir), sparse['aggregate'])
+    agg_header, _, agg_footer, agg_vdd_data, _ = parse_log_file(aggfile)
+    cells = {vdd: ['.'] * len(agg_vdd_data.get(vdd, '')) for vdd in vdd_axis}
+    for vdd, start, end in entry['diff']:
+        cells[vdd][start:end] = 'X' * (end - start)
+    for vdd in entry['invalid']:
+        cells[vdd] = ['?'] * len(cells[vdd])  # Placeholder for error
+    vdd_xor_data = {vdd: ''.join(row) for vdd, row in cells.items()}
+    stars = set(entry['star'])
+    vdd_xor_star = {vdd: vdd in stars for vdd in vdd_axis}
+
+    site_header = load_test_header(test_dir).for_site(site)
+    _, _, _, site_vdd_data, _ = parse_log_file(os.path.join(test_dir, site),
+                                               site_header.data_start if site_header else None)
+    x_start, _, x_step = extract_x_axis_info(agg_header)
+    ns_ranges = calculate_ns_ranges([site_vdd_data.get(vdd, '') for vdd in vdd_axis], x_start, x_step)
+    return ''.join(agg_header) + ''.join(format_xor_rows(vdd_xor_data, vdd_xor_star, ns_ranges)) + ''.join(agg_footer)
+
+def render_xor_texts(sparse, test_dir):
+    """
+    Renders the XOR log texts of all sites.
+
+    Returns:
+        list: (site, text) tuples sorted by site name.
+    """
+    return [(site, render_xor_site(sparse, site, test_dir)) for site in sorted(sparse['sites'])]
+
+def materialize_xor_logs(sparse_path, output_dir=None):
+    """
+    Writes the full per-site XOR logs of a sparse XOR file, e.g. for external tools.
+
+    Args:
+        sparse_path (str): Path to the sparse XOR file.
+        output_dir (str): Output directory, <test>.<prefix> next to the sparse file if None.
+
+    Returns:
+        str: The output directory.
+    """
+    if output_dir is None:
+        output_dir = sparse_path[:-len(XOR_SPARSE_SUFFIX)]
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
-        print(f"Output directory '{output_dir}' created.")
+    for site, text in render_xor_texts(load_xor_sparse(sparse_path), xor_test_dir(sparse_path)):
+        with open(os.path.join(output_dir, site), 'w') as f:
+            f.write(text)
+        note_plot_write(os.path.join(output_dir, site))
+        metrics.inc(metrics.FILES_WRITTEN, kind="xor")
+    return output_dir
+
+def process_xor(curdir:str,aggfile:str,xor_prefix:str):
+    """
+    Compares every site log of a test against an aggregated log and writes the
+    differences in the sparse XOR format.
+
+    Args:
+        curdir (str): Test directory holding the site .log files.
+        aggfile (str): Path to the aggregated log.
+        xor_prefix (str): OR_XOR, AND_XOR or MajorityVote_XOR.
+
+    Returns:
+        str: Path to the sparse XOR file.
+    """
+    aggregated_log_file = aggfile
+    original_logs_dir = curdir
+    output_file = generate_xor_sparse_name(curdir, xor_prefix)
 
     # Parse aggregated log
     try:
         agg_header, agg_data_block, agg_footer, agg_vdd_data, agg_vdd_has_star = parse_log_file(aggregated_log_file)
     except ValueError as e:
-        print(f"Error parsing aggregated log file: {e}")
+        logger.error("Error parsing aggregated log file: %s", e)
         sys.exit(1)
 
     # Iterate over original log files
     original_log_files = [f for f in os.listdir(original_logs_dir) if f.endswith('.log')]
     if not original_log_files:
-        print(f"No .log files found in input directory '{original_logs_dir}'.")
+        logger.error("No .log files found in input directory '%s'.", original_logs_dir)
         sys.exit(1)
 
-    for orig_log in original_log_files:
+    vdd_axis = sorted(agg_vdd_data.keys(), reverse=True)
+    test_header = load_test_header(original_logs_dir)
+    # XOR runs are memoized per row id, most site rows equal the aggregate row
+    table = shared_row_table()
+    agg_ids = table.encode(agg_vdd_data)
+    sites = {}
+    for orig_log in sorted(original_log_files):
         orig_log_path = os.path.join(original_logs_dir, orig_log)
+        header = test_header.for_site(orig_log)
         try:
-            orig_header, orig_data_block, orig_footer, orig_vdd_data, orig_vdd_has_star = parse_log_file(orig_log_path)
+            orig_header, orig_data_block, orig_footer, orig_vdd_data, orig_vdd_has_star = parse_log_file(
+                orig_log_path, header.data_start if header else None)
         except ValueError as e:
-            print(f"Error parsing original log file '{orig_log}': {e}")
+            logger.error("Error parsing original log file '%s': %s", orig_log, e)
+            metrics.inc(metrics.ERRORS, stage="xor")
             continue  # Skip to next file
 
         # Check VDD consistency
         if set(agg_vdd_data.keys()) != set(orig_vdd_data.keys()):
-            print(f"VDD values mismatch between aggregated log and original log '{orig_log}'. Skipping.")
+            logger.warning("VDD values mismatch between aggregated log and original log '%s'. Skipping.", orig_log)
+            metrics.inc(metrics.ERRORS, stage="xor")
             continue
 
-        # Compute XOR data
-        xor_vdd_data = {}
-        for vdd in agg_vdd_data:
-            agg_data_str = agg_vdd_data[vdd]
-            orig_data_str = orig_vdd_data[vdd]
+        # Keep only the differing cells
+        orig_ids = table.encode(orig_vdd_data)
+        diff = []
+        invalid = []
+        for vdd in vdd_axis:
             try:
-                xor_data_str = compute_xor_data(agg_data_str, orig_data_str)
-                xor_vdd_data[vdd] = xor_data_str
+                runs = table.memoize(
+                    ('xor', agg_ids[vdd], orig_ids[vdd]),
+                    lambda: tuple(map(tuple, compute_xor_diff(agg_vdd_data[vdd], orig_vdd_data[vdd]))))
+                diff.extend([vdd, start, end] for start, end in runs)
             except ValueError as e:
-                print(f"Error computing XOR for VDD={vdd} in log '{orig_log}': {e}")
-                xor_vdd_data[vdd] = ''.join(['?'] * len(agg_data_str))  # Placeholder for error
+                logger.error("Error computing XOR for VDD=%s in log '%s': %s", format_mv(vdd), orig_log, e)
+                invalid.append(vdd)
 
-        # Track '*' presence in XOR log (retain '*' if present in either aggregated or original log for the VDD)
-        xor_vdd_star = {}
-        for vdd in agg_vdd_has_star:
-            xor_vdd_star[vdd] = agg_vdd_has_star.get(vdd, False) or orig_vdd_has_star.get(vdd, False)
+        # Retain '*' if present in either aggregated or original log for the VDD
+        star = [vdd for vdd in vdd_axis if agg_vdd_has_star.get(vdd, False) or orig_vdd_has_star.get(vdd, False)]
 
-        # Define output file name, e.g., 'XOR_site1.log' based on original log 'site1.log'
-        orig_log_basename = os.path.basename(orig_log)
-        #xor_log_basename = f"XOR_{orig_log_basename}"
-        xor_log_basename = f"{orig_log_basename}"
-        xor_log_path = os.path.join(output_dir, xor_log_basename)
+        sites[os.path.basename(orig_log)] = {
+            'mismatches': sum(end - start for _, start, end in diff),
+            'diff': diff,
+            'invalid': invalid,
+            'star': star,
+        }
 
-        # Write XOR log file
-        try:
-            create_xor_log(agg_header, agg_footer, xor_vdd_data, xor_vdd_star, xor_log_path)
-        except Exception as e:
-            print(f"Error writing XOR log file '{xor_log_basename}': {e}")
-            continue
-    return output_dir
\ No newline at end of file
+    sparse = {
+        'version': XOR_SPARSE_VERSION,
+        'mode': xor_prefix,
+        'aggregate': os.path.basename(aggregated_log_file),
+        'vdd_mv': vdd_axis,
+        'sites': sites,
+    }
+    with open(output_file, 'w') as f:
+        json.dump(sparse, f, separators=(',', ':'))
+    logger.debug("Sparse XOR file created: %s", output_file)
+    metrics.inc(metrics.FILES_WRITTEN, kind="xor")
+    return output_file
+
+def is_xor_current(curdir, aggfile, xor_prefix):
+    """
+    Checks if the sparse XOR file of a mode has the current version and is newer than
+    the aggregated log and all site logs.
+    """
+    sparse_path = generate_xor_sparse_name(curdir, xor_prefix)
+    try:
+        sparse_mtime = os.stat(sparse_path).st_mtime_ns
+        with open(sparse_path, 'r') as f:
+            # the version is written first: '{"version":2,...'
+            if not f.read(32).startswith(f'{{"version":{XOR_SPARSE_VERSION},'):
+                return False
+    except FileNotFoundError:
+        return False
+    inputs = [aggfile] + [os.path.join(curdir, f) for f in os.listdir(curdir) if f.endswith('.log')]
+    return all(os.stat(path).st_mtime_ns <= sparse_mtime for path in inputs)
+
+def ensure_xor(curdir, aggfile, xor_prefix):
+    """
+    Lazy XOR stage: computes the sparse XOR file of a mode only when it is missing
+    or older than its inputs, e.g. the first time the mode is opened for a test.
+
+    Returns:
+        str: Path to the sparse XOR file.
+    """
+    if is_xor_current(curdir, aggfile, xor_prefix):
+        logger.debug("Reusing sparse XOR file for %s (%s)", curdir, xor_prefix)
+        return generate_xor_sparse_name(curdir, xor_prefix)
+    return process_xor(curdir, aggfile, xor_prefix)
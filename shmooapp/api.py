@@ -0,0 +1,114 @@
+"""API routes served by the Reflex backend next to the pages."""
+
+import os
+import html
+import asyncio
+from email.utils import formatdate, parsedate_to_datetime
+
+from starlette.requests import Request
+from starlette.responses import FileResponse, HTMLResponse, JSONResponse, PlainTextResponse, Response
+
+from shmooapp.config import PLOTSDIR, ARCHIVEDIR
+from shmooapp.urls import IMAGES_ROUTE, PLOTS_ROUTE
+from shmooapp.analysis.metrics import render_prometheus
+from shmooapp.analysis.jobs import job_scheduler
+from shmooapp.analysis.query import find_log_dirs, run_query, QueryNotFound
+from shmooapp.analysis.plot_reader import read_texts_async
+from shmooapp.analysis.xor_shmoo import load_xor_sparse, render_xor_site, xor_test_dir, XOR_SPARSE_SUFFIX
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+IMAGE_MEDIA_TYPES = {".png": "image/png", ".svg": "image/svg+xml"}
+IMAGE_ROOTS = (PLOTSDIR, ARCHIVEDIR)
+QUERY_ROOTS = (PLOTSDIR, ARCHIVEDIR)
+PLOT_TEXT_ROOTS = (PLOTSDIR, ARCHIVEDIR)
+# plot texts are shown in frames, in the font of the plot boxes
+PLOT_TEXT_PAGE = ("<!DOCTYPE html><meta charset=\"utf-8\"><pre style=\"margin:0;white-space:pre-wrap;"
+                  "font-size:12px;font-family:'MS Gothic','BIZ UDゴシック',monospace\">{}</pre>")
+# clients may keep responses but must revalidate them with If-None-Match
+QUERY_CACHE_CONTROL = "no-cache"
+
+
+async def metrics_endpoint():
+    # Counters and stage latencies of the analysis pipeline in the Prometheus text format
+    return PlainTextResponse(render_prometheus(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+async def jobs_endpoint():
+    # Queued, running and recently finished jobs of the scheduler
+    return JSONResponse(job_scheduler.jobs())
+
+
+async def image_endpoint(path: str):
+    # Heatmap images below PLOTSDIR or ARCHIVEDIR, e.g. /images/out.plot/<job>/<log>/<test>.images/<site>.png
+    full_path = os.path.realpath(path)
+    media_type = IMAGE_MEDIA_TYPES.get(os.path.splitext(full_path)[1])
+    allowed = any(full_path.startswith(os.path.realpath(root) + os.sep) for root in IMAGE_ROOTS)
+    if media_type is None or not allowed or not os.path.isfile(full_path):
+        return PlainTextResponse("Not found", status_code=404)
+    return FileResponse(full_path, media_type=media_type)
+
+
+async def plot_text_endpoint(path: str, site: str = ""):
+    # Text of a plot below PLOTSDIR or ARCHIVEDIR, e.g. /plots/out.plot/<job>/<log>/<test>/<site>.log,
+    # or of an XOR site rendered from its sparse file: /plots/out.plot/<job>/<log>/<test>.OR_XOR.json?site=<site>.log
+    full_path = os.path.realpath(path)
+    allowed = any(full_path.startswith(os.path.realpath(root) + os.sep) for root in PLOT_TEXT_ROOTS)
+    if not allowed or not os.path.isfile(full_path):
+        return PlainTextResponse("Not found", status_code=404)
+    if full_path.endswith(".log"):
+        text, = await read_texts_async([full_path])
+    elif full_path.endswith(XOR_SPARSE_SUFFIX) and site:
+        try:
+            text = await asyncio.to_thread(
+                lambda: render_xor_site(load_xor_sparse(full_path), site, xor_test_dir(full_path)))
+        except (KeyError, ValueError, OSError):
+            return PlainTextResponse("Not found", status_code=404)
+    else:
+        return PlainTextResponse("Not found", status_code=404)
+    return HTMLResponse(PLOT_TEXT_PAGE.format(html.escape(text)), headers={"Cache-Control": QUERY_CACHE_CONTROL})
+
+
+async def query_logs_endpoint():
+    # Processed and archived logs, e.g. ["out.archive/20241203-D4930...", "out.plot/<job>/D4930..."]
+    return JSONResponse(await asyncio.to_thread(find_log_dirs, QUERY_ROOTS))
+
+
+def _not_modified(request, result):
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return any(tag.strip() in (f'"{result.etag}"', "*") for tag in if_none_match.split(","))
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return parsedate_to_datetime(if_modified_since).timestamp() >= int(result.last_modified)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+async def query_endpoint(request: Request, kind: str, log: str = "", test: str = "", mode: str = ""):
+    # /query/{tests|sites|aggregates|xor|margins}?log=<log>&test=<test>&mode=<OR|AND|Majority>
+    try:
+        result = await asyncio.to_thread(run_query, QUERY_ROOTS, kind, log, test, mode or None)
+    except QueryNotFound as e:
+        return JSONResponse({'error': str(e)}, status_code=404)
+    except ValueError as e:
+        # plots of the test that cannot be parsed, e.g. for the margins
+        return JSONResponse({'error': str(e)}, status_code=422)
+    headers = {
+        "ETag": f'"{result.etag}"',
+        "Last-Modified": formatdate(result.last_modified, usegmt=True),
+        "Cache-Control": QUERY_CACHE_CONTROL,
+    }
+    if _not_modified(request, result):
+        return Response(status_code=304, headers=headers)
+    return Response(result.body, media_type="application/json", headers=headers)
+
+
+def register_api_routes(app):
+    app.api.add_api_route("/metrics", metrics_endpoint, methods=["GET"])
+    app.api.add_api_route("/jobs", jobs_endpoint, methods=["GET"])
+    app.api.add_api_route(IMAGES_ROUTE + "/{path:path}", image_endpoint, methods=["GET"])
+    app.api.add_api_route(PLOTS_ROUTE + "/{path:path}", plot_text_endpoint, methods=["GET"])
+    app.api.add_api_route("/query/logs", query_logs_endpoint, methods=["GET"])
+    app.api.add_api_route("/query/{kind}", query_endpoint, methods=["GET"])
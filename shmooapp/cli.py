@@ -0,0 +1,250 @@
+import os
+import sys
+import json
+import argparse
+import subprocess
+from shmooapp.config import PLOTSDIR, ARCHIVEDIR, INGESTDIR, INGEST_WORKSPACE
+
+# Command line runs of the analysis core, without the Reflex or Tk frontends:
+#   python -m shmooapp.cli run uploaded_files/D5700_FF_CP1_SHMOO.log
+#   python -m shmooapp.cli ingest
+#   python -m shmooapp.cli export out.archive/20241219-D5700_FF_CP1_SHMOO -o dataset
+#   python -m shmooapp.cli drift
+#   python -m shmooapp.cli spec --point 0.9,60 --point 0.8,100 out.archive/20241219-D5700_FF_CP1_SHMOO
+#   python -m shmooapp.cli opcenter out.archive/20241219-D5700_FF_CP1_SHMOO
+#   python -m shmooapp.cli window --sites out.archive/20241219-D5700_FF_CP1_SHMOO
+#   python -m shmooapp.cli check-imports
+# The core (shmooapp.config and shmooapp.analysis.*) must import without any frontend
+# module, since job workers and spawned render processes import it again; check-imports
+# measures it in a fresh interpreter against CORE_IMPORT_BUDGET_MS.
+CORE_MODULES = (
+    "shmooapp.config",
+    "shmooapp.analysis.pipeline",
+    "shmooapp.analysis.ingest",
+    "shmooapp.analysis.query",
+    "shmooapp.analysis.columnar_export",
+    "shmooapp.analysis.drift",
+    "shmooapp.analysis.spec_check",
+    "shmooapp.analysis.margin_map",
+)
+FRONTEND_MODULES = ("reflex", "tkinter", "starlette")
+CORE_IMPORT_BUDGET_MS = 80
+IMPORT_BUDGET_ENV = "SHMOO_IMPORT_BUDGET_MS"
+SLOWEST_IMPORTS_SHOWN = 8
+
+
+def measure_core_imports(modules=CORE_MODULES):
+    """
+    Imports modules in a fresh interpreter.
+
+    Returns:
+        dict: 'ms' (wall time of the imports), 'frontend' (frontend modules that got
+        imported) and 'slowest' ((self us, module) of the slowest single imports).
+    """
+    code = (
+        "import sys, time, json\n"
+        "t = time.perf_counter()\n"
+        f"for m in {list(modules)!r}: __import__(m)\n"
+        "ms = (time.perf_counter() - t) * 1000\n"
+        f"print(json.dumps({{'ms': ms, 'frontend': [m for m in {list(FRONTEND_MODULES)!r} if m in sys.modules]}}))\n"
+    )
+    cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          capture_output=True, text=True, cwd=cwd, check=True)
+    result = json.loads(proc.stdout.splitlines()[-1])
+    # "import time: self [us] | cumulative | imported package"
+    slowest = []
+    for line in proc.stderr.splitlines():
+        fields = line.split("|")
+        if line.startswith("import time:") and len(fields) == 3 and fields[0].split(":")[1].strip().isdigit():
+            slowest.append((int(fields[0].split(":")[1]), fields[2].strip()))
+    result['slowest'] = sorted(slowest, reverse=True)[:SLOWEST_IMPORTS_SHOWN]
+    return result
+
+
+def cmd_check_imports(args):
+    budget = args.budget_ms or float(os.environ.get(IMPORT_BUDGET_ENV, CORE_IMPORT_BUDGET_MS))
+    result = measure_core_imports()
+    print(f"core import: {result['ms']:.1f} ms (budget {budget:.0f} ms)")
+    for self_us, module in result['slowest']:
+        print(f"  {self_us / 1000:6.1f} ms  {module}")
+    ok = True
+    if result['frontend']:
+        print(f"frontend modules imported by the core: {', '.join(result['frontend'])}")
+        ok = False
+    if result['ms'] > budget:
+        print("core import is over budget")
+        ok = False
+    return 0 if ok else 1
+
+
+def cmd_run(args):
+    from shmooapp.analysis.jobs import create_workspace
+    from shmooapp.analysis.pipeline import run_log_pipeline, run_log_pipeline_overlapped
+
+    output_dir = args.output or create_workspace(PLOTSDIR)
+    for log_path in args.logs:
+        if args.sequential:
+            subdirs = run_log_pipeline(log_path, output_dir)
+        else:
+            options = {'workers': args.workers} if args.workers else {}
+            subdirs = run_log_pipeline_overlapped(log_path, output_dir, **options)
+        print(f"{log_path}: {len(subdirs)} tests -> {os.path.dirname(subdirs[0]) if subdirs else output_dir}")
+    return 0
+
+
+def cmd_ingest(args):
+    from shmooapp.analysis.ingest import IngestDaemon
+
+    def on_event(kind, log_path, test):
+        print(f"{kind}: {os.path.basename(log_path)}" + (f" {os.path.basename(test)}" if test else ""), flush=True)
+
+    options = {'poll_interval': args.interval} if args.interval else {}
+    daemon = IngestDaemon(args.drop, args.output, on_event=on_event, **options)
+    print(f"watching {args.drop} -> {args.output} (Ctrl-C to stop)", flush=True)
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def cmd_export(args):
+    from shmooapp.analysis.columnar_export import export_log
+
+    for log_dir in args.log_dirs:
+        try:
+            counts = export_log(log_dir, args.output, format=args.format, compression=args.compression)
+        except ImportError as e:
+            print(e, file=sys.stderr)
+            return 2
+        print(f"{log_dir}: {counts['cells']} cells, {counts['margins']} margins")
+    return 0
+
+
+def cmd_drift(args):
+    from shmooapp.analysis.drift import update_drift, format_drift_flag
+
+    store = update_drift(args.archive)
+    flags = store.flags()
+    print(f"{len(store.runs)} runs, {len(store.series)} series, {len(flags)} shifts")
+    for flag in flags:
+        print(format_drift_flag(flag))
+    return 1 if flags and args.fail_on_shift else 0
+
+
+def cmd_spec(args):
+    from shmooapp.analysis.spec_check import (
+        parse_spec_points, format_spec_point, evaluate_log, evaluate_archive, failing_corners, write_spec_csv,
+    )
+
+    points = parse_spec_points(args.point)
+    if args.points_file:
+        with open(args.points_file, 'r') as f:
+            points += parse_spec_points(f)
+    if not points:
+        print("no spec points given", file=sys.stderr)
+        return 2
+    results = evaluate_archive(args.archive, points) if args.archive else []
+    results += [evaluate_log(log_dir, points) for log_dir in args.log_dirs]
+    if args.csv:
+        write_spec_csv(results, args.csv)
+    failing = failing_corners(results)
+    plots = sum(len(plots) for r in results for plots in r['tests'].values())
+    print(f"{len(points)} spec points on {plots} plots of {len(results)} logs: {len(failing)} failing")
+    for log_dir, test, plot, point in failing:
+        print(f"FAIL {format_spec_point(point)} {os.path.basename(log_dir)} {test} {plot}")
+    return 1 if failing and args.fail_on_violation else 0
+
+
+def cmd_opcenter(args):
+    from shmooapp.analysis.margin_map import log_op_centers, format_op_center
+
+    for log_dir in args.log_dirs:
+        print(log_dir)
+        for test, plots in log_op_centers(log_dir).items():
+            for name, result in plots.items():
+                if args.sites or name == args.mode:
+                    print(f"  {test} {format_op_center(name, result)}")
+    return 0
+
+
+def cmd_window(args):
+    from shmooapp.analysis.margin_map import log_pass_windows, format_pass_window
+
+    for log_dir in args.log_dirs:
+        print(log_dir)
+        for test, plots in log_pass_windows(log_dir).items():
+            for name, result in plots.items():
+                if args.sites or name == args.mode:
+                    print(f"  {test} {format_pass_window(name, result)}")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m shmooapp.cli", description="SHMOO log analysis")
+    parser.add_argument("--log-level", default=None, help="DEBUG, INFO, WARNING, ... (default SHMOO_LOG_LEVEL or INFO)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="split datalogs and analyze all tests")
+    run.add_argument("logs", nargs="+", help="datalog files")
+    run.add_argument("-o", "--output", help=f"output directory (default: a new workspace below {PLOTSDIR})")
+    run.add_argument("--sequential", action="store_true", help="split the whole log before analyzing")
+    run.add_argument("--workers", type=int, default=None, help="analysis threads of the overlapped run")
+    run.set_defaults(func=cmd_run)
+
+    ingest = commands.add_parser("ingest", help="analyze datalogs of a drop directory while they are written")
+    ingest.add_argument("--drop", default=INGESTDIR, help=f"drop directory (default {INGESTDIR})")
+    ingest.add_argument("-o", "--output", default=os.path.join(PLOTSDIR, INGEST_WORKSPACE), help="output directory")
+    ingest.add_argument("--interval", type=float, default=None, help="seconds between polls")
+    ingest.set_defaults(func=cmd_ingest)
+
+    export = commands.add_parser("export", help="export processed logs as a Parquet/Arrow dataset")
+    export.add_argument("log_dirs", nargs="+", help="processed log directories")
+    export.add_argument("-o", "--output", required=True, help="dataset root")
+    export.add_argument("--format", default="parquet", choices=("parquet", "arrow"))
+    export.add_argument("--compression", default="zstd")
+    export.set_defaults(func=cmd_export)
+
+    drift = commands.add_parser("drift", help="update the margin drift series of the archive and list shifts")
+    drift.add_argument("--archive", default=ARCHIVEDIR, help=f"archive root (default {ARCHIVEDIR})")
+    drift.add_argument("--fail-on-shift", action="store_true", help="exit with 1 when a shift is flagged")
+    drift.set_defaults(func=cmd_drift)
+
+    spec = commands.add_parser("spec", help="check spec points (vdd,x) on all site plots and aggregates")
+    spec.add_argument("log_dirs", nargs="*", help="processed log directories")
+    spec.add_argument("--archive", help="check every archived log below this root")
+    spec.add_argument("--point", action="append", default=[], help="spec point 'vdd,x', e.g. 0.9,60")
+    spec.add_argument("--points-file", help="file with one 'vdd,x' per line")
+    spec.add_argument("--csv", help="write the pass matrix to this CSV file")
+    spec.add_argument("--fail-on-violation", action="store_true", help="exit with 1 when a point fails")
+    spec.set_defaults(func=cmd_spec)
+
+    opcenter = commands.add_parser("opcenter", help="recommend op-centers from the margins of every cell")
+    opcenter.add_argument("log_dirs", nargs="+", help="processed log directories")
+    opcenter.add_argument("--mode", default="AND", help="aggregate to report (default AND)")
+    opcenter.add_argument("--sites", action="store_true", help="report every site plot as well")
+    opcenter.set_defaults(func=cmd_opcenter)
+
+    window = commands.add_parser("window", help="largest all-pass rectangle of every plot, next to its margins")
+    window.add_argument("log_dirs", nargs="+", help="processed log directories")
+    window.add_argument("--mode", default="AND", help="aggregate to report (default AND)")
+    window.add_argument("--sites", action="store_true", help="report every site plot as well")
+    window.set_defaults(func=cmd_window)
+
+    check = commands.add_parser("check-imports", help="measure the import time of the analysis core")
+    check.add_argument("--budget-ms", type=float, default=None,
+                       help=f"budget (default {IMPORT_BUDGET_ENV} or {CORE_IMPORT_BUDGET_MS})")
+    check.set_defaults(func=cmd_check_imports)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    from shmooapp.analysis.metrics import configure_logging
+    configure_logging(args.log_level)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,12 @@
 import reflex as rx
 
 from shmooapp.config import *
+from shmooapp.styles import *
 from shmooapp.states.filestate import FileState
 
+# height of a plot text frame, about 54 lines of the plot font
+PLOT_FRAME_HEIGHT = "760px"
+
 
 '''def render_subdirs() -> rx.Component:
     paths = FileState.subdirs
@@ -15,23 +19,22 @@ from shmooapp.states.filestate import FileState
     ])'''
 
 def show_plotfiles(filelist:str,colorname:str) -> rx.Component:
+    # the plot texts are loaded by the frames from the plot text endpoint
     if filelist == "subfile":
-        items = FileState.subfile_texts
+        items = FileState.subfile_text_urls
     elif filelist == "aggfile":
-        items = FileState.aggfile_texts
-    elif filelist == "xorfile":
-        items = FileState.xorfile_texts
+        items = FileState.aggfile_text_urls
     else:
-        item = []
+        items = FileState.xorfile_text_urls
     return rx.foreach(
         items,
-        lambda text:
+        lambda url:
             rx.box(
-                rx.text(
-                    text,
-                    size="1",
-                    white_space="pre-wrap",
-                    font_family="'MS Gothic', 'BIZ UDゴシック', monospace",
+                rx.el.iframe(
+                    src=url,
+                    width="100%",
+                    height=PLOT_FRAME_HEIGHT,
+                    style={"border": "none"},
                 ),
                 width="500px",
                 #background_color="var(--plum-3)",
@@ -41,6 +44,48 @@ def show_plotfiles(filelist:str,colorname:str) -> rx.Component:
             ),
     )
 
+def show_thumbnails(filelist:str) -> rx.Component:
+    if filelist == "subfile":
+        items = FileState.site_images
+    elif filelist == "aggfile":
+        items = FileState.agg_images
+    else:
+        items = FileState.xor_images
+    return rx.flex(
+        rx.foreach(
+            items,
+            lambda image: rx.link(
+                rx.image(
+                    src=image[0],
+                    width="164px",
+                    style={"image_rendering": "pixelated"},
+                ),
+                href=image[1],
+                is_external=True,
+            ),
+        ),
+        wrap="wrap",
+        spacing="2",
+    )
+
+def show_plots(filelist:str,colorname:str) -> rx.Component:
+    # heatmap thumbnails or the plot texts, switched by show_image_view_button
+    return rx.cond(
+        FileState.image_view,
+        show_thumbnails(filelist),
+        show_plotfiles(filelist,colorname),
+    )
+
+def show_image_view_button() -> rx.Component:
+    return rx.button(
+        rx.cond(
+            FileState.image_view,
+            "テキストで表示する",
+            "ヒートマップで表示する",
+        ),
+        on_click=FileState.toggle_image_view,
+    )
+
 def show_margins(colorname:str) -> rx.Component:
     return rx.foreach(
         FileState.margin_sets,
@@ -55,6 +100,42 @@ def show_margins(colorname:str) -> rx.Component:
             ),
     )
 
+def show_pass_windows(colorname:str) -> rx.Component:
+    return rx.foreach(
+        FileState.window_sets,
+        lambda window:
+            rx.box(
+                rx.text(window, size="1"),
+                width="500px",
+                background_color=f"var(--{colorname}-3)",
+                margin="5px",
+                boader="1px solid #ccc"
+            ),
+    )
+
+def show_anomalies(colorname:str) -> rx.Component:
+    return rx.foreach(
+        FileState.anomaly_sets,
+        lambda anomaly:
+            rx.box(
+                rx.text(anomaly),
+                width="500px",
+                background_color=f"var(--{colorname}-3)",
+                margin="5px",
+                boader="1px solid #ccc"
+            ),
+    )
+
+def show_anomaly_filter_button() -> rx.Component:
+    return rx.button(
+        rx.cond(
+            FileState.anomaly_filter,
+            "すべてのテストを表示する",
+            "異常(Hole/Island/Edge)のあるテストのみ表示する",
+        ),
+        on_click=FileState.toggle_anomaly_filter,
+    )
+
 def show_aggregation_labels(colorname:str) -> rx.Component:
     return rx.foreach(
         FileState.aggregation_sets,
@@ -66,4 +147,17 @@ def show_aggregation_labels(colorname:str) -> rx.Component:
                 margin="5px",
                 boader="1px solid #ccc",
             ),
-    )
\ No newline at end of file
+    )
+
+def show_job_status() -> rx.Component:
+    # queue position or state of the last submitted job, and a failed archive copy
+    return rx.hstack(
+        rx.cond(
+            FileState.job_status != "",
+            rx.badge(FileState.job_status, color_scheme="orange", size="2"),
+        ),
+        rx.cond(
+            FileState.archive_status != "",
+            rx.badge(FileState.archive_status, color_scheme="tomato", size="2"),
+        ),
+    )
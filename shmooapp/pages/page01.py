@@ -1,6 +1,7 @@
 import reflex as rx
 
 from shmooapp.config import *
+from shmooapp.styles import *
 from shmooapp.states.filestate import FileState
 from shmooapp.pages.common_func import *
 
@@ -32,9 +33,12 @@ def page01():
                     "ログファイルからテスト項目を取り出す",
                     on_click=FileState.run_process01_1,
                 ),
+                show_job_status(),
             ),
             rx.hstack(
                 rx.text("Step2 : ボタンをタップして各テストのPlotを表示する",size="5",color_scheme="indigo"),
+                show_anomaly_filter_button(),
+                show_image_view_button(),
             ),
             rx.vstack(
                 rx.foreach(
@@ -62,9 +66,16 @@ def page01():
                 rx.hstack(
                     show_margins("cyan"),
                 ),
+                rx.flex(
+                    show_pass_windows("cyan"),
+                ),
+                rx.text("Anomaly",size="4",color_scheme="indigo"),
+                rx.flex(
+                    show_anomalies("tomato"),
+                ),
                 rx.text("Plotファイル",size="4",color_scheme="indigo"),
                 rx.hstack(
-                    show_plotfiles("subfile","gray"),
+                    show_plots("subfile","gray"),
                 ),
                 margin_left = "10px"
             ),
@@ -99,7 +110,7 @@ def page01():
                     show_aggregation_labels("indigo"),
                 ),
                 rx.flex(
-                    show_plotfiles("aggfile","gray"),
+                    show_plots("aggfile","gray"),
                 ),
                 margin_left = "10px"
             ),
@@ -118,7 +129,7 @@ def page01():
                 rx.text(FileState.xordir),
                 rx.text("XORプロット",size="4",color_scheme="indigo"),
                 rx.flex(
-                    show_plotfiles("xorfile","violet"),
+                    show_plots("xorfile","violet"),
                 ),
                 margin_left = "10px",
             ),
@@ -1,6 +1,7 @@
 import reflex as rx
 
 from shmooapp.config import *
+from shmooapp.styles import *
 from shmooapp.states.filestate import FileState
 from shmooapp.pages.common_func import *
 
@@ -24,6 +25,11 @@ def page02():
         rx.divider(),
         rx.vstack(
             rx.text(f"選択されたログ: {FileState.pathstr}",size="5",color_scheme="indigo"),
+            rx.hstack(
+                show_anomaly_filter_button(),
+                show_image_view_button(),
+                show_job_status(),
+            ),
             rx.vstack(
                 rx.foreach(
                     FileState.subdirs,
@@ -45,14 +51,20 @@ def page02():
                     show_margins("cyan"),
                 ),
                 rx.flex(
-                    show_plotfiles("subfile","gray"),
+                    show_pass_windows("cyan"),
+                ),
+                rx.flex(
+                    show_anomalies("tomato"),
+                ),
+                rx.flex(
+                    show_plots("subfile","gray"),
                 ),
                 rx.text("Aggregated Plots",size="4",color_scheme="indigo"),
                 rx.flex(
                     show_aggregation_labels("indigo"),
                 ),
                 rx.flex(
-                    show_plotfiles("aggfile","gray"),
+                    show_plots("aggfile","gray"),
                 ),
             ),
         ),
@@ -72,7 +84,7 @@ def page02():
                 rx.text(FileState.xordir),
                 rx.text("XORプロット",size="4",color_scheme="indigo"),
                 rx.flex(
-                    show_plotfiles("xorfile","violet"),
+                    show_plots("xorfile","violet"),
                 ),
                 margin_left = "10px",
             ),
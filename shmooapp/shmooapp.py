@@ -4,9 +4,13 @@ import reflex as rx
 
 from rxconfig import config
 from shmooapp.config import *
-from shmooapp.states.filestate import FileState
+from shmooapp.styles import *
+from shmooapp.states.filestate import FileState, register_session_release
 from shmooapp.pages.page01 import page01
 from shmooapp.pages.page02 import page02
+from shmooapp.pages.common_func import show_job_status
+from shmooapp.api import register_api_routes
+from shmooapp.analysis.metrics import configure_logging
 
 
 def shmoo_main() -> rx.Component:
@@ -57,9 +61,12 @@ def shmoo_main() -> rx.Component:
         rx.hstack(
             rx.vstack(
                 rx.text("Step3 : すべてのPlotを生成する",size="5",color_scheme="indigo"),
-                rx.button(
-                    "すべてのSHMOOプロットを生成する！",
-                    on_click=FileState.run_all_and_archive,
+                rx.hstack(
+                    rx.button(
+                        "すべてのSHMOOプロットを生成する！",
+                        on_click=FileState.run_all_and_archive,
+                    ),
+                    show_job_status(),
                 ),
                 rx.text("生成したプロットを見る"),
                 rx.hstack(
@@ -99,6 +106,43 @@ def shmoo_main() -> rx.Component:
                 ),
             ),
             #rx.text(f"--> 選択されたテスト：{FileState.curdir}",size="4",color_scheme="gray"),
+            rx.hstack(
+                rx.text("アーカイブ間のマージンのドリフト",size="4",color_scheme="indigo"),
+                rx.button("ドリフトを更新する", on_click=FileState.update_drift_flags),
+            ),
+            rx.foreach(
+                FileState.drift_flags,
+                lambda flag: rx.text(flag, size="2", color_scheme="tomato"),
+            ),
+        ),
+        rx.divider(),
+        rx.vstack(
+            rx.text("Step5 : 測定中のログをライブで解析する",size="5",color_scheme="indigo"),
+            rx.text(f"監視フォルダ {INGESTDIR} に書き込まれているログを、テストごとに完了次第解析します。",color_scheme="indigo"),
+            rx.cond(
+                FileState.ingest_running,
+                rx.button("ライブ解析を停止する", on_click=FileState.stop_ingest, color_scheme="tomato"),
+                rx.button("ライブ解析を開始する", on_click=FileState.start_ingest),
+            ),
+            rx.foreach(
+                FileState.ingest_status,
+                lambda status: rx.text(status, size="2", color_scheme="gray"),
+            ),
+            rx.foreach(
+                FileState.ingest_logs,
+                lambda log: rx.link(
+                    rx.button(
+                        log,
+                        on_click=lambda log=log: FileState.set_ingest_log_for_view(log),
+                        color=color,
+                        style=button_style_child,
+                    ),
+                    href="/page02",
+                    is_external=False,
+                ),
+            ),
+            # follows a daemon started by another session or before a reload
+            on_mount=FileState.watch_ingest,
         ),
     )
 
@@ -133,7 +177,11 @@ def index() -> rx.Component:
     )
 
 
+configure_logging()
+
 app = rx.App()
+register_session_release(app)
 app.add_page(index)
 app.add_page(page01,route="/page01")
-app.add_page(page02,route="/page02")
\ No newline at end of file
+app.add_page(page02,route="/page02")
+register_api_routes(app)
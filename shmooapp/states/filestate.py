@@ -1,15 +1,35 @@
 import reflex as rx
+from reflex.state import _substate_key
 import os
 import shutil
+import asyncio
+import logging
 
-from shmooapp.config import PLOTSDIR, ARCHIVEDIR
-from shmooapp.analysis.common_utils import extract_logfilename_from_path,generate_arcdir,collect_archived_logs, generate_aggfile_name,create_yyyymmdd_today
-from shmooapp.analysis.create_shmooplot_files import extract_test_results
+from shmooapp.config import PLOTSDIR, ARCHIVEDIR, INGESTDIR, INGEST_WORKSPACE
+from shmooapp.analysis.common_utils import extract_logfilename_from_path,generate_arcdir,collect_archived_logs, generate_aggfile_name,create_yyyymmdd_today,merge_directory
 from shmooapp.analysis.fill_missing_vdd import update_files_for_vdd
 from shmooapp.analysis.update_shmoo_range import update_files_for_range
-from shmooapp.analysis.calculate_margin import calculate_files_for_margin
-from shmooapp.analysis.aggregated_shmoo import process_aggregation
-from shmooapp.analysis.xor_shmoo import process_xor
+from shmooapp.analysis.xor_shmoo import load_xor_sparse
+from shmooapp.analysis.result_cache import cached_margins, cached_aggregation, cached_xor, cached_anomalies
+from shmooapp.analysis.detect_anomaly import collect_anomalous_tests, format_anomaly_summary
+from shmooapp.analysis.profiling import stage
+from shmooapp.analysis.pipeline import extract_log, run_single_test, run_log_pipeline_overlapped
+from shmooapp.analysis.jobs import job_scheduler, create_workspace, discard_directory, prune_workspaces, PRIORITY_INTERACTIVE, PRIORITY_BATCH
+from shmooapp.analysis.plot_reader import list_dir_async
+from shmooapp.analysis.heatmap import render_test_images, list_test_images
+from shmooapp.analysis.drift import update_drift, format_drift_flag
+from shmooapp.analysis.margin_map import test_pass_windows, format_pass_window
+from shmooapp.analysis.ingest import start_ingest_daemon, stop_ingest_daemon, get_ingest_daemon, format_ingest_status
+from shmooapp.states.plot_store import plot_store
+from shmooapp.states.sessions import session_hooks, poll_while_connected
+from shmooapp.urls import image_url, plot_text_url
+
+logger = logging.getLogger(__name__)
+
+# seconds between queue position updates while waiting for a job
+JOB_POLL_INTERVAL = 0.5
+# seconds between refreshes of the watch-folder status
+INGEST_REFRESH_INTERVAL = 2.0
 
 
 class FileState(rx.State):
@@ -24,26 +44,84 @@ class FileState(rx.State):
     subdirs : list[str] = []
     curdir : str = ""
     subfiles: list[str] = []
-    subfile_texts : list[str] = []
-    margin_sets : list[list[float,float,float,float]] = []
+    # margins live in the shared plot store, the state keeps only the handle;
+    # plot texts are loaded by the page from the plot text endpoint
+    margin_sets_handle : str = ""
+    window_sets : list[str] = []
+    anomaly_sets : list[str] = []
     aggregation_sets : list[str] = []
+    anomaly_filter : bool = False
+    all_subdirs : list[str] = []
 
     # process02
     aggregation_file_or : str = ""
     aggregation_file_and : str = ""
     aggregation_file_mj : str = ""
-    aggfile_texts : list[str] = []
     xordir : str = ""
     xorfiles: list[str] = []
-    xorfile_texts : list[str] = []
+
+    # heatmaps: [thumbnail url, svg url] per plot
+    image_view : bool = False
+    site_images : list[list[str]] = []
+    agg_images : list[list[str]] = []
+    xor_images : list[list[str]] = []
+
+    # jobs: every log is processed in its own workspace below PLOTSDIR
+    workspace : str = ""
+    job_status : str = ""
+
+    # watch-folder ingestion; ingest_running follows the process-wide daemon
+    ingest_running : bool = False
+    ingest_watching : bool = False
+    ingest_status : list[str] = []
+    ingest_logs : list[str] = []
 
     # log hisotry
     archive_dir : str = ARCHIVEDIR
+    archive_status : str = ""
     archived_logs : list[str] = []
+    drift_flags : list[str] = []
 
     #def __init__(self):
     #    self.pathstr: str = ""
 
+    # Only the URLs of the plot texts are sent to the client, the frames load the texts
+    @rx.var(cache=True)
+    def subfile_text_urls(self) -> list[str]:
+        return [plot_text_url(os.path.join(self.curdir, file)) for file in self.subfiles]
+
+    @rx.var(cache=True)
+    def aggfile_text_urls(self) -> list[str]:
+        files = [self.aggregation_file_or, self.aggregation_file_and, self.aggregation_file_mj]
+        return [plot_text_url(file) for file in files if file]
+
+    @rx.var(cache=True)
+    def xorfile_text_urls(self) -> list[str]:
+        return [plot_text_url(self.xordir, site) for site in self.xorfiles]
+
+    # Margins are resolved from the store when rendered, and are only sent to the client
+    # when their handle changes. A handle this backend process does not know (another
+    # worker, a restart) is computed again from the site logs.
+    @rx.var(cache=True)
+    def margin_sets(self) -> list[list[float]]:
+        return plot_store.resolve(self.margin_sets_handle, lambda: cached_margins(self.curdir)) or []
+
+    def _set_plot_data(self, name: str, value: list):
+        # Takes a reference on the new value before dropping the old one,
+        # so re-setting the same content never evicts it
+        handle_name = f"{name}_handle"
+        old_handle = getattr(self, handle_name)
+        setattr(self, handle_name, plot_store.put(value) if value else "")
+        plot_store.release(old_handle)
+
+    def release_plot_data(self):
+        self._set_plot_data("margin_sets", [])
+
+    def reset(self, *args):
+        # the store references of the handles are dropped before the handles are reset
+        self.release_plot_data()
+        super().reset(*args)
+
     @rx.event
     async def handle_upload(self, files: list[rx.UploadFile]):
         # Extract and store the paths of the uploaded folders
@@ -51,7 +129,7 @@ class FileState(rx.State):
             upload_data = await file.read()
             outfile = rx.get_upload_dir() / file.filename
             self.pathstr = str(outfile)
-            print(f"{outfile}")
+            logger.info("Uploaded %s", outfile)
 
             # Save the file.
             with outfile.open("w",encoding="utf-8") as file_object:
@@ -76,70 +154,150 @@ class FileState(rx.State):
         self.curdir = ""
         self.subdirs = []
         self.subfiles = []
-        self.subfile_texts = []
-        self.margin_sets = []
+        self._set_plot_data("margin_sets", [])
+        self.anomaly_sets = []
+        self.anomaly_filter = False
+        self.all_subdirs = []
         self.aggregation_file_or = ""
         self.aggregation_file_and = ""
         self.aggregation_file_mj = ""
-        self.aggfile_texts = []
-        self.xordir = ""
-        self.xorfiles = []
-        self.xorfile_texts = []
+        self.clear_xor_vars()
+        self.workspace = ""
+        self.logbasedir = ""
+        self.job_status = ""
+        self.site_images = []
+        self.agg_images = []
+
+    # jobs
+    async def _wait_for_job(self, job):
+        # shows the queue position (or running state) until the job has finished
+        future = asyncio.wrap_future(job.future)
+        while True:
+            self.job_status = job_scheduler.describe(job)
+            yield
+            done, _ = await asyncio.wait([future], timeout=JOB_POLL_INTERVAL)
+            if done:
+                break
+        self.job_status = job_scheduler.describe(job)
 
-    # process 01
-    def run_process01_1(self):
-        #if not os.path.exists(PLOTSDIR):
-        #    os.makedirs(PLOTSDIR)
+    def _new_workspace(self):
         #outpath = os.path.join(PLOTSDIR,create_yyyymmdd_today())
-        outpath = PLOTSDIR
-        filepath = self.pathstr
-        self.subdirs = extract_test_results(filepath,outpath)
+        # The same log is processed again in the session's workspace, after its previous
+        # output is discarded. Another log gets a new workspace and the previous one is
+        # discarded; workspaces left by other sessions are pruned by age and count.
+        logbasedir = os.path.join(self.workspace, extract_logfilename_from_path(self.pathstr)) if self.workspace else ""
+        if logbasedir and logbasedir == self.logbasedir and os.path.isdir(self.workspace):
+            discard_directory(logbasedir)
+            return self.workspace
+        if self.workspace:
+            discard_directory(self.workspace)
+        self.workspace = create_workspace(PLOTSDIR)
+        self.logbasedir = os.path.join(self.workspace, extract_logfilename_from_path(self.pathstr))
+        prune_workspaces(PLOTSDIR, keep=(self.workspace,))
+        return self.workspace
+
+    # heatmaps
+    def _set_images(self, directory: str, xor_prefix: str = ""):
+        images = list_test_images(directory)
+
+        def urls(kind, group=""):
+            return [[image_url(i['thumb']), image_url(i['svg'])] for i in images
+                    if i['kind'] == kind and i['group'] == group]
+
+        self.site_images = urls("site")
+        self.agg_images = urls("aggregate")
+        self.xor_images = urls("xor", xor_prefix) if xor_prefix else []
+
+    async def _render_images(self, directory: str, xor_prefix: str = ""):
+        # renders missing or outdated images only, the rest comes from the thumbnail cache
+        job = job_scheduler.submit(render_test_images, directory, priority=PRIORITY_INTERACTIVE,
+                                   name=f"{os.path.basename(directory)} images")
+        async for _ in self._wait_for_job(job):
+            yield
+        self._set_images(directory, xor_prefix)
+
+    def toggle_image_view(self):
+        self.image_view = not self.image_view
 
-    def p01_read_plots(self, directory: str):
-        self.margin_sets = []
+    # process 01
+    async def run_process01_1(self):
+        filepath = self.pathstr
+        job = job_scheduler.submit(extract_log, filepath, self._new_workspace(),
+                                   priority=PRIORITY_BATCH, name=os.path.basename(filepath))
+        async for _ in self._wait_for_job(job):
+            yield
+        self.subdirs = job.future.result()
+
+    async def p01_read_plots(self, directory: str):
+        self._set_plot_data("margin_sets", [])
+        self.window_sets = []
         self.curdir = directory
-        self.subfiles = sorted(os.listdir(directory))
-        self.subfile_texts = []
-        for file in self.subfiles:
-            filepath = os.path.join(directory,file)
-            with open(filepath,encoding='UTF-8') as f:
-                text = f.read()
-            self.subfile_texts.append(text)
+        with stage("p01_read_plots", test=directory):
+            # list the plot files without blocking the event loop, the page loads their texts
+            self.subfiles = await list_dir_async(directory)
 
     def run_process01_2(self):
-        print(f"Proc01-2: {self.curdir}")
-        update_files_for_vdd(self.curdir)
+        logger.info("Proc01-2: %s", self.curdir)
+        with stage("run_process01_2", test=self.curdir):
+            update_files_for_vdd(self.curdir)
 
     def run_process01_3(self):
-        print(f"Proc01-3 : {self.curdir}")
-        update_files_for_range(self.curdir)
+        logger.info("Proc01-3: %s", self.curdir)
+        with stage("run_process01_3", test=self.curdir):
+            update_files_for_range(self.curdir)
 
     def run_process01_4(self):
-        print(f"Proc01-4 : {self.curdir}")
-        self.margin_sets = calculate_files_for_margin(self.curdir)
-
-    def run_process01_calc(self):
+        logger.info("Proc01-4: %s", self.curdir)
+        with stage("run_process01_4", test=self.curdir):
+            self._set_plot_data("margin_sets", cached_margins(self.curdir))
+        self.run_pass_windows()
+
+    def run_pass_windows(self):
+        # largest all-pass rectangle of each site plot and of the existing aggregates
+        with stage("run_pass_windows", test=self.curdir):
+            windows = test_pass_windows(self.curdir)
+        self.window_sets = [format_pass_window(name, result) for name, result in windows.items()]
+
+    def run_process02_3(self):
+        logger.info("Process02-3: %s", self.curdir)
+        with stage("run_process02_3", test=self.curdir):
+            result = cached_anomalies(self.curdir)
+        self.anomaly_sets = [format_anomaly_summary(r) for r in result['sites'] + result['aggregates']]
+
+    async def run_process01_calc(self):
         self.run_process01_2()
         self.run_process01_3()
-        self.p01_read_plots(self.curdir)
+        await self.p01_read_plots(self.curdir)
         self.run_process01_4()
 
     # process 02
     def run_process02_1(self):
-        print(f"Process02-1 : {self.curdir}")
-        self.aggregation_file_or = process_aggregation(self.curdir,"OR")
-        self.aggregation_file_and = process_aggregation(self.curdir,"AND")
-        self.aggregation_file_mj = process_aggregation(self.curdir,"Majority")
+        logger.info("Process02-1: %s", self.curdir)
+        with stage("run_process02_1", test=self.curdir):
+            self.aggregation_file_or = cached_aggregation(self.curdir,"OR")
+            self.aggregation_file_and = cached_aggregation(self.curdir,"AND")
+            self.aggregation_file_mj = cached_aggregation(self.curdir,"Majority")
         self.aggregation_sets = []
         self.aggregation_sets.append("OR")
         self.aggregation_sets.append("AND")
         self.aggregation_sets.append("MajorityVote")
+        self.clear_xor_vars()
 
-    def run_process02_2(self,mode:str):
-        print(f"Process02-2 : {self.curdir} with {mode}")
+    async def run_process02_2(self,mode:str):
+        logger.info("Process02-2: %s with %s", self.curdir, mode)
         file = self.select_aggregation_file(mode)
         prefix = f"{mode}_XOR" # AND, OR, MajorityVote
-        self.xordir = process_xor(self.curdir,file,prefix)
+        # computed on the first request of the mode, reused while the inputs are unchanged
+        job = job_scheduler.submit(cached_xor, self.curdir, file, prefix, priority=PRIORITY_INTERACTIVE,
+                                   name=f"{os.path.basename(self.curdir)} {prefix}")
+        async for _ in self._wait_for_job(job):
+            yield
+        self.xordir = job.future.result()
+
+    def clear_xor_vars(self):
+        self.xordir = ""
+        self.xorfiles = []
+        self.xor_images = []
 
     def select_aggregation_file(self,mode:str):
         if mode == "AND":
@@ -149,90 +307,212 @@ class FileState(rx.State):
         else: # Majority Vote
             return self.aggregation_file_mj
 
-    def p02_read_plots(self):
-        self.aggfile_texts = []
-        for filepath in [self.aggregation_file_or,self.aggregation_file_and,self.aggregation_file_mj]:
-            with open(filepath,encoding='UTF-8') as f:
-                text = f.read()
-            self.aggfile_texts.append(text)
-
-    def p02_read_plots_xor(self):
-        self.xorfile_texts = []
-        self.xorfiles = sorted(os.listdir(self.xordir))
-        #for file in self.subfiles:
-        for file in self.xorfiles:
-            filepath = os.path.join(self.xordir,file)
-            with open(filepath,encoding='UTF-8') as f:
-                text = f.read()
-            self.xorfile_texts.append(text)
-
-    def run_process02_1_calc(self):
-        self.run_process02_1()
-        self.p02_read_plots()
+    async def p02_read_plots_xor(self):
+        with stage("p02_read_plots_xor", test=self.curdir):
+            # xordir is the sparse XOR file, the plot text endpoint renders its sites
+            sparse = await asyncio.to_thread(load_xor_sparse, self.xordir)
+            self.xorfiles = sorted(sparse['sites'])
+
+    async def run_process02_1_calc(self):
+        with stage("run_process02_1_calc", test=self.curdir):
+            self.run_process02_1()
+            self.run_process02_3()
     
-    def run_process02_2_calc(self,mode:str):
-        self.run_process02_2(mode)
-        self.p02_read_plots_xor()
+    async def run_process02_2_calc(self,mode:str):
+        async for _ in self.run_process02_2(mode):
+            yield
+        await self.p02_read_plots_xor()
+        async for _ in self._render_images(self.curdir, f"{mode}_XOR"):
+            yield
 
     # automation
-    def run_each_test(self,directory:str):
-        self.p01_read_plots(directory)
-        self.run_process01_calc()
-        self.run_process02_1_calc()
-        for agg in self.aggregation_sets:
-            self.run_process02_2_calc(agg)
-
-    def run_all_tests(self):
-        self.run_process01_1()
-        for test in self.subdirs:
-            self.p01_read_plots(test)
-            self.run_process01_calc()
-            self.run_process02_1_calc()
-            for agg in self.aggregation_sets:
-                self.run_process02_2_calc(agg)
+    async def run_each_test(self,directory:str):
+        # interactive view of a single test, queued before full-lot runs
+        job = job_scheduler.submit(run_single_test, directory, priority=PRIORITY_INTERACTIVE,
+                                   name=os.path.basename(directory))
+        async for _ in self._wait_for_job(job):
+            yield
+        result = job.future.result()
+        await self.p01_read_plots(directory)
+        self._set_plot_data("margin_sets", result['margins'])
+        self.aggregation_file_or = result['aggregates']["OR"]
+        self.aggregation_file_and = result['aggregates']["AND"]
+        self.aggregation_file_mj = result['aggregates']["Majority"]
+        self.aggregation_sets = ["OR", "AND", "MajorityVote"]
+        self.clear_xor_vars()
+        anomalies = result['anomalies']
+        self.anomaly_sets = [format_anomaly_summary(r) for r in anomalies['sites'] + anomalies['aggregates']]
+        self.run_pass_windows()
+        self._set_images(directory)
+
+    async def run_all_tests(self):
+        # tests are analyzed while the log is still being split;
+        # profile report is saved into <workspace>/<log> when SHMOO_PROFILE=1
+        filepath = self.pathstr
+        job = job_scheduler.submit(run_log_pipeline_overlapped, filepath, self._new_workspace(),
+                                   priority=PRIORITY_BATCH, name=os.path.basename(filepath))
+        async for _ in self._wait_for_job(job):
+            yield
+        self.subdirs = job.future.result()
     
     # archive log plots dir
     def run_archive(self):
         filepath = self.pathstr
         filename = extract_logfilename_from_path(filepath)
-        plotsdir = os.path.join(PLOTSDIR, filename)
+        plotsdir = self.logbasedir or os.path.join(PLOTSDIR, filename)
         arcdir = generate_arcdir(ARCHIVEDIR,filename)
         self.archive_dir = arcdir
-        print(f" {filepath} : {filename} -> {plotsdir}, copy to {arcdir}")
+        logger.info("%s: %s -> %s, copy to %s", filepath, filename, plotsdir, arcdir)
 
         # Ensure the source directory exists
         if not os.path.exists(plotsdir):
             raise FileNotFoundError(f"Source directory '{plotsdir}' does not exist.")
         
-        # Copy logbasedir to arcdir
+        # Copy logbasedir to a temporary directory first and merge it into the archive of
+        # the day file by file, so that readers and other jobs archiving the same log never
+        # see a partially copied file
+        tmpdir = f"{arcdir}.tmp-{os.path.basename(self.workspace) or os.getpid()}"
         try:
-            shutil.copytree(plotsdir, arcdir, dirs_exist_ok=True)
-            print(f"Successfully copied '{plotsdir}' to '{arcdir}'.")
+            shutil.copytree(plotsdir, tmpdir, dirs_exist_ok=True)
+            merge_directory(tmpdir, arcdir)
+            # a new stamp makes the drift series read the archive again
+            os.utime(arcdir)
+            logger.info("Copied %s to %s", plotsdir, arcdir)
+            self.archive_status = ""
+            return True
         except Exception as e:
-            print(f"Error copying directory: {e}")
+            logger.exception("Error copying %s to %s", plotsdir, arcdir)
+            self.archive_status = f"アーカイブに失敗しました: {e}"
+            return False
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
 
     def get_archived_log(self):
         self.archived_logs = []
         self.archived_logs = collect_archived_logs(ARCHIVEDIR)
         for dir in sorted(self.archived_logs,reverse=True):
-            print(f"{dir}")
+            logger.debug("Archived log %s", dir)
 
     def set_archived_log_for_view(self,directory):
         self.pathstr = directory
         self.subdirs = collect_archived_logs(directory)
     
-    def set_plots_vars(self,directory:str):
+    async def set_plots_vars(self,directory:str):
         self.curdir = directory
-        self.margin_sets = calculate_files_for_margin(self.curdir)
+        self._set_plot_data("margin_sets", cached_margins(self.curdir))
         self.aggregation_file_or = generate_aggfile_name(self.curdir,"OR")
         self.aggregation_file_and = generate_aggfile_name(self.curdir,"AND")
         self.aggregation_file_mj = generate_aggfile_name(self.curdir,"Majority")
-        self.p01_read_plots(directory)
-        self.p02_read_plots()
+        await self.p01_read_plots(directory)
+        self.run_process02_3()
+        self.run_pass_windows()
+        self.clear_xor_vars()
+        async for _ in self._render_images(directory):
+            yield
+
+    # show only the tests having holes, islands or non-monotonic edges; the severities
+    # computed by the pipeline are reused, tests not scored yet are scored in a job
+    async def toggle_anomaly_filter(self):
+        if self.anomaly_filter:
+            self.subdirs = self.all_subdirs
+            self.anomaly_filter = False
+            return
+        job = job_scheduler.submit(collect_anomalous_tests, list(self.subdirs), detect=cached_anomalies,
+                                   priority=PRIORITY_INTERACTIVE, name="anomaly filter")
+        async for _ in self._wait_for_job(job):
+            yield
+        self.all_subdirs = self.subdirs
+        self.subdirs = job.future.result()
+        self.anomaly_filter = True
+
+    # watch-folder ingestion: tests of the logs in INGESTDIR are analyzed while the logs grow
+    def start_ingest(self):
+        start_ingest_daemon(INGESTDIR, os.path.join(PLOTSDIR, INGEST_WORKSPACE))
+        self.ingest_running = True
+        return FileState.watch_ingest
+
+    def stop_ingest(self):
+        stop_ingest_daemon()
+        self.ingest_running = False
+
+    @rx.event(background=True)
+    async def watch_ingest(self):
+        # the daemon polls the logs once for the process, every session only copies
+        # its published snapshot; ends when the daemon stops or the session disconnects
+        async with self:
+            if self.ingest_watching:
+                return
+            self.ingest_watching = True
+            token = self.router.session.client_token
+        revision = None
+
+        async def step():
+            nonlocal revision
+            daemon = get_ingest_daemon()
+            running = daemon is not None and daemon.is_running()
+            published = daemon.published() if daemon is not None else (None, [])
+            async with self:
+                if not self.ingest_watching:
+                    return False
+                self.ingest_running = running
+                if published[0] != revision:
+                    revision, logs = published
+                    self.ingest_status = [format_ingest_status(log) for log in logs]
+                    self.ingest_logs = [log['log_dir'] for log in logs]
+            return running
+
+        await poll_while_connected(token, step, INGEST_REFRESH_INTERVAL)
+        async with self:
+            self.ingest_watching = False
+
+    def set_ingest_log_for_view(self, directory):
+        # only the tests analyzed so far, the current test is still being written
+        self.pathstr = directory
+        daemon = get_ingest_daemon()
+        logs = daemon.snapshot() if daemon is not None else []
+        self.subdirs = next((sorted(log['tests']) for log in logs if log['log_dir'] == directory), [])
+
+    # margin drift across the archived runs; only runs archived since the last update are read
+    async def update_drift_flags(self):
+        job = job_scheduler.submit(update_drift, ARCHIVEDIR, priority=PRIORITY_BATCH, name="drift")
+        async for _ in self._wait_for_job(job):
+            yield
+        self.drift_flags = [format_drift_flag(f) for f in job.future.result().flags()]
 
     # automation
-    def run_all_and_archive(self):
-        self.run_all_tests()
-        self.run_archive()
+    async def run_all_and_archive(self):
+        async for _ in self.run_all_tests():
+            yield
+        if not self.run_archive():
+            return
         self.get_archived_log()
-
+        async for _ in self.update_drift_flags():
+            yield
+
+
+def register_session_release(app):
+    """
+    Releases the plot store references of a session when its socket disconnects;
+    its watch_ingest loop ends by itself (see sessions.py).
+    The socket namespace exists once the backend runs, so the hook is set up at startup.
+    """
+    def release_on_disconnect(token):
+        asyncio.get_running_loop().create_task(_release_session(app, token))
+
+    def hook_disconnect():
+        if app.event_namespace is None:
+            logger.warning("No socket namespace, sessions are released by the plot store's idle sweep only")
+            return
+        session_hooks.install(app.event_namespace)
+        logger.info("Session release hook installed")
+
+    session_hooks.on_disconnect(release_on_disconnect)
+    app.register_lifespan_task(hook_disconnect)
+
+async def _release_session(app, token):
+    try:
+        async with app.state_manager.modify_state(_substate_key(token, FileState)) as root:
+            state = await root.get_state(FileState)
+            state.release_plot_data()
+    except Exception:
+        logger.exception("Releasing the plot data of session %s failed", token)
@@ -0,0 +1,130 @@
+import json
+import time
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Margins are kept once per backend process, not once per session. FileState only
+# holds handles (content hashes), so sessions viewing the same test share a single copy,
+# and state deltas carry a short key until the value changes. Plot texts are not kept
+# here at all: the pages load them from the plot text endpoint.
+#
+# The store is local to its process. A handle that another backend worker created, or
+# that survived a restart in the state manager, is resolved by loading the value again
+# from disk (resolve). Sessions release their handles when they are reset or their
+# socket disconnects; unreferenced entries are dropped after PLOT_STORE_TTL seconds,
+# and PLOT_STORE_MAX_IDLE covers references that are never released.
+PLOT_STORE_TTL = 600
+PLOT_STORE_MAX_IDLE = 4 * 3600
+
+
+class PlotStoreEntry:
+    def __init__(self, value, now):
+        self.value = value
+        self.refcount = 0
+        self.last_access = now
+
+
+class PlotStore:
+    """
+    Reference-counted store of plot data with TTL eviction, shared by all sessions.
+    """
+    def __init__(self, ttl=PLOT_STORE_TTL, max_idle=PLOT_STORE_MAX_IDLE, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_idle = max_idle
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = {}   # handle -> PlotStoreEntry
+
+    @staticmethod
+    def make_handle(value):
+        return hashlib.sha1(json.dumps(value, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+    def put(self, value):
+        """
+        Stores value (JSON-serializable) and takes a reference on it.
+
+        Returns:
+            str: Handle of the value; equal values share a handle.
+        """
+        handle = self.make_handle(value)
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(handle)
+            if entry is None:
+                entry = PlotStoreEntry(value, now)
+                self._entries[handle] = entry
+            entry.refcount += 1
+            entry.last_access = now
+            self._evict_expired(now)
+        return handle
+
+    def get(self, handle, default=None):
+        if not handle:
+            return default
+        with self._lock:
+            entry = self._entries.get(handle)
+            if entry is None:
+                return default
+            entry.last_access = self._clock()
+            return entry.value
+
+    def resolve(self, handle, load):
+        """
+        Returns the value of a handle, loading it again with load() if this process does
+        not have it. The loaded value is kept under the handle, referenced by the caller.
+        """
+        if not handle:
+            return None
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(handle)
+            if entry is not None:
+                entry.last_access = now
+                return entry.value
+        logger.warning("Plot store handle %s is not in this process, loading it again", handle)
+        value = load()
+        with self._lock:
+            entry = self._entries.get(handle)
+            if entry is None:
+                entry = PlotStoreEntry(value, now)
+                self._entries[handle] = entry
+            entry.refcount += 1
+            entry.last_access = now
+            return entry.value
+
+    def release(self, handle):
+        """
+        Drops a reference taken by put. The entry is evicted once it stays unreferenced for ttl.
+        """
+        if not handle:
+            return
+        with self._lock:
+            entry = self._entries.get(handle)
+            if entry is not None and entry.refcount > 0:
+                entry.refcount -= 1
+                entry.last_access = self._clock()
+
+    def evict_expired(self):
+        with self._lock:
+            return self._evict_expired(self._clock())
+
+    def _evict_expired(self, now):
+        expired = [
+            handle for handle, entry in self._entries.items()
+            if now - entry.last_access > (self.ttl if entry.refcount == 0 else self.max_idle)
+        ]
+        for handle in expired:
+            del self._entries[handle]
+        if expired:
+            logger.debug("Evicted %d plot store entries", len(expired))
+        return len(expired)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+plot_store = PlotStore()
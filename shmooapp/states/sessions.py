@@ -0,0 +1,69 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Sessions connected to this backend process, as seen by the socket namespace of the
+# app: a client token is connected while the namespace maps it to a socket. The
+# disconnect handler of the namespace is wrapped so that what a session holds in the
+# process (plot store references) is released when its socket goes, and background
+# loops of a session (poll_while_connected) end instead of running for a closed tab.
+
+
+class SessionHooks:
+    def __init__(self):
+        self.namespace = None
+        self._on_disconnect = []
+
+    def install(self, namespace):
+        """
+        Wraps the disconnect handler of the socket namespace (once the backend runs).
+        """
+        if self.namespace is namespace:
+            return
+        self.namespace = namespace
+        original = namespace.on_disconnect
+
+        def on_disconnect(sid, *args):
+            token = namespace.sid_to_token.get(sid)
+            result = original(sid, *args)
+            if token:
+                for callback in self._on_disconnect:
+                    try:
+                        callback(token)
+                    except Exception:
+                        logger.exception("Disconnect callback for session %s failed", token)
+            return result
+
+        namespace.on_disconnect = on_disconnect
+
+    def on_disconnect(self, callback):
+        """
+        Registers callback(token), called when the socket of a session disconnects.
+        """
+        self._on_disconnect.append(callback)
+
+    def is_connected(self, token):
+        # before the namespace exists (no backend, e.g. in scripts) every session counts as connected
+        return self.namespace is None or token in self.namespace.token_to_sid
+
+
+session_hooks = SessionHooks()
+
+
+async def poll_while_connected(token, step, interval, hooks=session_hooks):
+    """
+    Runs the background loop of a session: awaits step() every interval seconds until
+    it returns False or the session disconnects.
+
+    Args:
+        token (str): Client token of the session.
+        step (callable): Coroutine function returning whether to go on.
+        interval (float): Seconds between steps.
+        hooks (SessionHooks): Tells which sessions are connected.
+    """
+    while hooks.is_connected(token):
+        if not await step():
+            return
+        await asyncio.sleep(interval)
+    logger.debug("Session %s disconnected, its background loop ends", token)
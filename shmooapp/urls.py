@@ -0,0 +1,27 @@
+"""URLs of the files served by the API routes of shmooapp.api, for states and pages."""
+
+import os
+from urllib.parse import quote, urlencode
+
+import reflex as rx
+
+from shmooapp.analysis.plot_reader import plot_version
+
+IMAGES_ROUTE = "/images"
+PLOTS_ROUTE = "/plots"
+
+
+def image_url(path):
+    """
+    URL of a rendered image served by image_endpoint.
+    """
+    return f"{rx.config.get_config().api_url}{IMAGES_ROUTE}/{quote(os.path.relpath(path))}"
+
+
+def plot_text_url(path, site=None):
+    """
+    URL of a plot text served by plot_text_endpoint; site selects an XOR site of a sparse file.
+    """
+    # the version makes the frame load the text again after the plot was rewritten
+    query = {'v': plot_version(path), 'site': site} if site else {'v': plot_version(path)}
+    return f"{rx.config.get_config().api_url}{PLOTS_ROUTE}/{quote(os.path.relpath(path))}?{urlencode(query)}"
@@ -0,0 +1,66 @@
+import asyncio
+
+from shmooapp.states.sessions import SessionHooks, poll_while_connected
+
+
+class FakeNamespace:
+    # the parts of reflex's EventNamespace that SessionHooks uses
+    def __init__(self):
+        self.sid_to_token = {}
+        self.token_to_sid = {}
+
+    def connect(self, sid, token):
+        self.sid_to_token[sid] = token
+        self.token_to_sid[token] = sid
+
+    def on_disconnect(self, sid):
+        token = self.sid_to_token.pop(sid, None)
+        if token:
+            self.token_to_sid.pop(token, None)
+
+
+def test_disconnect_runs_callbacks():
+    namespace = FakeNamespace()
+    hooks = SessionHooks()
+    released = []
+    hooks.on_disconnect(released.append)
+    hooks.install(namespace)
+    namespace.connect("sid1", "token1")
+    assert hooks.is_connected("token1")
+
+    namespace.on_disconnect("sid1")
+
+    assert released == ["token1"]
+    assert not hooks.is_connected("token1")
+
+
+def test_loop_ends_on_disconnect():
+    namespace = FakeNamespace()
+    hooks = SessionHooks()
+    hooks.install(namespace)
+    namespace.connect("sid1", "token1")
+    steps = []
+
+    async def step():
+        steps.append(len(steps))
+        if len(steps) == 3:
+            namespace.on_disconnect("sid1")
+        return True
+
+    asyncio.run(asyncio.wait_for(poll_while_connected("token1", step, 0, hooks), timeout=5))
+    assert len(steps) == 3
+
+
+def test_loop_ends_when_step_stops():
+    namespace = FakeNamespace()
+    hooks = SessionHooks()
+    hooks.install(namespace)
+    namespace.connect("sid1", "token1")
+    steps = []
+
+    async def step():
+        steps.append(len(steps))
+        return len(steps) < 2
+
+    asyncio.run(asyncio.wait_for(poll_while_connected("token1", step, 0, hooks), timeout=5))
+    assert len(steps) == 2
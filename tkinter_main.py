@@ -1,18 +1,34 @@
 import os
+import queue
+import threading
 import tkinter as tk
-from tkinter import filedialog, scrolledtext
+from tkinter import filedialog, scrolledtext, ttk
 import tkinter.font as tkfont
 from shmooapp.analysis.create_shmooplot_files import extract_test_results
 from shmooapp.analysis.fill_missing_vdd import update_files_for_vdd
 from shmooapp.analysis.update_shmoo_range import update_files_for_range
-from shmooapp.analysis.calculate_margin import calculate_files_for_margin
-from shmooapp.analysis.aggregated_shmoo import process_aggregation
-from shmooapp.analysis.xor_shmoo import process_xor
-from shmooapp.analysis.common_utils import create_yyyymmdd_today
+from shmooapp.analysis.xor_shmoo import load_xor_sparse, render_xor_site, xor_test_dir
+from shmooapp.analysis.result_cache import cached_margins, cached_aggregation, cached_xor
+from shmooapp.analysis.common_utils import create_yyyymmdd_today, extract_logfilename_from_path
+from shmooapp.analysis.profiling import start_run, finish_run, stage
+from shmooapp.analysis.metrics import configure_logging
+from shmooapp.analysis.plot_reader import read_text
+from shmooapp.analysis.heatmap import render_test_images
 
 PLOTSDIR = "out.plot"
 ARCHIVEDIR = "out.archive"
 
+# Plot slots of the virtualized view: 60x70 characters of Courier 6 plus label and scrollbar
+PLOT_COLUMNS = 60
+PLOT_LINES = 70
+PLOT_LABEL_HEIGHT = 26
+PLOT_SCROLLBAR_WIDTH = 18
+PLOT_PADDING = 5
+# slots kept alive beyond the visible area on each side, for smooth scrolling
+PLOT_OVERSCAN = 1
+# interval at which the Tk main loop picks up progress events of the worker thread
+PROGRESS_POLL_MS = 100
+
 def select_file():
     # Open file dialog with filter for text files
     file_path = filedialog.askopenfilename(
@@ -26,7 +42,7 @@ def select_file():
             with open(file_path, "r", encoding="utf-8") as file:
                 content = file.read()
             #display_output(content)
-            run_all_tests(file_path)
+            start_all_tests(file_path)
         except Exception as e:
             display_output(f"Error reading file: {e}")
 
@@ -35,149 +51,412 @@ def destroy_widgets(widgets):
         widget.destroy()
 
 def destroy_all_widgets():
+    # the test buttons go too, the worker rewrites their directories
+    destroy_widgets(subdirs_frame.winfo_children())
     destroy_widgets(subdir_buttons_frame.winfo_children())
-    destroy_widgets(output_frame_inner1.winfo_children())
-    destroy_widgets(output_frame_inner2.winfo_children())
+    plot_view.clear()
 
-def run_all_tests(filepath):
+def run_all_tests(filepath, events, cancel):
+    """
+    Worker thread body: splits the log and processes every test. Nothing here
+    touches Tk; progress is reported through the events queue and picked up by
+    poll_worker_events on the main thread.
+
+    Args:
+        filepath (str): Path to the datalog.
+        events (queue.Queue): Receives ("start", count), ("test", index, count, test),
+            ("done", subdirs, cancelled) or ("error", message).
+        cancel (threading.Event): Checked between sections while splitting and between tests.
+    """
     if not os.path.exists(PLOTSDIR):
         os.makedirs(PLOTSDIR)
     plotpath = os.path.join(PLOTSDIR,create_yyyymmdd_today())
-    subdirs = extract_test_results(filepath,plotpath)
-    for test in subdirs:
-        update_files_for_vdd(test)
-        #update_files_for_range(test)
-        margin_sets = calculate_files_for_margin(test)
-        plot_texts = read_plots(test)
-        aggregation_file_or = process_aggregation(test,"OR")
-        aggregation_file_and = process_aggregation(test,"AND")
-        aggregation_file_mj = process_aggregation(test,"Majority")
-        agg_texts = read_plots_agg(aggregation_file_or, aggregation_file_and, aggregation_file_mj)
-        xordir_or = process_xor(test,aggregation_file_or,"OR_XOR")
-        xordir_and = process_xor(test,aggregation_file_and,"AND_XOR")
-        xordir_mj = process_xor(test,aggregation_file_mj,"MajorityVote_XOR")
-        xor_or_texts = read_plots_xor(xordir_or)
-        xor_and_texts = read_plots_xor(xordir_and)
-        xor_mj_texts = read_plots_xor(xordir_mj)
+    # profile report is saved into <plotpath>/<log> when SHMOO_PROFILE=1
+    filename = extract_logfilename_from_path(filepath)
+    start_run(filename)
+    try:
+        with stage("extract_test_results", log=filepath):
+            subdirs = extract_test_results(filepath,plotpath,cancel)
+        events.put(("start", len(subdirs)))
+        done = []
+        for i, test in enumerate(subdirs):
+            if cancel.is_set():
+                break
+            events.put(("test", i, len(subdirs), test))
+            with stage("test", test=test):
+                with stage("update_files_for_vdd", test=test):
+                    update_files_for_vdd(test)
+                #update_files_for_range(test)
+                with stage("calculate_files_for_margin", test=test):
+                    margin_sets = cached_margins(test)
+                with stage("process_aggregation", test=test):
+                    cached_aggregation(test,"OR")
+                    cached_aggregation(test,"AND")
+                    cached_aggregation(test,"Majority")
+                # plot texts are read when they scroll into view, XOR is computed
+                # lazily when a mode button is pressed
+            done.append(test)
+        events.put(("done", done, cancel.is_set()))
+    except Exception as e:
+        events.put(("error", f"Error processing {filepath}: {e}"))
+    finally:
+        finish_run(os.path.join(plotpath, filename))
+
+def start_all_tests(filepath):
+    """
+    Runs run_all_tests on a worker thread so that the window keeps responding.
+    """
+    events = queue.Queue()
+    cancel = threading.Event()
+    cancel_button.configure(state=tk.NORMAL, command=lambda: cancel_all_tests(cancel))
+    select_button.configure(state=tk.DISABLED)
+    progress_bar.configure(value=0, maximum=1)
+    progress_label.configure(text="ログを分割しています...")
+    threading.Thread(target=run_all_tests, args=(filepath, events, cancel),
+                     name="run_all_tests", daemon=True).start()
+    root.after(PROGRESS_POLL_MS, poll_worker_events, events)
+
+def cancel_all_tests(cancel):
+    # the worker stops after the section or test in progress
+    cancel.set()
+    cancel_button.configure(state=tk.DISABLED)
+    progress_label.configure(text="キャンセルしています...")
+
+def poll_worker_events(events):
+    """
+    Applies the progress events of the worker thread to the widgets, on the main thread.
+    """
+    while True:
+        try:
+            event = events.get_nowait()
+        except queue.Empty:
+            break
+        kind = event[0]
+        if kind == "start":
+            progress_bar.configure(maximum=max(1, event[1]))
+        elif kind == "test":
+            _, index, count, test = event
+            progress_bar.configure(value=index)
+            progress_label.configure(text=f"{index+1}/{count}: {os.path.basename(test)}")
+        else:
+            finish_all_tests(event)
+            return
+    root.after(PROGRESS_POLL_MS, poll_worker_events, events)
+
+def finish_all_tests(event):
+    cancel_button.configure(state=tk.DISABLED)
+    select_button.configure(state=tk.NORMAL)
+    if event[0] == "error":
+        progress_label.configure(text="エラー")
+        display_output(event[1])
+        return
+    _, subdirs, cancelled = event
+    progress_bar.configure(value=len(subdirs))
     display_subdirs(subdirs)
-    display_output(f"Found {len(subdirs)} Tests.")
-
-def read_plots(directory: str):
-    subfiles = sorted(os.listdir(directory))
-    subfile_texts = []
-    for file in subfiles:
-        filepath = os.path.join(directory,file)
-        with open(filepath,encoding='UTF-8') as f:
-            text = f.read()
-        subfile_texts.append(text)
-    return subfile_texts
-
-def read_plots_agg(or_file,and_file,mj_file):
-    aggfile_texts = []
-    for filepath in [or_file,and_file,mj_file]:
-        with open(filepath,encoding='UTF-8') as f:
-            text = f.read()
-        aggfile_texts.append(text)
-    return aggfile_texts
-
-def read_plots_xor(xordir):
-    xorfile_texts = []
-    xorfiles = sorted(os.listdir(xordir))
-    for file in xorfiles:
-        filepath = os.path.join(xordir,file)
-        with open(filepath,encoding='UTF-8') as f:
-            text = f.read()
-        xorfile_texts.append(text)
-    return xorfile_texts
+    if cancelled:
+        progress_label.configure(text=f"キャンセル: {len(subdirs)}件処理済み")
+        display_output(f"Cancelled after {len(subdirs)} Tests.")
+    else:
+        progress_label.configure(text=f"完了: {len(subdirs)}件")
+        display_output(f"Found {len(subdirs)} Tests.")
+
+def test_heatmaps(subdir):
+    """
+    Renders the heatmaps of a test that are missing or older than their plots.
+
+    Returns:
+        dict: (absolute plot path, XOR site or None) -> PNG path.
+    """
+    return {(os.path.abspath(task[1]), task[2]): result['png']
+            for task, result in render_test_images(subdir) if result}
+
+def plot_items(paths, labels, heatmaps=None):
+    """
+    (label, loader, png) items of the plot view; the texts are read, through the
+    shared text cache, when the plot scrolls into view.
+    """
+    heatmaps = heatmaps or {}
+    return [(label, lambda path=path: read_text(path), heatmaps.get((os.path.abspath(path), None)))
+            for label, path in zip(labels, paths)]
+
+def xor_plot_items(xorfile, title, heatmaps=None):
+    # xorfile is the sparse XOR file, a site plot is rendered from it when it becomes visible
+    heatmaps = heatmaps or {}
+    sparse = load_xor_sparse(xorfile)
+    test_dir = xor_test_dir(xorfile)
+    return [
+        (f"{title} compared: XOR {i+1}", lambda site=site: render_xor_site(sparse, site, test_dir),
+         heatmaps.get((os.path.abspath(xorfile), site)))
+        for i, site in enumerate(sorted(sparse['sites']))
+    ]
 
 def display_output(text):
     output_text.delete("1.0", tk.END)
     output_text.insert(tk.END, text)
 
-def display_plots(texts,output_frame_inner,strcolor=None):
+
+class VirtualPlotView:
     """
-    Display multiple texts in the output_frame arranged horizontally.
+    Scrollable view of rows of plots that creates widgets only for the visible plots.
+
+    Every plot occupies a fixed-size slot, so the scroll region is known without
+    creating widgets. On scroll or resize the slots in view (plus PLOT_OVERSCAN on each
+    side) get a Label and a read-only Text from a pool of reusable widgets, and the plot
+    text is loaded when its slot first becomes visible and kept while the row is shown.
+    In image mode the slots show the heatmap PNG of a plot instead of its text.
     """
-    custom_font = tkfont.Font(family="Courier", size=6)
-    if not strcolor:
-        strcolor = "navy"
+    def __init__(self, container, rows=2):
+        self.font = tkfont.Font(family="Courier", size=6)
+        self.slot_width = (PLOT_COLUMNS * self.font.measure("0") + PLOT_SCROLLBAR_WIDTH
+                           + 2 * PLOT_PADDING)
+        self.slot_height = (PLOT_LINES * self.font.metrics("linespace") + PLOT_LABEL_HEIGHT
+                            + 2 * PLOT_PADDING)
+        self.rows = [{'items': [], 'texts': {}, 'images': {}, 'color': "navy"} for _ in range(rows)]
+        self.image_mode = False
+        self._shown = {}      # (row, index) -> slot
+        self._pool = []       # hidden slots for reuse
+        self._refresh_pending = False
+
+        self.canvas = tk.Canvas(container, borderwidth=0, bg="lightblue")
+        scrollbar_y = tk.Scrollbar(container, orient=tk.VERTICAL, command=self.canvas.yview)
+        scrollbar_x = tk.Scrollbar(container, orient=tk.HORIZONTAL, command=self.canvas.xview)
+        scrollbar_x.pack(side=tk.BOTTOM, fill=tk.X)
+        scrollbar_y.pack(side=tk.RIGHT, fill=tk.Y)
+        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        # the scroll commands report every view change, which is when slots need refreshing
+        def on_xview(first, last):
+            scrollbar_x.set(first, last)
+            self._schedule_refresh()
+
+        def on_yview(first, last):
+            scrollbar_y.set(first, last)
+            self._schedule_refresh()
+
+        self.canvas.configure(xscrollcommand=on_xview, yscrollcommand=on_yview)
+        self.canvas.bind("<Configure>", lambda event: self._schedule_refresh())
+
+    def set_row(self, row, items, color=None):
+        """
+        Replaces the plots of a row.
+
+        Args:
+            row (int): Row index.
+            items (list): (label, loader, png) tuples; loader() returns the plot text,
+                png is the heatmap path or None.
+            color (str): Label color.
+        """
+        for key in [key for key in self._shown if key[0] == row]:
+            self._hide(key)
+        self.rows[row] = {'items': list(items), 'texts': {}, 'images': {}, 'color': color or "navy"}
+        self._update_scrollregion()
+        self._schedule_refresh()
+
+    def clear(self):
+        for row in range(len(self.rows)):
+            self.set_row(row, [])
+
+    def set_image_mode(self, on):
+        """
+        Switches the slots between plot texts and heatmaps.
+        """
+        self.image_mode = on
+        for key in list(self._shown):
+            self._hide(key)
+        self._schedule_refresh()
+
+    def _update_scrollregion(self):
+        columns = max((len(r['items']) for r in self.rows), default=0)
+        self.canvas.configure(scrollregion=(0, 0, columns * self.slot_width,
+                                            len(self.rows) * self.slot_height))
+
+    def _schedule_refresh(self):
+        # several scroll events per frame are coalesced into one refresh
+        if not self._refresh_pending:
+            self._refresh_pending = True
+            self.canvas.after_idle(self._refresh)
+
+    def _visible_keys(self):
+        x0 = self.canvas.canvasx(0)
+        x1 = self.canvas.canvasx(self.canvas.winfo_width())
+        y0 = self.canvas.canvasy(0)
+        y1 = self.canvas.canvasy(self.canvas.winfo_height())
+        first = max(0, int(x0 // self.slot_width) - PLOT_OVERSCAN)
+        last = int(x1 // self.slot_width) + PLOT_OVERSCAN
+        keys = set()
+        for row, r in enumerate(self.rows):
+            top = row * self.slot_height
+            if top + self.slot_height < y0 or top > y1:
+                continue
+            keys.update((row, index) for index in range(first, min(last + 1, len(r['items']))))
+        return keys
+
+    def _refresh(self):
+        self._refresh_pending = False
+        visible = self._visible_keys()
+        for key in [key for key in self._shown if key not in visible]:
+            self._hide(key)
+        for key in sorted(visible - self._shown.keys()):
+            self._show(key)
+
+    def _show(self, key):
+        row, index = key
+        r = self.rows[row]
+        label, loader, png = r['items'][index]
+        slot = self._pool.pop() if self._pool else self._create_slot()
+        slot['label'].configure(text=f"{label}", fg=r['color'])
+        photo = self._load_image(r, index, png) if self.image_mode and png else None
+        if photo is not None:
+            slot['text'].pack_forget()
+            slot['image'].configure(image=photo)
+            slot['image'].pack(fill=tk.BOTH, expand=True)
+        else:
+            if index not in r['texts']:
+                try:
+                    r['texts'][index] = loader()
+                except (OSError, ValueError, KeyError) as e:
+                    r['texts'][index] = f"Error reading plot: {e}"
+            slot['image'].pack_forget()
+            slot['image'].configure(image="")
+            text = slot['text']
+            text.configure(state='normal')
+            text.delete("1.0", tk.END)
+            text.insert(tk.END, r['texts'][index])
+            text.configure(state='disabled')  # Make it read-only
+            text.pack(fill=tk.BOTH, expand=True)
+        self.canvas.coords(slot['window'], index * self.slot_width + PLOT_PADDING,
+                           row * self.slot_height + PLOT_PADDING)
+        self.canvas.itemconfigure(slot['window'], state='normal')
+        self._shown[key] = slot
+
+    def _load_image(self, r, index, png):
+        # the PhotoImage is kept in the row, Tk drops images that lose their last reference
+        if index not in r['images']:
+            try:
+                photo = tk.PhotoImage(file=png)
+            except tk.TclError:
+                r['images'][index] = None
+            else:
+                # subsampled to fit the slot, which is sized for the plot text
+                factor = max(1, -(-photo.width() // (self.slot_width - 2 * PLOT_PADDING)),
+                             -(-photo.height() // (self.slot_height - 2 * PLOT_PADDING - PLOT_LABEL_HEIGHT)))
+                r['images'][index] = photo.subsample(factor) if factor > 1 else photo
+        return r['images'][index]
+
+    def _hide(self, key):
+        slot = self._shown.pop(key)
+        self.canvas.itemconfigure(slot['window'], state='hidden')
+        self._pool.append(slot)
+
+    def _create_slot(self):
+        frame = tk.Frame(self.canvas)
+        label = tk.Label(frame, anchor='w', font=("Helvetica", 12, "bold"))
+        label.pack(fill=tk.X)
+        st = scrolledtext.ScrolledText(frame, width=PLOT_COLUMNS, height=PLOT_LINES, font=self.font)
+        st.pack(fill=tk.BOTH, expand=True)
+        image = tk.Label(frame, anchor='nw', bg="white")
+        window = self.canvas.create_window(
+            0, 0, window=frame, anchor='nw', state='hidden',
+            width=self.slot_width - 2 * PLOT_PADDING, height=self.slot_height - 2 * PLOT_PADDING,
+        )
+        return {'window': window, 'label': label, 'text': st, 'image': image}
 
-    # Clear the output_frame before inserting new texts
-    for widget in output_frame_inner.winfo_children():
-        widget.destroy()
 
-    # Create a ScrolledText widget for each text and pack it horizontally
-    for (label, text) in texts:
-        frame = tk.Frame(output_frame_inner)
-        frame.pack(side=tk.LEFT, padx=5, pady=5, fill=tk.BOTH, expand=False)
+def display_plots(items,row,strcolor=None):
+    """
+    Display plots in a row of the plot view arranged horizontally.
+
+    Args:
+        items (list): (label, loader, png) tuples, see plot_items.
+        row (int): 0 for the upper, 1 for the lower row.
+    """
+    plot_view.set_row(row, items, strcolor)
 
-        # Optional: Add a label to identify each text block
-        label = tk.Label(frame, text=f"{label}", anchor='w', font=("Helvetica", 12, "bold"), fg=strcolor)
-        label.pack(fill=tk.X)
+def run_in_worker(work, done, error_text):
+    """
+    Runs work() on a worker thread and done(result) on the main thread, polled with
+    after() like the events of run_all_tests.
+    """
+    events = queue.Queue()
+    def target():
+        try:
+            events.put(("done", work()))
+        except Exception as e:
+            events.put(("error", e))
+    threading.Thread(target=target, name="plot_worker", daemon=True).start()
+    root.after(PROGRESS_POLL_MS, poll_worker_result, events, done, error_text)
 
-        st = scrolledtext.ScrolledText(frame, width=60, height=70, font=custom_font)
-        st.pack(fill=tk.BOTH, expand=True)
-        st.insert(tk.END, text)
-        st.configure(state='disabled')  # Make it read-only if desired
+def poll_worker_result(events, done, error_text):
+    try:
+        kind, value = events.get_nowait()
+    except queue.Empty:
+        root.after(PROGRESS_POLL_MS, poll_worker_result, events, done, error_text)
+        return
+    if kind == "error":
+        display_output(f"{error_text}: {value}")
+    else:
+        done(value)
+
+def load_test_plots(subdir):
+    # worker thread: results of run_all_tests (or of an earlier click) are reused from the shared cache
+    aggfiles = [cached_aggregation(subdir, mode) for mode in ("OR", "AND", "Majority")]
+    return aggfiles, plot_items(aggfiles, ["OR", "AND", "Majority"], test_heatmaps(subdir))
+
+def load_xor_plots(subdir, aggfile, prefix, title):
+    # worker thread: the XOR heatmaps are rendered once the sparse file exists
+    xorfile = cached_xor(subdir, aggfile, prefix)
+    return xor_plot_items(xorfile, title, test_heatmaps(subdir))
+
+# test whose plots are shown; results of a worker for another test are dropped
+selected_test = None
 
 def on_subdir_button_click(subdir):
     """
     Callback function when a subdirectory button is clicked.
     """
-    # Example action: Display the selected subdirectory
+    global selected_test
+    selected_test = subdir
     display_output(f"Selected Test: {subdir}")
-    
-    # TODO: Add more functionality as needed
-    # For example, open the subdirectory, process files, etc.
-    try:
-        # Example logic to get multiple file contents
-        plot_texts = read_plots(subdir)
-        aggregation_file_or = process_aggregation(subdir, "OR")
-        aggregation_file_and = process_aggregation(subdir, "AND")
-        aggregation_file_mj = process_aggregation(subdir, "Majority")
-        agg_texts = read_plots_agg(aggregation_file_or, aggregation_file_and, aggregation_file_mj)
-        xordir_or = process_xor(subdir, aggregation_file_or, "OR_XOR")
-        xordir_and = process_xor(subdir, aggregation_file_and, "AND_XOR")
-        xordir_mj = process_xor(subdir, aggregation_file_mj, "MajorityVote_XOR")
-        xor_or_texts = read_plots_xor(xordir_or)
-        xor_and_texts = read_plots_xor(xordir_and)
-        xor_mj_texts = read_plots_xor(xordir_mj)
-        
-        agg_items = ["OR", "AND", "Majority"]
-        agg_texts_with_labels = [(agg_items[i], text) for i, text in enumerate(agg_texts)]
-
-        xor_or_texts_with_labels = [
-            (f"OR compared: XOR {i+1}", text) for i, text in enumerate(xor_or_texts)
-        ]
-        xor_and_texts_with_labels = [
-            (f"AND compared: XOR {i+1}", text) for i, text in enumerate(xor_and_texts)
-        ]
-        xor_mj_texts_with_labels = [
-            (f"Mojority Vote compared: XOR {i+1}", text) for i, text in enumerate(xor_mj_texts)
-        ]
-        
-        display_plots(agg_texts_with_labels,output_frame_inner1,"blue")
-    except Exception as e:
-        display_output([f"Error processing Test {subdir}: {e}"])
-
     # Clear any existing buttons in subdir_buttons_frame
-    destroy_widgets(output_frame_inner2.winfo_children())
     destroy_widgets(subdir_buttons_frame.winfo_children())
+    display_plots([],0)
+    display_plots([],1)
+    run_in_worker(lambda: load_test_plots(subdir),
+                  lambda result: show_test_plots(subdir, *result),
+                  f"Error processing Test {subdir}")
+
+def show_test_plots(subdir, aggfiles, agg_plot_items):
+    if subdir != selected_test:
+        return
+    aggregation_file_or, aggregation_file_and, aggregation_file_mj = aggfiles
+    display_plots(agg_plot_items,0,"blue")
+
+    # XOR of a mode is computed on its first button press and kept for this test
+    xor_plot_items_by_prefix = {}
+    def show_xor(aggfile, prefix, title):
+        def show(items):
+            xor_plot_items_by_prefix[prefix] = items
+            if subdir == selected_test:
+                display_plots(items,0)
+                display_plots(agg_plot_items,1,"blue")
+        if prefix in xor_plot_items_by_prefix:
+            show(xor_plot_items_by_prefix[prefix])
+        else:
+            run_in_worker(lambda: load_xor_plots(subdir, aggfile, prefix, title), show,
+                          f"Error processing {title} XOR of {subdir}")
+
     # Define button callbacks
     def handle_or():
         display_output(f"OR button clicked for {subdir}")
-        display_plots(xor_or_texts_with_labels,output_frame_inner1)
-        display_plots(agg_texts_with_labels,output_frame_inner2,"blue")
+        show_xor(aggregation_file_or, "OR_XOR", "OR")
 
     def handle_and():
         display_output(f"AND button clicked for {subdir}")
-        display_plots(xor_and_texts_with_labels,output_frame_inner1)
-        display_plots(agg_texts_with_labels,output_frame_inner2,"blue")
+        show_xor(aggregation_file_and, "AND_XOR", "AND")
 
     def handle_majority():
         display_output(f"Majority button clicked for {subdir}")
-        display_plots(xor_mj_texts_with_labels,output_frame_inner1)
-        display_plots(agg_texts_with_labels,output_frame_inner2,"blue")
+        show_xor(aggregation_file_mj, "MajorityVote_XOR", "Mojority Vote")
 
     # Create the three buttons
     or_button = tk.Button(subdir_buttons_frame, text="OR", command=handle_or)
@@ -207,6 +486,8 @@ def display_subdirs(subdirs):
         )
         btn.pack(pady=2)
 
+configure_logging()
+
 # Set up the main window
 root = tk.Tk()
 root.title("SHMOO Plots Viewer")
@@ -220,6 +501,16 @@ select_button.pack(pady=10)
 input_file_label = tk.Label(root, text="No file selected")
 input_file_label.pack(pady=5)
 
+# Progress of the run on the worker thread, with per-test status and a cancel button
+progress_frame = tk.Frame(root)
+progress_frame.pack(pady=5)
+progress_bar = ttk.Progressbar(progress_frame, orient=tk.HORIZONTAL, length=400, mode='determinate')
+progress_bar.pack(side=tk.LEFT, padx=5)
+progress_label = tk.Label(progress_frame, text="", width=50, anchor='w')
+progress_label.pack(side=tk.LEFT, padx=5)
+cancel_button = tk.Button(progress_frame, text="Cancel", state=tk.DISABLED)
+cancel_button.pack(side=tk.LEFT, padx=5)
+
 # ScrolledText widget to display file content
 output_text = scrolledtext.ScrolledText(root, width=120, height=1, fg="blue")
 output_text.pack(pady=10)
@@ -240,42 +531,18 @@ subdir_buttons_label.pack(pady=5)
 subdir_buttons_frame = tk.Frame(root, height="100")
 subdir_buttons_frame.pack(pady=5)
 
+# Shows the heatmaps of the plots instead of their texts
+heatmap_mode = tk.BooleanVar(value=False)
+heatmap_check = tk.Checkbutton(root, text="Heatmap", variable=heatmap_mode,
+                               command=lambda: plot_view.set_image_mode(heatmap_mode.get()))
+heatmap_check.pack(pady=5)
+
 # Create a container frame for output with horizontal scrollbar
 output_container = tk.Frame(root,bg="navy")
 output_container.pack(pady=10, fill=tk.BOTH, expand=True)
 
-# Create a Canvas inside the container
-output_canvas = tk.Canvas(output_container, borderwidth=0,bg="lightblue")
-
-# Create vertical scrollbar linked to the Canvas
-output_scrollbar_y = tk.Scrollbar(output_container, orient=tk.VERTICAL, command=output_canvas.yview)
-
-# Create a horizontal scrollbar linked to the Canvas
-output_scrollbar_x = tk.Scrollbar(output_container, orient=tk.HORIZONTAL, command=output_canvas.xview)
-
-output_scrollbar_x.pack(side=tk.BOTTOM, fill=tk.X)
-output_scrollbar_y.pack(side=tk.RIGHT, fill=tk.Y)
-output_canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-
-output_canvas.configure(yscrollcommand=output_scrollbar_y.set, xscrollcommand=output_scrollbar_x.set)
-
-# Create a parent frame inside the Canvas to hold both plot frames
-parent_frame = tk.Frame(output_canvas)
-output_canvas.create_window((0, 0), window=parent_frame, anchor='nw')
-
-# Create and pack the first inner frame for the first set of plots
-output_frame_inner1 = tk.Frame(parent_frame)
-output_frame_inner1.pack(side=tk.TOP, padx=5, pady=5, fill=tk.BOTH, expand=True)
-
-# Create and pack the second inner frame for the second set of plots
-output_frame_inner2 = tk.Frame(parent_frame)
-output_frame_inner2.pack(side=tk.TOP, padx=5, pady=5, fill=tk.BOTH, expand=True)
-
-# Update scrollregion when the output_frame_inner changes size
-def on_parent_frame_configure(event):
-    output_canvas.configure(scrollregion=output_canvas.bbox("all"))
-
-parent_frame.bind("<Configure>", on_parent_frame_configure)
+# Two rows of plots (XOR / aggregates); widgets exist only for the plots in view
+plot_view = VirtualPlotView(output_container, rows=2)
 
 
 root.mainloop()